@@ -0,0 +1 @@
+"""Benchmarks do processamento de vídeo e dos endpoints HTTP (ver run.py)."""
@@ -0,0 +1,172 @@
+"""
+Conferência e medição dos backends de filtros (VIDEO_FILTER_BACKEND).
+
+Uso (na raiz do projeto):
+    python -m benchmarks.filter_backends            # confere e mede todos os tamanhos
+    python -m benchmarks.filter_backends --quick    # só os tamanhos pequenos
+    python -m benchmarks.filter_backends --output backends.json
+
+Cada cadeia de filtros é aplicada aos mesmos frames sintéticos pelo
+FilteredWriterSink, pelos mesmos métodos que o pipeline com threads usa:
+prepare()/write() no backend 'frame' (a referência) e
+prepare_batch()/write_batch() nos backends 'batch' e 'umat' (sobre cv2.UMat).
+Os frames gravados são recolhidos por um gravador falso, sem codificação.
+As saídas precisam ser idênticas bit a bit; o script sai
+com código 1 se alguma diferir. Com um dispositivo OpenCL, as implementações
+em OpenCL do OpenCV podem arredondar de outro jeito, e as diferenças do 'umat'
+aparecem aqui antes de o backend ser ativado em produção.
+O throughput é medido com o OpenCV em uma única thread (frames/s por núcleo),
+com as cadeias já montadas.
+"""
+import sys
+import json
+import time
+import argparse
+import platform
+
+import cv2
+import numpy as np
+
+from . import synth
+
+# (largura, altura) dos frames conferidos; inclui dimensões ímpares e acima da largura máxima dos perfis
+SIZES = [(320, 180), (641, 361), (1280, 720), (1600, 900)]
+QUICK_SIZES = [(320, 180), (641, 361)]
+# Cadeias conferidas além de cada filtro com os parâmetros padrão
+CHAINS = [
+    'resize:width=320|pixelize:size=8',
+    'pixelize:size=7|grayscale',
+    'grayscale|edges:low=50,high=150',
+    'resize:width=4000',
+]
+# Largura máxima aplicada antes da cadeia (None, ou a do perfil padrão)
+MAX_WIDTHS = (None, 1280)
+# Frames por conferência: não é múltiplo do lote, para incluir um lote incompleto
+FRAME_COUNT = 19
+
+
+class _CollectWriter:
+    """Gravador falso: guarda cópias dos frames recebidos (com `keep`) em vez de codificá-los."""
+
+    def __init__(self):
+        self.keep = False
+        self.frames = []
+
+    def isOpened(self):
+        return True
+
+    def write(self, frame):
+        if self.keep:
+            self.frames.append(frame.copy())
+
+    def release(self):
+        pass
+
+
+def _backend(spec, max_width, name):
+    """
+    Função que filtra uma lista de frames por um FilteredWriterSink com o backend
+    `name` e retorna os frames gravados (com `keep=True`).
+    """
+    from servidor import filters, video_processor
+    sink = video_processor.FilteredWriterSink(None, spec)
+    # Mesmo estado de open(), sem abrir um gravador de verdade nem depender de VIDEO_FILTER_BACKEND
+    sink.backend = name
+    sink.batch_size = filters.FILTER_BATCH_SIZE if name != 'frame' else 1
+    sink.max_width = max_width
+    sink.fps = sink.out_fps = 25.0
+    sink.out = writer = _CollectWriter()
+
+    def run(frames, keep=False):
+        writer.keep, writer.frames = keep, []
+        if sink.batch_size > 1:
+            for start in range(0, len(frames), sink.batch_size):
+                indices = list(range(start, min(start + sink.batch_size, len(frames))))
+                sink.write_batch(sink.prepare_batch(indices, frames[start:start + sink.batch_size]))
+        else:
+            for index, frame in enumerate(frames):
+                sink.write(index, sink.prepare(index, frame))
+        return writer.frames
+    return run
+
+
+def _fps(func, frames, min_seconds):
+    """Frames/s de `func(frames)`, repetindo até somar `min_seconds`."""
+    func(frames)  # aquecimento (alocação dos buffers)
+    runs, started = 0, time.perf_counter()
+    while True:
+        func(frames)
+        runs += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds:
+            return round(runs * len(frames) / elapsed, 1)
+
+
+def run(sizes, min_seconds):
+    """Confere e mede todas as combinações; retorna a lista de resultados."""
+    from servidor import filters
+    specs = [item['name'] for item in filters.list_filters()] + CHAINS
+    results = []
+    for width, height in sizes:
+        frames = list(synth.frames(width, height, FRAME_COUNT))
+        for spec in specs:
+            for max_width in MAX_WIDTHS:
+                reference = _backend(spec, max_width, 'frame')
+                expected = reference(frames, keep=True)
+                result = {
+                    'size': f'{width}x{height}',
+                    'chain': spec,
+                    'max_width': max_width,
+                    'fps': {'frame': _fps(reference, frames, min_seconds)},
+                    'mismatches': {},
+                }
+                for name in ('batch', 'umat'):
+                    backend = _backend(spec, max_width, name)
+                    produced = backend(frames, keep=True)
+                    diff = max(int(np.abs(a.astype(np.int16) - b).max()) if a.shape == b.shape else 255
+                               for a, b in zip(expected, produced))
+                    if len(produced) != len(expected) or diff:
+                        result['mismatches'][name] = diff
+                    result['fps'][name] = _fps(backend, frames, min_seconds)
+                results.append(result)
+                fps = '  '.join(f"{name} {value:8.1f}" for name, value in result['fps'].items())
+                status = 'DIFERENTE ' + str(result['mismatches']) if result['mismatches'] else 'idêntico'
+                print(f"{result['size']:>9}  {spec:34}  max_width={str(max_width):4}  {fps}  {status}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Confere e mede os backends de filtros (frame, batch, umat).')
+    parser.add_argument('--quick', action='store_true', help='apenas os tamanhos pequenos')
+    parser.add_argument('--seconds', type=float, default=0.5, help='tempo mínimo de medição por caso (s)')
+    parser.add_argument('--output', help='arquivo JSON do relatório')
+    args = parser.parse_args(argv)
+
+    # Throughput por núcleo: o OpenCV não paraleliza internamente cada chamada
+    cv2.setNumThreads(1)
+    print(f"OpenCV {cv2.__version__}, OpenCL disponível: {cv2.ocl.haveOpenCL()}")
+    results = run(QUICK_SIZES if args.quick else SIZES, args.seconds)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'environment': {
+                    'python': platform.python_version(),
+                    'opencv': cv2.__version__,
+                    'opencl': cv2.ocl.haveOpenCL(),
+                    'platform': platform.platform(),
+                },
+                'results': results,
+            }, f, indent=2)
+        print(f"Relatório gravado em {args.output}")
+
+    mismatched = [r for r in results if r['mismatches']]
+    if mismatched:
+        print(f"{len(mismatched)} caso(s) com saída diferente da referência (backend 'frame').")
+        return 1
+    print(f"Todos os {len(results)} casos são idênticos à referência.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,326 @@
+"""
+Benchmarks do pipeline de processamento e dos endpoints HTTP.
+
+Uso (na raiz do projeto):
+    python -m benchmarks.run                          # todos os casos, resultado em benchmarks/results.json
+    python -m benchmarks.run --quick                  # só o vídeo pequeno, menos repetições
+    python -m benchmarks.run --only filter,http       # casos cujo nome começa com os prefixos
+    python -m benchmarks.run --save-baseline base.json
+    python -m benchmarks.run --baseline base.json     # compara e sai com código 1 se houver regressão
+
+Cada caso roda em um processo novo, para que o pico de memória (RSS) medido
+seja apenas o dele. O relatório é um JSON com frames/s, MB/s, p50/p99 (ms) e
+pico de RSS (MB) por caso.
+"""
+import os
+import sys
+import io
+import json
+import time
+import shutil
+import argparse
+import contextlib
+import platform
+import tempfile
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from . import synth
+
+RESULTS_PATH = os.path.join(os.path.dirname(__file__), 'results.json')
+# Regressão tolerada na comparação com o baseline (fração)
+DEFAULT_TOLERANCE = 0.15
+# Métricas em que valores maiores são melhores; nas demais, menores são melhores
+HIGHER_IS_BETTER = ('fps', 'mb_s')
+# Registros fictícios inseridos antes de medir GET /videos
+SEED_VIDEOS = 500
+
+
+def _percentile(samples, q):
+    """Percentil `q` (0-100) com interpolação linear entre as amostras."""
+    ordered = sorted(samples)
+    if len(ordered) == 1:
+        return ordered[0]
+    pos = (len(ordered) - 1) * q / 100
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+
+def _peak_rss_mb():
+    """Pico de memória residente deste processo em MB (None onde `resource` não existe, ex.: Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss é em KB no Linux e em bytes no macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _timed(func, repeat):
+    """Executa `func` `repeat` vezes e retorna as durações (s)."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+# --- Casos ---
+# Cada caso recebe (vídeo, diretório de trabalho, repetições) e retorna
+# {'samples': [s], 'frames': frames por execução, 'bytes': bytes por execução}.
+
+def case_metadata(video_path, work_dir, repeat):
+    from servidor import video_processor
+    samples = _timed(lambda: video_processor.get_video_metadata(video_path), repeat * 10)
+    return {'samples': samples, 'frames': 0, 'bytes': 0}
+
+
+def case_filter(video_path, work_dir, repeat, filter_name):
+    from servidor import video_processor
+    output_path = os.path.join(work_dir, f'{filter_name}.webm')
+    frames = video_processor.get_video_metadata(video_path)['frame_count']
+    samples = _timed(lambda: video_processor.apply_filter(video_path, output_path, filter_name), repeat)
+    return {'samples': samples, 'frames': frames, 'bytes': os.path.getsize(video_path)}
+
+
+def case_preview_gif(video_path, work_dir, repeat):
+    from servidor import video_processor
+    output_path = os.path.join(work_dir, 'preview.gif')
+    # A primeira chamada monta o índice de keyframes; as medidas refletem o uso em regime
+    video_processor.generate_preview_gif(video_path, output_path)
+    samples = _timed(lambda: video_processor.generate_preview_gif(video_path, output_path), repeat)
+    return {'samples': samples, 'frames': 30, 'bytes': 0}
+
+
+def _test_client(work_dir):
+    """Aplicação Flask com banco e mídia isolados no diretório de trabalho."""
+    from servidor import database as db
+    from servidor import storage
+    from servidor import admission
+    db.DATABASE_PATH = os.path.join(work_dir, 'videos.db')
+    storage.MEDIA_ROOT = os.path.join(work_dir, 'media')
+    # Todas as requisições vêm do mesmo cliente: os limites de uso distorceriam as medidas
+    admission.ENABLED = False
+    from servidor.app import create_app
+    return create_app().test_client()
+
+
+def case_http_upload(video_path, work_dir, repeat):
+    client = _test_client(work_dir)
+    with open(video_path, 'rb') as f:
+        data = f.read()
+    name = os.path.basename(video_path)
+
+    def upload():
+        response = client.post('/upload', data={'video': (io.BytesIO(data), name), 'filter': 'grayscale'},
+                               content_type='multipart/form-data')
+        assert response.status_code == 202, response.data
+
+    samples = _timed(upload, repeat * 5)
+    return {'samples': samples, 'frames': 0, 'bytes': len(data)}
+
+
+def _seed_videos(video_path, count):
+    """Insere `count` registros de vídeo fictícios apontando para o arquivo informado."""
+    from servidor import database as db
+    from servidor import storage
+    from servidor import utils
+    rel_path = 'bench/' + os.path.basename(video_path)
+    os.makedirs(os.path.join(storage.MEDIA_ROOT, 'bench'), exist_ok=True)
+    shutil.copy(video_path, os.path.join(storage.MEDIA_ROOT, rel_path))
+    for i in range(count):
+        db.add_video_record({
+            'id': utils.generate_uuid(), 'original_name': f'video{i}', 'original_ext': 'mp4',
+            'size_bytes': os.path.getsize(video_path), 'duration_sec': 10.0, 'fps': 25.0,
+            'width': 640, 'height': 360, 'filter': 'grayscale', 'created_at': utils.get_current_timestamp(),
+            'path_original': rel_path, 'path_processed': rel_path,
+        })
+    db.flush_writes()
+    return rel_path
+
+
+def case_http_videos(video_path, work_dir, repeat):
+    client = _test_client(work_dir)
+    _seed_videos(video_path, SEED_VIDEOS)
+
+    def listing():
+        response = client.get('/videos?limit=50')
+        assert response.status_code == 200, response.data
+
+    samples = _timed(listing, repeat * 20)
+    return {'samples': samples, 'frames': 0, 'bytes': 0}
+
+
+def case_http_media(video_path, work_dir, repeat):
+    client = _test_client(work_dir)
+    rel_path = _seed_videos(video_path, 1)
+    size = os.path.getsize(video_path)
+
+    def download():
+        response = client.get(f'/media/{rel_path}')
+        assert response.status_code == 200 and len(response.get_data()) == size
+        response = client.get(f'/media/{rel_path}', headers={'Range': 'bytes=0-65535'})
+        assert response.status_code == 206
+
+    samples = _timed(download, repeat * 10)
+    return {'samples': samples, 'frames': 0, 'bytes': size}
+
+
+def build_cases(videos):
+    """Lista [(nome do caso, função, argumentos extras, caminho do vídeo)]."""
+    from servidor import filters
+    cases = []
+    for name, path in videos.items():
+        cases.append((f'metadata/{name}', case_metadata, (), path))
+        for item in filters.list_filters():
+            cases.append((f"filter/{item['name']}/{name}", case_filter, (item['name'],), path))
+        cases.append((f'preview_gif/{name}', case_preview_gif, (), path))
+    # Os endpoints são medidos com o menor vídeo (o custo do processamento já está nos casos acima)
+    smallest = min(videos.values(), key=os.path.getsize)
+    for endpoint, func in (('upload', case_http_upload), ('videos', case_http_videos), ('media', case_http_media)):
+        cases.append((f'http/{endpoint}', func, (), smallest))
+    return cases
+
+
+def _run_case(func, video_path, repeat, extra):
+    """Executado no processo filho: roda o caso em um diretório temporário e resume as medidas."""
+    work_dir = tempfile.mkdtemp(prefix='bench-')
+    try:
+        # As mensagens do servidor (migrações, progresso) não entram no relatório
+        with contextlib.redirect_stdout(io.StringIO()):
+            raw = func(video_path, work_dir, repeat, *extra)
+    finally:
+        from servidor import database as db
+        db.flush_writes()
+        db.close_db_connection()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    samples = raw['samples']
+    p50 = _percentile(samples, 50)
+    result = {
+        'iterations': len(samples),
+        'p50_ms': round(p50 * 1000, 3),
+        'p99_ms': round(_percentile(samples, 99) * 1000, 3),
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+    if raw['frames']:
+        result['fps'] = round(raw['frames'] / p50, 2)
+    if raw['bytes']:
+        result['mb_s'] = round(raw['bytes'] / (1024 * 1024) / p50, 2)
+    return result
+
+
+def run(cases, repeat):
+    results = {}
+    spawn = get_context('spawn')
+    for name, func, extra, video_path in cases:
+        with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+            try:
+                result = executor.submit(_run_case, func, video_path, repeat, extra).result()
+            except Exception as e:
+                print(f"{name:40s} FALHOU: {e}")
+                results[name] = {'error': str(e)}
+                continue
+        results[name] = result
+        print(f"{name:40s} p50 {result['p50_ms']:9.2f} ms  p99 {result['p99_ms']:9.2f} ms"
+              f"{'  %8.1f fps' % result['fps'] if 'fps' in result else ''}"
+              f"{'  %8.1f MB/s' % result['mb_s'] if 'mb_s' in result else ''}")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compara os resultados com um baseline salvo. Retorna a lista de regressões
+    (caso, métrica, baseline, atual) que ultrapassam a tolerância.
+    """
+    regressions = []
+    for name, base in baseline['results'].items():
+        current = results.get(name)
+        if current is None or 'error' in base:
+            continue
+        if 'error' in current:
+            regressions.append((name, 'error', None, current['error']))
+            continue
+        for metric in ('fps', 'mb_s', 'p50_ms', 'p99_ms', 'peak_rss_mb'):
+            old, new = base.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            if metric in HIGHER_IS_BETTER:
+                worse = new < old * (1 - tolerance)
+            else:
+                worse = new > old * (1 + tolerance)
+            if worse:
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks do processamento de vídeo e dos endpoints HTTP.')
+    parser.add_argument('--quick', action='store_true', help='apenas o vídeo pequeno e menos repetições')
+    parser.add_argument('--videos', help=f"vídeos sintéticos separados por vírgula ({', '.join(synth.VIDEOS)})")
+    parser.add_argument('--only', help='prefixos dos casos separados por vírgula (ex.: filter,http)')
+    parser.add_argument('--repeat', type=int, help='repetições por caso (padrão: 3, ou 1 com --quick)')
+    parser.add_argument('--output', default=RESULTS_PATH, help='arquivo JSON do relatório')
+    parser.add_argument('--baseline', help='baseline para comparação; sai com código 1 se houver regressão')
+    parser.add_argument('--save-baseline', help='grava o relatório também como baseline neste arquivo')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help=f'regressão tolerada na comparação (padrão: {DEFAULT_TOLERANCE})')
+    parser.add_argument('--cache-dir', default=os.path.join(tempfile.gettempdir(), 'video-benchmarks'),
+                        help='onde guardar os vídeos sintéticos entre execuções')
+    args = parser.parse_args(argv)
+
+    names = args.videos.split(',') if args.videos else (synth.QUICK_VIDEOS if args.quick else list(synth.VIDEOS))
+    unknown = [name for name in names if name not in synth.VIDEOS]
+    if unknown:
+        parser.error(f"vídeos desconhecidos: {', '.join(unknown)}")
+    repeat = args.repeat or (1 if args.quick else 3)
+
+    videos = synth.ensure_videos(args.cache_dir, names)
+    if not videos:
+        print("Nenhum vídeo sintético pôde ser gerado.")
+        return 2
+    cases = build_cases(videos)
+    if args.only:
+        prefixes = tuple(args.only.split(','))
+        cases = [case for case in cases if case[0].startswith(prefixes)]
+
+    results = run(cases, repeat)
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': {
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'repeat': repeat,
+        'videos': {name: dict(zip(('width', 'height', 'seconds', 'fps', 'fourcc'), synth.VIDEOS[name]))
+                   for name in videos},
+        'results': results,
+    }
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Relatório gravado em {path}")
+
+    failed = [name for name, result in results.items() if 'error' in result]
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for name, metric, old, new in regressions:
+            print(f"REGRESSÃO {name} {metric}: {old} -> {new}")
+        if regressions:
+            print(f"{len(regressions)} regressão(ões) acima de {args.tolerance:.0%} em relação a {args.baseline}.")
+            return 1
+        print(f"Sem regressões acima de {args.tolerance:.0%} em relação a {args.baseline}.")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
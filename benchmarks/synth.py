@@ -0,0 +1,70 @@
+import os
+
+import cv2
+import numpy as np
+
+# Vídeos sintéticos usados nos benchmarks: nome -> (largura, altura, segundos, fps, fourcc, extensão)
+VIDEOS = {
+    'sd-2s-mjpg': (640, 360, 2, 25, 'MJPG', 'avi'),
+    'sd-10s-mp4v': (640, 360, 10, 25, 'mp4v', 'mp4'),
+    'hd-5s-mp4v': (1280, 720, 5, 30, 'mp4v', 'mp4'),
+    'hd-5s-xvid': (1280, 720, 5, 30, 'XVID', 'avi'),
+    'fhd-3s-mp4v': (1920, 1080, 3, 30, 'mp4v', 'mp4'),
+}
+# Conjunto reduzido do modo --quick
+QUICK_VIDEOS = ('sd-2s-mjpg',)
+
+
+def _frame(base, index, width, height):
+    """Frame determinístico: gradiente em movimento, um bloco de ruído e o número do frame."""
+    frame = np.roll(base, index * 4, axis=1)
+    rng = np.random.default_rng(index)
+    h, w = height // 4, width // 4
+    y, x = (index * 7) % (height - h), (index * 11) % (width - w)
+    frame[y:y + h, x:x + w] = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+    cv2.putText(frame, f'{index:05d}', (width // 20, height // 6), cv2.FONT_HERSHEY_SIMPLEX,
+                height / 360, (255, 255, 255), max(1, height // 180))
+    return frame
+
+
+def frames(width, height, count):
+    """Gera `count` frames sintéticos (BGR) de `width` x `height`, sem codificá-los."""
+    xs = np.linspace(0, 255, width, dtype=np.uint8)
+    ys = np.linspace(0, 255, height, dtype=np.uint8)
+    base = np.dstack([
+        np.tile(xs, (height, 1)),
+        np.tile(ys[:, None], (1, width)),
+        np.full((height, width), 128, np.uint8),
+    ])
+    for index in range(count):
+        yield _frame(base, index, width, height)
+
+
+def synthesize(path, width, height, seconds, fps, fourcc):
+    """Grava um vídeo sintético com o OpenCV. Retorna False se o codec não estiver disponível."""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, (width, height))
+    if not writer.isOpened():
+        return False
+    for frame in frames(width, height, int(seconds * fps)):
+        writer.write(frame)
+    writer.release()
+    return True
+
+
+def ensure_videos(out_dir, names):
+    """
+    Gera (uma única vez) os vídeos sintéticos pedidos em `out_dir`.
+    Retorna {nome: caminho} apenas com os vídeos que puderam ser gravados.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    videos = {}
+    for name in names:
+        width, height, seconds, fps, fourcc, ext = VIDEOS[name]
+        path = os.path.join(out_dir, f'{name}.{ext}')
+        if not os.path.exists(path):
+            print(f"Gerando vídeo sintético {name} ({width}x{height}, {seconds}s, {fourcc})...")
+            if not synthesize(path, width, height, seconds, fps, fourcc):
+                print(f"Codec {fourcc} indisponível; vídeo {name} ignorado.")
+                continue
+        videos[name] = path
+    return videos
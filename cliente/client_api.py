@@ -1,37 +1,276 @@
 import requests
 import os
+import time
+import threading
+from requests.adapters import HTTPAdapter
 
 # Configure o endereço do servidor. Use o IP da máquina do servidor se estiver em outra máquina.
 SERVER_URL = "http://192.168.1.28:5000"
 
-def upload_video(file_path, filter_name, progress_callback):
-    """Envia um vídeo para o servidor e reporta o progresso."""
+# Tentativas consecutivas de reenvio de uma parte antes de desistir do upload
+UPLOAD_MAX_RETRIES = 5
+# Espera máxima (s) sugerida pelo servidor (429, Retry-After) aceita antes de finalizar um upload
+MAX_RETRY_AFTER = 120
+# Conexões mantidas abertas (keep-alive) com o servidor, compartilhadas pelas threads de envio
+POOL_SIZE = 10
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """
+    Sessão HTTP compartilhada: reaproveita as conexões com o servidor em vez de abrir
+    uma por requisição. O pool de conexões pode ser usado por várias threads.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+class UploadCancelled(Exception):
+    """O upload foi cancelado pelo usuário (ver `cancel_event` em upload_video)."""
+
+class _ChunkReader:
+    """
+    Lê no máximo `length` bytes de um arquivo aberto, reportando cada leitura (para o
+    progresso real). Interrompe o envio, no meio da parte, se `cancel_event` for acionado.
+    """
+
+    def __init__(self, f, length, on_read, cancel_event=None):
+        self.f = f
+        self.remaining = length
+        self.on_read = on_read
+        self.cancel_event = cancel_event
+
+    def __len__(self):
+        return self.remaining
+
+    def read(self, size=-1):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise UploadCancelled()
+        if self.remaining <= 0:
+            return b''
+
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        self.on_read(len(data))
+        return data
+
+def _error_from_response(response):
+    """Extrai a mensagem de erro de uma resposta do servidor."""
     try:
-        url = f"{SERVER_URL}/upload"
+        message = response.json().get('error')
+    except ValueError:
+        message = None
+    return {'error': message or f"Erro {response.status_code} no servidor"}
+
+def _get_upload_offset(upload_url, fallback):
+    """Consulta quantos bytes o servidor já recebeu de um upload em partes."""
+    try:
+        response = get_session().get(upload_url, timeout=30)
+        response.raise_for_status()
+        return response.json()['offset']
+    except requests.exceptions.RequestException:
+        return fallback
+
+def _open_upload_session(http, upload_url):
+    """Retorna a sessão de upload ainda aberta no servidor, ou None (finalizada, expirada...)."""
+    response = http.get(upload_url, timeout=30)
+    if response.status_code >= 400:
+        return None
+    session = response.json()
+    return session if session['state'] == 'open' else None
+
+def upload_video(file_path, filter_name, progress_callback, profile=None, priority=None,
+                 cancel_event=None, upload_url=None, on_session=None):
+    """
+    Envia um vídeo para o servidor em partes (upload retomável) e reporta o
+    progresso real, em porcentagem. Se a conexão cair, consulta o servidor e
+    retoma o envio a partir do último byte recebido. Sem `profile`, o servidor
+    escolhe o perfil de codificação associado ao filtro (ou o padrão). `priority`
+    é 'interactive' (padrão) ou 'batch'. `filter_name` e `profile` também aceitam
+    listas: cada combinação de filtro e perfil vira uma saída do mesmo vídeo.
+
+    Com `upload_url` (a URL recebida antes por `on_session`), retoma uma sessão anterior
+    em vez de reenviar o arquivo desde o início. Se `cancel_event` for acionado,
+    o envio é interrompido e UploadCancelled é lançada.
+    """
+    http = get_session()
+    try:
+        size = os.path.getsize(file_path)
+        session = _open_upload_session(http, upload_url) if upload_url else None
+        if session is None:
+            response = http.post(f"{SERVER_URL}/uploads", json={
+                'filename': os.path.basename(file_path),
+                'size': size,
+                'filter': filter_name,
+                'profile': profile,
+                'priority': priority,
+            }, timeout=30)
+            if response.status_code >= 400:
+                return _error_from_response(response)
+            session = response.json()
+            upload_url = f"{SERVER_URL}{session['upload_url']}"
+            if on_session:
+                on_session(upload_url)
+
+        offset = session['offset']
+        failures = 0
+
         with open(file_path, 'rb') as f:
-            files = {'video': (os.path.basename(file_path), f)}
-            data = {'filter': filter_name}
-            
-            # O upload é feito em um único POST. Para um progresso real, seria
-            # necessário streaming ou uma biblioteca como requests-toolbelt.
-            # Aqui, simulamos o progresso antes e depois da chamada.
-            progress_callback(10) # Início
-            response = requests.post(url, files=files, data=data, timeout=300) # Timeout de 5 mins
-            progress_callback(100) # Fim
-            
-        response.raise_for_status()  # Lança exceção para respostas de erro (4xx ou 5xx)
+            while offset < size:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise UploadCancelled()
+                f.seek(offset)
+                start = offset
+                sent = [0]
+
+                def on_read(n):
+                    sent[0] += n
+                    progress_callback((start + sent[0]) * 100 / size)
+
+                reader = _ChunkReader(f, min(session['chunk_size'], size - offset), on_read, cancel_event)
+                try:
+                    response = http.put(upload_url, params={'offset': offset}, data=reader,
+                                        headers={'Content-Type': 'application/octet-stream'}, timeout=120)
+                except requests.exceptions.RequestException as e:
+                    failures += 1
+                    if failures > UPLOAD_MAX_RETRIES:
+                        raise
+                    delay = min(2 ** failures, 30)
+                    print(f"Falha ao enviar parte ({e}). Retomando em {delay}s...")
+                    time.sleep(delay)
+                    offset = _get_upload_offset(upload_url, offset)
+                    continue
+
+                if response.status_code == 409:
+                    # Servidor e cliente divergiram; retoma do que o servidor já recebeu
+                    offset = response.json()['offset']
+                    continue
+                if response.status_code >= 400:
+                    return _error_from_response(response)
+
+                offset = response.json()['offset']
+                failures = 0
+                progress_callback(offset * 100 / size)
+
+        # Com o servidor sobrecarregado (429), o arquivo já enviado aguarda na sessão
+        for _ in range(UPLOAD_MAX_RETRIES):
+            response = http.post(f"{upload_url}/complete", timeout=300)
+            retry_after = int(response.headers.get('Retry-After', 0))
+            if response.status_code != 429 or retry_after > MAX_RETRY_AFTER:
+                break
+            print(f"Servidor ocupado. Finalizando o upload em {retry_after}s...")
+            if cancel_event is None:
+                time.sleep(retry_after)
+            elif cancel_event.wait(retry_after):
+                raise UploadCancelled()
+        if response.status_code >= 400:
+            return _error_from_response(response)
         return response.json()
     except requests.exceptions.RequestException as e:
         print(f"Erro de conexão com o servidor: {e}")
         return {'error': f"Não foi possível conectar ao servidor: {e}"}
 
-def get_video_history():
-    """Busca o histórico de vídeos do servidor."""
+def get_job_status(job_id):
+    """Consulta o estado de um job de processamento no servidor."""
     try:
-        url = f"{SERVER_URL}/videos"
-        response = requests.get(url, timeout=30)
+        url = f"{SERVER_URL}/jobs/{job_id}"
+        response = get_session().get(url, timeout=30)
         response.raise_for_status()
         return response.json()
+    except requests.exceptions.RequestException as e:
+        print(f"Erro ao consultar o job: {e}")
+        return {'error': f"Não foi possível consultar o job: {e}"}
+
+def get_filters():
+    """Busca no servidor a lista de filtros disponíveis (nomes), ou None em caso de erro."""
+    try:
+        url = f"{SERVER_URL}/filters"
+        response = get_session().get(url, timeout=10)
+        response.raise_for_status()
+        return [f['name'] for f in response.json()['filters']]
+    except requests.exceptions.RequestException as e:
+        print(f"Erro ao buscar filtros: {e}")
+        return None
+
+def get_profiles():
+    """Busca no servidor os perfis de codificação disponíveis (nomes), ou None em caso de erro."""
+    try:
+        url = f"{SERVER_URL}/profiles"
+        response = get_session().get(url, timeout=10)
+        response.raise_for_status()
+        return [p['name'] for p in response.json()['profiles']]
+    except requests.exceptions.RequestException as e:
+        print(f"Erro ao buscar perfis: {e}")
+        return None
+
+def get_video_page(cursor=None, limit=100, **filters):
+    """
+    Busca uma página do histórico de vídeos. `filters` aceita os filtros do
+    servidor (filter, since, until, min_duration, max_duration, min_width,
+    max_width, min_height, max_height, fields). Retorna (vídeos, próximo cursor).
+    """
+    params = {'limit': limit, **{k: v for k, v in filters.items() if v is not None}}
+    if cursor:
+        params['cursor'] = cursor
+    response = get_session().get(f"{SERVER_URL}/videos", params=params, timeout=30)
+    response.raise_for_status()
+    data = response.json()
+    return data['videos'], data['next_cursor']
+
+def get_video_changes(since=None, limit=500):
+    """
+    Busca as alterações no histórico de vídeos depois do cursor `since` (sem ele,
+    todo o histórico). Retorna (alterações, novo cursor, há mais alterações).
+    Cada alteração é {'op': 'upsert' ou 'delete', 'id', 'video'}.
+    """
+    params = {'limit': limit}
+    if since:
+        params['since'] = since
+    response = get_session().get(f"{SERVER_URL}/videos/changes", params=params, timeout=30)
+    response.raise_for_status()
+    data = response.json()
+    return data['changes'], data['cursor'], data['has_more']
+
+def request_outputs(video_id, filter_names, profiles=None, priority=None):
+    """
+    Pede ao servidor novas saídas (filtros x perfis) de um vídeo já enviado, sem
+    reenviar o arquivo. Retorna a resposta do servidor (com 'job_id' se algo foi enfileirado).
+    """
+    try:
+        response = get_session().post(f"{SERVER_URL}/videos/{video_id}/process", json={
+            'filters': filter_names,
+            'profiles': profiles,
+            'priority': priority,
+        }, timeout=30)
+        if response.status_code >= 400:
+            return _error_from_response(response)
+        return response.json()
+    except requests.exceptions.RequestException as e:
+        print(f"Erro ao pedir novas saídas: {e}")
+        return {'error': f"Não foi possível conectar ao servidor: {e}"}
+
+def iter_video_history(page_size=100, **filters):
+    """Percorre todo o histórico de vídeos, página por página, seguindo os cursores."""
+    cursor = None
+    while True:
+        videos, cursor = get_video_page(cursor, page_size, **filters)
+        yield from videos
+        if not cursor:
+            break
+
+def get_video_history():
+    """Busca o histórico de vídeos do servidor."""
+    try:
+        return list(iter_video_history())
     except requests.exceptions.RequestException as e:
         print(f"Erro ao buscar histórico: {e}")
         return []
\ No newline at end of file
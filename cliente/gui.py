@@ -1,21 +1,82 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import os
+import queue
 import webbrowser # <--- 1. IMPORTE A BIBLIOTECA WEBBROWSER
 
 # Importa as funções e a URL do servidor do módulo de API
 # <--- 2. IMPORTE A CONSTANTE SERVER_URL
-from client_api import upload_video, get_video_history, SERVER_URL 
+from client_api import get_filters, get_profiles, SERVER_URL 
 from utils import play_video_from_url
+from history_cache import HistoryCache, sync_in_background
+import transfers
+
+# Intervalo (ms) entre leituras da fila de eventos dos envios em segundo plano
+TRANSFER_POLL_MS = 100
+# Vídeos do histórico carregados na lista por vez, conforme o usuário rola
+HISTORY_PAGE_SIZE = 100
+# Intervalo (ms) entre sincronizações do histórico com o servidor
+HISTORY_SYNC_MS = 30000
+# Texto exibido para cada estado de um envio
+TRANSFER_STATE_LABELS = {
+    transfers.QUEUED: 'Na fila',
+    transfers.UPLOADING: 'Enviando',
+    transfers.PROCESSING: 'Processando',
+    transfers.DONE: 'Concluído',
+    transfers.FAILED: 'Falhou',
+    transfers.CANCELLED: 'Cancelado',
+}
+# Filtros exibidos quando o servidor não informa a lista (GET /filters)
+DEFAULT_FILTERS = ['grayscale', 'pixelize', 'edges']
+# Opção do seletor de perfil que deixa a escolha para o servidor
+AUTO_PROFILE = '(automático)'
+
+class TransferRow(ttk.Frame):
+    """Linha da lista de envios: nome, estado, barra de progresso e botões cancelar/repetir."""
+
+    def __init__(self, parent, transfer_id, name, on_cancel, on_retry):
+        super().__init__(parent, padding=(0, 2))
+        self.columnconfigure(2, weight=1)
+        ttk.Label(self, text=name, width=30, anchor="w").grid(row=0, column=0, sticky="w")
+        self.state_label = ttk.Label(self, width=12)
+        self.state_label.grid(row=0, column=1, padx=5)
+        self.progress_bar = ttk.Progressbar(self, orient='horizontal', mode='determinate')
+        self.progress_bar.grid(row=0, column=2, sticky="ew", padx=5)
+        self.cancel_button = ttk.Button(self, text="Cancelar", command=lambda: on_cancel(transfer_id))
+        self.cancel_button.grid(row=0, column=3, padx=2)
+        self.retry_button = ttk.Button(self, text="Repetir", command=lambda: on_retry(transfer_id))
+        self.retry_button.grid(row=0, column=4, padx=2)
+        self.error_label = ttk.Label(self, foreground="red")
+        self.error_label.grid(row=1, column=0, columnspan=5, sticky="w")
+        self.error_label.grid_remove()
+
+    def update_from(self, event):
+        """Atualiza a linha com um evento (Transfer.snapshot) do gerenciador de envios."""
+        state = event['state']
+        self.state_label['text'] = TRANSFER_STATE_LABELS[state]
+        self.progress_bar['value'] = event['progress']
+        self.cancel_button['state'] = 'normal' if state in (transfers.QUEUED, transfers.UPLOADING) else 'disabled'
+        self.retry_button['state'] = 'normal' if state in (transfers.FAILED, transfers.CANCELLED) else 'disabled'
+        if event['error']:
+            self.error_label['text'] = event['error']
+            self.error_label.grid()
+        else:
+            self.error_label.grid_remove()
 
 class VideoClientApp(tk.Tk):
     def __init__(self):
         super().__init__()
         self.title("Cliente de Processamento de Vídeo")
-        self.geometry("800x600")
+        self.geometry("800x750")
+
+        # Envios em segundo plano: a interface continua respondendo durante uploads e processamento
+        self.transfers = transfers.TransferManager()
+        self.transfer_rows = {}
+        self.selected_files = ()
 
         self.selected_file_path = tk.StringVar()
         self.selected_filter = tk.StringVar(value='grayscale')
+        self.selected_profile = tk.StringVar(value=AUTO_PROFILE)
 
         # --- Frame de Upload ---
         upload_frame = ttk.LabelFrame(self, text="Enviar Novo Vídeo", padding="10")
@@ -24,26 +85,49 @@ class VideoClientApp(tk.Tk):
         # Configura o grid para expandir
         upload_frame.columnconfigure(1, weight=1)
 
-        ttk.Label(upload_frame, text="Arquivo:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
+        ttk.Label(upload_frame, text="Arquivos:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
         ttk.Entry(upload_frame, textvariable=self.selected_file_path, width=50, state="readonly").grid(row=0, column=1, columnspan=2, padx=5, pady=5, sticky="ew")
-        ttk.Button(upload_frame, text="Selecionar Arquivo...", command=self.select_file).grid(row=0, column=3, padx=5, pady=5)
+        ttk.Button(upload_frame, text="Selecionar Arquivos...", command=self.select_file).grid(row=0, column=3, padx=5, pady=5)
 
         ttk.Label(upload_frame, text="Filtro:").grid(row=1, column=0, padx=5, pady=5, sticky="w")
-        filter_options = ['grayscale', 'pixelize', 'edges']
-        ttk.Combobox(upload_frame, textvariable=self.selected_filter, values=filter_options, state="readonly").grid(row=1, column=1, padx=5, pady=5, sticky="ew")
+        # Os filtros são descobertos no servidor; a lista fixa é usada apenas se ele não responder.
+        # O campo é editável para permitir cadeias como "resize:width=640|grayscale|edges".
+        filter_options = get_filters() or DEFAULT_FILTERS
+        ttk.Combobox(upload_frame, textvariable=self.selected_filter, values=filter_options).grid(row=1, column=1, padx=5, pady=5, sticky="ew")
 
         # --- 3. ADIÇÃO E POSICIONAMENTO DOS BOTÕES ---
         # Cria um frame interno para os botões de ação
         action_buttons_frame = ttk.Frame(upload_frame)
         action_buttons_frame.grid(row=1, column=2, columnspan=2, padx=5, pady=5, sticky="e")
 
-        ttk.Button(action_buttons_frame, text="Enviar Vídeo", command=self.upload_selected_video).pack(side="left", padx=(0, 5))
+        ttk.Button(action_buttons_frame, text="Enviar Vídeos", command=self.upload_selected_video).pack(side="left", padx=(0, 5))
         
         # O novo botão que abre o navegador
         ttk.Button(action_buttons_frame, text="Ver Histórico no Navegador", command=self.open_history_in_browser).pack(side="left")
         
-        self.progress_bar = ttk.Progressbar(upload_frame, orient='horizontal', mode='determinate')
-        self.progress_bar.grid(row=2, column=0, columnspan=4, sticky="ew", padx=5, pady=10)
+        ttk.Label(upload_frame, text="Perfil:").grid(row=2, column=0, padx=5, pady=5, sticky="w")
+        # "automático" deixa o servidor escolher o perfil associado ao filtro (ou o padrão)
+        profile_options = [AUTO_PROFILE] + (get_profiles() or [])
+        ttk.Combobox(upload_frame, textvariable=self.selected_profile, values=profile_options, state="readonly").grid(row=2, column=1, padx=5, pady=5, sticky="ew")
+
+        # --- Frame de Envios (um arquivo por linha, com rolagem) ---
+        transfers_frame = ttk.LabelFrame(self, text="Envios", padding="10")
+        transfers_frame.pack(fill="x", padx=10)
+
+        transfers_toolbar = ttk.Frame(transfers_frame)
+        transfers_toolbar.pack(fill="x")
+        ttk.Label(transfers_toolbar, text=f"Até {transfers.MAX_CONCURRENT_UPLOADS} envios simultâneos").pack(side="left")
+        ttk.Button(transfers_toolbar, text="Limpar Finalizados", command=self.clear_finished_transfers).pack(side="right")
+
+        self.transfers_canvas = tk.Canvas(transfers_frame, height=150, highlightthickness=0)
+        transfers_scrollbar = ttk.Scrollbar(transfers_frame, orient="vertical", command=self.transfers_canvas.yview)
+        self.transfers_list = ttk.Frame(self.transfers_canvas)
+        list_window = self.transfers_canvas.create_window((0, 0), window=self.transfers_list, anchor="nw")
+        self.transfers_list.bind("<Configure>", lambda e: self.transfers_canvas.configure(scrollregion=self.transfers_canvas.bbox("all")))
+        self.transfers_canvas.bind("<Configure>", lambda e: self.transfers_canvas.itemconfigure(list_window, width=e.width))
+        self.transfers_canvas.configure(yscrollcommand=transfers_scrollbar.set)
+        self.transfers_canvas.pack(fill="x", expand=True, side="left")
+        transfers_scrollbar.pack(side="right", fill="y")
 
         # --- Frame de Histórico ---
         # ... (o resto do arquivo continua exatamente igual) ...
@@ -69,13 +153,25 @@ class VideoClientApp(tk.Tk):
         
         self.history_tree.pack(fill="both", expand=True, side="left")
 
-        scrollbar = ttk.Scrollbar(history_frame, orient="vertical", command=self.history_tree.yview)
-        scrollbar.pack(side="right", fill="y")
-        self.history_tree.configure(yscrollcommand=scrollbar.set)
-        
-        self.video_data = {}
+        self.history_scrollbar = ttk.Scrollbar(history_frame, orient="vertical", command=self.history_tree.yview)
+        self.history_scrollbar.pack(side="right", fill="y")
+        self.history_tree.configure(yscrollcommand=self.on_history_scroll)
         self.history_tree.bind("<Double-1>", self.on_item_double_click)
-        self.refresh_history()
+
+        # O histórico vem da cópia local (exibida na hora) e é sincronizado em segundo plano
+        self.history_cache = HistoryCache()
+        self.history_events = queue.Queue()
+        self.history_keys = []  # (created_at, id) das linhas exibidas, na ordem da lista
+        self.history_complete = False
+        self.history_syncing = False
+        self.history_sync_pending = False
+        self.load_more_history()
+        self.sync_history()
+
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.after(TRANSFER_POLL_MS, self.process_transfer_events)
+        self.after(TRANSFER_POLL_MS, self.process_history_events)
+        self.after(HISTORY_SYNC_MS, self.periodic_history_sync)
 
     # --- 4. CRIAÇÃO DA FUNÇÃO CHAMADA PELO BOTÃO ---
     def open_history_in_browser(self):
@@ -87,60 +183,144 @@ class VideoClientApp(tk.Tk):
             messagebox.showerror("Erro", f"Não foi possível abrir o navegador: {e}")
 
     def select_file(self):
-        # ... (resto do seu código, sem alterações)
-        file_path = filedialog.askopenfilename(
-            title="Selecione um vídeo",
+        file_paths = filedialog.askopenfilenames(
+            title="Selecione um ou mais vídeos",
             filetypes=(("Arquivos de Vídeo", "*.mp4 *.avi *.mov"), ("Todos os arquivos", "*.*"))
         )
-        if file_path:
-            self.selected_file_path.set(file_path)
-
-    def update_progress(self, value):
-        self.progress_bar['value'] = value
-        self.update_idletasks()
+        if file_paths:
+            self.selected_files = file_paths
+            if len(file_paths) == 1:
+                self.selected_file_path.set(file_paths[0])
+            else:
+                self.selected_file_path.set(f"{len(file_paths)} arquivos selecionados")
 
     def upload_selected_video(self):
-        # ... (resto do seu código, sem alterações)
-        file_path = self.selected_file_path.get()
-        if not os.path.exists(file_path):
+        """Coloca os arquivos selecionados na fila de envio (em segundo plano)."""
+        file_paths = [path for path in self.selected_files if os.path.exists(path)]
+        if not file_paths:
             messagebox.showerror("Erro", "Arquivo selecionado não encontrado.")
             return
 
         filter_name = self.selected_filter.get()
-        
-        self.update_progress(0)
-        messagebox.showinfo("Upload", "O upload foi iniciado. Por favor, aguarde.")
+        profile = self.selected_profile.get()
+        profile = None if profile == AUTO_PROFILE else profile
 
-        response = upload_video(file_path, filter_name, self.update_progress)
+        for file_path in file_paths:
+            transfer = self.transfers.add(file_path, filter_name, profile)
+            row = TransferRow(self.transfers_list, transfer.id, transfer.name,
+                              self.transfers.cancel, self.transfers.retry)
+            row.pack(fill="x")
+            self.transfer_rows[transfer.id] = row
+        self.selected_files = ()
+        self.selected_file_path.set("")
 
-        if response and 'error' in response:
-            messagebox.showerror("Erro no Upload", response['error'])
-        else:
-            messagebox.showinfo("Sucesso", "Vídeo enviado e processado com sucesso!")
-            self.refresh_history()
-        
-        self.update_progress(0)
+    def process_transfer_events(self):
+        """Aplica na interface os eventos dos envios em segundo plano (thread do Tkinter)."""
+        latest = {}
+        try:
+            while True:
+                event = self.transfers.events.get_nowait()
+                latest[event['id']] = event
+        except queue.Empty:
+            pass
 
-    def refresh_history(self):
-        # ... (resto do seu código, sem alterações)
-        for i in self.history_tree.get_children():
-            self.history_tree.delete(i)
-        
-        self.video_data = {}
-        history = get_video_history()
-        
-        for video in history:
-            video_id = video['id']
-            name = f"{video['original_name']}.{video['original_ext']}"
-            duration = f"{video['duration_sec']:.2f}" if video['duration_sec'] else "N/A"
-            date = video['created_at'].split("T")[0]
-            
-            item_id = self.history_tree.insert(
-                "", "end", iid=video_id,
-                values=(name, video['filter'], date, duration, "Clique duplo para ver")
-            )
-            self.video_data[video_id] = video
+        # Vários eventos de um mesmo arquivo no intervalo: só o último importa
+        finished = False
+        for transfer_id, event in latest.items():
+            row = self.transfer_rows.get(transfer_id)
+            if row is not None:
+                row.update_from(event)
+            finished = finished or event['state'] == transfers.DONE
+        if finished:
+            self.sync_history()
+        self.after(TRANSFER_POLL_MS, self.process_transfer_events)
+
+    def clear_finished_transfers(self):
+        """Remove da lista os envios concluídos, falhos ou cancelados."""
+        for transfer_id in self.transfers.remove_finished():
+            row = self.transfer_rows.pop(transfer_id, None)
+            if row is not None:
+                row.destroy()
+
+    def on_close(self):
+        """Interrompe os envios em andamento antes de fechar a janela."""
+        self.transfers.shutdown()
+        self.destroy()
 
+    @staticmethod
+    def _history_values(video):
+        name = f"{video['original_name']}.{video['original_ext']}"
+        duration = f"{video['duration_sec']:.2f}" if video['duration_sec'] else "N/A"
+        date = video['created_at'].split("T")[0]
+        return (name, video['filter'], date, duration, "Clique duplo para ver")
+
+    def on_history_scroll(self, first, last):
+        """Atualiza a barra de rolagem e carrega mais vídeos ao chegar perto do fim da lista."""
+        self.history_scrollbar.set(first, last)
+        if not self.history_complete and float(last) > 0.9:
+            self.load_more_history()
+
+    def load_more_history(self):
+        """Acrescenta à lista a próxima página de vídeos da cópia local."""
+        after = self.history_keys[-1] if self.history_keys else None
+        videos = self.history_cache.page(after, HISTORY_PAGE_SIZE)
+        for video in videos:
+            self.history_tree.insert("", "end", iid=video['id'], values=self._history_values(video))
+            self.history_keys.append((video['created_at'], video['id']))
+        self.history_complete = len(videos) < HISTORY_PAGE_SIZE
+
+    def reload_history(self):
+        """Recarrega a lista a partir da primeira página da cópia local."""
+        self.history_tree.delete(*self.history_tree.get_children())
+        self.history_keys = []
+        self.load_more_history()
+
+    def sync_history(self):
+        """Busca em segundo plano as alterações do histórico no servidor (uma sincronização por vez)."""
+        if self.history_syncing:
+            self.history_sync_pending = True
+            return
+        self.history_syncing = True
+        sync_in_background(self.history_cache, lambda changes, error: self.history_events.put(changes))
+
+    def periodic_history_sync(self):
+        self.sync_history()
+        self.after(HISTORY_SYNC_MS, self.periodic_history_sync)
+
+    def process_history_events(self):
+        """Aplica na lista o resultado de uma sincronização concluída (thread do Tkinter)."""
+        try:
+            changes = self.history_events.get_nowait()
+        except queue.Empty:
+            pass
+        else:
+            self.history_syncing = False
+            self.apply_history_changes(changes)
+            if self.history_sync_pending:
+                self.history_sync_pending = False
+                self.sync_history()
+        self.after(TRANSFER_POLL_MS, self.process_history_events)
+
+    def apply_history_changes(self, changes):
+        """Atualiza apenas as linhas alteradas; muitas alterações de uma vez recarregam a lista."""
+        if len(changes) > HISTORY_PAGE_SIZE:
+            self.reload_history()
+            return
+        for change in changes:
+            video_id = change['id']
+            if self.history_tree.exists(video_id):
+                del self.history_keys[self.history_tree.index(video_id)]
+                self.history_tree.delete(video_id)
+            if change['op'] != 'upsert':
+                continue
+            video = change['video']
+            key = (video['created_at'], video_id)
+            # Vídeos além da parte já carregada aparecem quando o usuário rolar até eles
+            if not self.history_complete and (not self.history_keys or key < self.history_keys[-1]):
+                continue
+            index = next((i for i, k in enumerate(self.history_keys) if k < key), len(self.history_keys))
+            self.history_tree.insert("", index, iid=video_id, values=self._history_values(video))
+            self.history_keys.insert(index, key)
 
     def on_item_double_click(self, event):
         """Lida com o clique duplo em um item do histórico para exibir os vídeos."""
@@ -150,10 +330,9 @@ class VideoClientApp(tk.Tk):
             return
             
         item_id = selection[0]
-        if not item_id or item_id not in self.video_data:
+        video_info = self.history_cache.get(item_id) if item_id else None
+        if video_info is None:
             return
-            
-        video_info = self.video_data[item_id]
         
         # Cria a janela pop-up
         popup = tk.Toplevel(self)
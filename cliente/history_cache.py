@@ -0,0 +1,142 @@
+import os
+import json
+import sqlite3
+import threading
+
+import requests
+
+import client_api
+
+# Arquivo da cópia local do histórico de vídeos (exibida ao abrir o cliente, antes da sincronização)
+CACHE_PATH = os.environ.get(
+    'VIDEO_CLIENT_CACHE', os.path.join(os.path.expanduser('~'), '.video_client', 'history.db')
+)
+# Alterações pedidas ao servidor por requisição na sincronização
+SYNC_PAGE_SIZE = 500
+
+
+class HistoryCache:
+    """
+    Cópia local (SQLite) do histórico de vídeos de um servidor, mantida em dia pelo
+    feed de alterações (GET /videos/changes): cada sincronização busca apenas o que
+    mudou desde o último cursor. Pode ser usada por várias threads.
+    """
+
+    def __init__(self, path=CACHE_PATH, server_url=None):
+        self.server_url = server_url or client_api.SERVER_URL
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS sync_state (
+                server_url TEXT PRIMARY KEY,
+                cursor TEXT
+            )
+            """)
+            self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS videos (
+                server_url TEXT NOT NULL,
+                id TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (server_url, id)
+            )
+            """)
+            # Mesma ordem da listagem do servidor: do mais recente para o mais antigo
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_videos_order ON videos (server_url, created_at DESC, id DESC)"
+            )
+
+    def cursor(self):
+        """Cursor da última sincronização (None = nunca sincronizado)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT cursor FROM sync_state WHERE server_url = ?", (self.server_url,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def count(self):
+        """Quantidade de vídeos na cópia local."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM videos WHERE server_url = ?", (self.server_url,)
+            ).fetchone()[0]
+
+    def page(self, after=None, limit=100):
+        """
+        Vídeos do mais recente para o mais antigo, a partir da chave (created_at, id)
+        `after` (exclusiva) do último vídeo já exibido.
+        """
+        query = "SELECT data FROM videos WHERE server_url = ?"
+        params = [self.server_url]
+        if after is not None:
+            query += " AND (created_at, id) < (?, ?)"
+            params.extend(after)
+        query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get(self, video_id):
+        """Retorna um vídeo da cópia local, ou None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM videos WHERE server_url = ? AND id = ?", (self.server_url, video_id)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def apply(self, changes, cursor):
+        """Aplica um lote de alterações do servidor e grava o novo cursor (na mesma transação)."""
+        with self._lock, self._conn:
+            for change in changes:
+                if change['op'] == 'delete':
+                    self._conn.execute(
+                        "DELETE FROM videos WHERE server_url = ? AND id = ?", (self.server_url, change['id'])
+                    )
+                else:
+                    video = change['video']
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO videos (server_url, id, created_at, data) VALUES (?, ?, ?, ?)",
+                        (self.server_url, video['id'], video['created_at'], json.dumps(video))
+                    )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sync_state (server_url, cursor) VALUES (?, ?)", (self.server_url, cursor)
+            )
+
+    def sync(self):
+        """
+        Busca no servidor as alterações desde a última sincronização e as aplica.
+        Retorna as alterações aplicadas (vazia se nada mudou); lança
+        requests.exceptions.RequestException se o servidor não responder.
+        """
+        applied = []
+        cursor = self.cursor()
+        while True:
+            changes, cursor, has_more = client_api.get_video_changes(cursor, SYNC_PAGE_SIZE)
+            self.apply(changes, cursor)
+            applied.extend(changes)
+            if not has_more:
+                return applied
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def sync_in_background(cache, on_done):
+    """
+    Sincroniza a cópia local em uma thread separada e chama `on_done(alterações, erro)`
+    ao terminar (na thread da sincronização).
+    """
+    def run():
+        try:
+            on_done(cache.sync(), None)
+        except requests.exceptions.RequestException as e:
+            print(f"Erro ao sincronizar o histórico: {e}")
+            on_done([], e)
+
+    thread = threading.Thread(target=run, name='history-sync', daemon=True)
+    thread.start()
+    return thread
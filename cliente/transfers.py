@@ -0,0 +1,206 @@
+import os
+import time
+import queue
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import client_api
+
+# Uploads enviados ao mesmo tempo; os demais aguardam na fila
+MAX_CONCURRENT_UPLOADS = int(os.environ.get('VIDEO_CLIENT_MAX_UPLOADS', '3'))
+# Intervalo (s) entre consultas ao estado dos jobs em processamento no servidor
+JOB_POLL_SEC = 2
+# Intervalo mínimo (s) entre dois avisos de progresso de um mesmo envio
+PROGRESS_INTERVAL = 0.1
+
+# Estados de uma transferência
+QUEUED = 'queued'           # aguardando uma vaga para o envio
+UPLOADING = 'uploading'     # enviando o arquivo
+PROCESSING = 'processing'   # enviado; o servidor está processando
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINAL_STATES = (DONE, FAILED, CANCELLED)
+
+
+class Transfer:
+    """Um arquivo na fila de envio. Alterado apenas pelas threads do TransferManager."""
+
+    def __init__(self, transfer_id, file_path, filter_name, profile=None, priority=None):
+        self.id = transfer_id
+        self.file_path = file_path
+        self.name = os.path.basename(file_path)
+        self.filter_name = filter_name
+        self.profile = profile
+        self.priority = priority
+        self.state = QUEUED
+        self.progress = 0.0
+        self.error = None
+        self.job_id = None
+        # Sessão de upload no servidor: permite retomar o envio em uma nova tentativa
+        self.upload_url = None
+        self.cancel_event = threading.Event()
+
+    def snapshot(self):
+        """Cópia do estado atual, enviada à interface pela fila de eventos."""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'state': self.state,
+            'progress': self.progress,
+            'error': self.error,
+            'job_id': self.job_id,
+        }
+
+
+class TransferManager:
+    """
+    Envia vários arquivos em segundo plano (no máximo `max_concurrent` ao mesmo tempo)
+    e acompanha o processamento de cada um no servidor. As threads de envio nunca
+    acessam a interface: cada mudança vira um evento (Transfer.snapshot) na fila
+    `events`, consumida pela thread do Tkinter com after().
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_UPLOADS):
+        self.events = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix='upload')
+        self._lock = threading.Lock()
+        self._transfers = {}
+        self._ids = itertools.count(1)
+        self._stop = threading.Event()
+        # Uma única thread consulta os jobs de todos os arquivos já enviados
+        self._watcher = threading.Thread(target=self._watch_jobs, name='job-watcher', daemon=True)
+        self._watcher.start()
+
+    def add(self, file_path, filter_name, profile=None, priority=None):
+        """Coloca um arquivo na fila de envio e retorna sua transferência."""
+        transfer = Transfer(next(self._ids), file_path, filter_name, profile, priority)
+        with self._lock:
+            self._transfers[transfer.id] = transfer
+        self._emit(transfer)
+        self._executor.submit(self._upload, transfer)
+        return transfer
+
+    def cancel(self, transfer_id):
+        """
+        Cancela um arquivo na fila ou em envio. Um arquivo já enviado continua sendo
+        processado no servidor.
+        """
+        with self._lock:
+            transfer = self._transfers.get(transfer_id)
+            if transfer is None or transfer.state not in (QUEUED, UPLOADING):
+                return False
+            transfer.cancel_event.set()
+            if transfer.state == UPLOADING:
+                # A thread de envio interrompe a parte atual e informa o cancelamento
+                return True
+            transfer.state = CANCELLED
+        self._emit(transfer)
+        return True
+
+    def retry(self, transfer_id):
+        """Reenvia um arquivo que falhou ou foi cancelado, retomando a sessão de upload se possível."""
+        with self._lock:
+            transfer = self._transfers.get(transfer_id)
+            if transfer is None or transfer.state not in (FAILED, CANCELLED):
+                return False
+            transfer.state = QUEUED
+            transfer.error = None
+            transfer.job_id = None
+            transfer.cancel_event = threading.Event()
+        self._emit(transfer)
+        self._executor.submit(self._upload, transfer)
+        return True
+
+    def remove_finished(self):
+        """Esquece os arquivos concluídos, falhos ou cancelados; retorna seus IDs."""
+        with self._lock:
+            finished = [tid for tid, t in self._transfers.items() if t.state in FINAL_STATES]
+            for tid in finished:
+                del self._transfers[tid]
+        return finished
+
+    def shutdown(self):
+        """Interrompe os envios em andamento e descarta a fila (ao fechar a janela)."""
+        self._stop.set()
+        with self._lock:
+            for transfer in self._transfers.values():
+                transfer.cancel_event.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _emit(self, transfer):
+        self.events.put(transfer.snapshot())
+
+    def _finish(self, transfer, state, error=None):
+        with self._lock:
+            transfer.state = state
+            transfer.error = error
+            if state == DONE:
+                transfer.progress = 100.0
+        self._emit(transfer)
+
+    def _upload(self, transfer):
+        """Executado nas threads do pool: envia um arquivo e o entrega ao acompanhamento do job."""
+        with self._lock:
+            if transfer.cancel_event.is_set():
+                return
+            transfer.state = UPLOADING
+            transfer.progress = 0.0
+        self._emit(transfer)
+
+        last = [0.0]
+
+        def on_progress(percent):
+            # O progresso chega a cada bloco lido do arquivo; a interface recebe no máximo
+            # um evento a cada PROGRESS_INTERVAL s por arquivo
+            now = time.monotonic()
+            if now - last[0] >= PROGRESS_INTERVAL or percent >= 100:
+                last[0] = now
+                transfer.progress = percent
+                self._emit(transfer)
+
+        def on_session(upload_url):
+            transfer.upload_url = upload_url
+
+        try:
+            response = client_api.upload_video(
+                transfer.file_path, transfer.filter_name, on_progress, transfer.profile, transfer.priority,
+                cancel_event=transfer.cancel_event, upload_url=transfer.upload_url, on_session=on_session
+            )
+        except client_api.UploadCancelled:
+            self._finish(transfer, CANCELLED)
+            return
+        except OSError as e:
+            self._finish(transfer, FAILED, f"Não foi possível ler o arquivo: {e}")
+            return
+
+        if 'error' in response:
+            self._finish(transfer, FAILED, response['error'])
+        elif 'job_id' not in response:
+            # O servidor reaproveitou um resultado já processado
+            self._finish(transfer, DONE)
+        else:
+            with self._lock:
+                transfer.job_id = response['job_id']
+                transfer.state = PROCESSING
+                transfer.progress = 0.0
+            self._emit(transfer)
+
+    def _watch_jobs(self):
+        """Consulta periodicamente os jobs dos arquivos já enviados até sua conclusão."""
+        while not self._stop.wait(JOB_POLL_SEC):
+            with self._lock:
+                processing = [t for t in self._transfers.values() if t.state == PROCESSING]
+            for transfer in processing:
+                job = client_api.get_job_status(transfer.job_id)
+                if 'state' not in job:
+                    # Falha na consulta (ex.: servidor reiniciando): tenta de novo no próximo ciclo
+                    continue
+                if job['state'] == 'done':
+                    self._finish(transfer, DONE)
+                elif job['state'] == 'failed':
+                    self._finish(transfer, FAILED, job.get('error') or "Falha desconhecida no processamento.")
+                elif job['progress'] * 100 != transfer.progress:
+                    transfer.progress = job['progress'] * 100
+                    self._emit(transfer)
@@ -0,0 +1,150 @@
+import os
+import math
+import time
+import hashlib
+from collections import namedtuple
+
+from flask import request, jsonify
+
+from . import database as db
+from . import filters
+from . import jobs
+from . import metrics
+from . import video_processor
+
+# Limite de requisições que iniciam uploads, por cliente (chave de API ou IP)
+REQUEST_RATE = float(os.environ.get('VIDEO_RATE_REQUESTS_PER_MIN', '60')) / 60
+REQUEST_BURST = float(os.environ.get('VIDEO_RATE_REQUESTS_BURST', '20'))
+# Vazão estimada de um worker, em unidades de custo (megapixels x frames x filtros) por segundo
+WORKER_THROUGHPUT = float(os.environ.get('VIDEO_COST_THROUGHPUT', '150'))
+# Cabeçalho com a chave de API do cliente; sem ele, o cliente é identificado pelo IP
+API_KEY_HEADER = 'X-API-Key'
+# Desativa todos os limites (ex.: instalação com um único usuário)
+ENABLED = os.environ.get('VIDEO_ADMISSION', '1') == '1'
+
+# Classes de prioridade: 'interactive' (uploads acompanhados pelo usuário, previews) é
+# sempre atendida antes de 'batch' (reprocessamentos e cargas em massa).
+#   priority  ordem na fila (maior primeiro)
+#   rate      unidades de custo por segundo repostas no balde de cada cliente
+#   burst     capacidade do balde (custo que um cliente pode enviar de uma vez)
+#   max_cost  jobs mais caros que isso são rebaixados para 'batch' (None = sem limite)
+#   max_wait  espera estimada máxima (s) na fila desta classe antes de recusar (429)
+PriorityClass = namedtuple('PriorityClass', 'name priority rate burst max_cost max_wait')
+PRIORITY_CLASSES = {
+    'interactive': PriorityClass(
+        'interactive', jobs.PRIORITY_INTERACTIVE,
+        float(os.environ.get('VIDEO_COST_RATE_INTERACTIVE', '50')),
+        float(os.environ.get('VIDEO_COST_BURST_INTERACTIVE', '20000')),
+        float(os.environ.get('VIDEO_INTERACTIVE_MAX_COST', '20000')),
+        float(os.environ.get('VIDEO_MAX_WAIT_INTERACTIVE', '300')),
+    ),
+    'batch': PriorityClass(
+        'batch', jobs.PRIORITY_BATCH,
+        float(os.environ.get('VIDEO_COST_RATE_BATCH', '200')),
+        float(os.environ.get('VIDEO_COST_BURST_BATCH', '500000')),
+        None,
+        float(os.environ.get('VIDEO_MAX_WAIT_BATCH', '86400')),
+    ),
+}
+DEFAULT_PRIORITY = 'interactive'
+
+
+class Rejected(Exception):
+    """Requisição recusada por excesso de uso; `retry_after` é a espera sugerida (s)."""
+
+    def __init__(self, message, retry_after, reason):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def validate_priority(name):
+    """Retorna o nome da classe de prioridade (a padrão se vazio) ou lança ValueError."""
+    name = name or DEFAULT_PRIORITY
+    if name not in PRIORITY_CLASSES:
+        raise ValueError(f"Prioridade desconhecida: '{name}' (use {', '.join(PRIORITY_CLASSES)})")
+    return name
+
+
+def client_id():
+    """Identifica o cliente da requisição atual: hash da chave de API ou, sem ela, o IP."""
+    api_key = request.headers.get(API_KEY_HEADER)
+    if api_key:
+        return 'key:' + hashlib.sha256(api_key.encode()).hexdigest()[:16]
+    return f'ip:{request.remote_addr}'
+
+
+def estimate_cost(metadata, filter_names):
+    """
+    Custo estimado de processar o vídeo: megapixels x frames x filtros da cadeia.
+    Proporcional ao tempo de decodificação, filtragem e codificação. `filter_names`
+    é uma cadeia ou uma lista delas (uma por saída, somadas).
+    """
+    if isinstance(filter_names, str):
+        filter_names = [filter_names]
+    megapixels = (metadata.get('width') or 0) * (metadata.get('height') or 0) / 1e6
+    frames = metadata.get('frame_count') or (metadata.get('duration_sec') or 0) * (metadata.get('fps') or 0)
+    steps = sum(max(1, len(filters.parse_chain(name))) for name in filter_names)
+    return round(megapixels * frames * steps, 3)
+
+
+def check_request_rate():
+    """Consome uma ficha do limite de requisições do cliente (Rejected se esgotado)."""
+    if not ENABLED:
+        return
+    ok, wait = db.take_tokens(f'req:{client_id()}', 1, REQUEST_RATE, REQUEST_BURST, time.time())
+    if not ok:
+        metrics.inc('video_admission_rejected_total', reason='rate', priority='-')
+        raise Rejected('Muitas requisições. Tente novamente mais tarde.', wait, 'rate')
+
+
+def admit(video_path, filter_names, priority):
+    """
+    Decide se o processamento do vídeo pode ser enfileirado. Retorna
+    {'priority', 'cost', 'bucket'} (a classe pode ter sido rebaixada para 'batch')
+    ou lança Rejected quando o balde do cliente ou a fila da classe não comportam o job.
+    """
+    return admit_metadata(video_processor.get_video_metadata(video_path), filter_names, priority)
+
+
+def admit_metadata(metadata, filter_names, priority):
+    """Como admit, a partir dos metadados já conhecidos (ex.: de um vídeo registrado)."""
+    cost = estimate_cost(metadata, filter_names)
+    cls = PRIORITY_CLASSES[priority]
+    if cls.max_cost is not None and cost > cls.max_cost:
+        # Um job longo não pode atrasar os demais uploads interativos
+        cls = PRIORITY_CLASSES['batch']
+    ticket = {'priority': cls.name, 'cost': cost, 'bucket': None}
+    if not ENABLED:
+        return ticket
+
+    # Capacidade: tempo estimado para esvaziar a fila desta classe (e das superiores)
+    wait = db.pending_job_cost(cls.priority) / (WORKER_THROUGHPUT * max(1, jobs.JOB_WORKERS))
+    if wait > cls.max_wait:
+        metrics.inc('video_admission_rejected_total', reason='capacity', priority=cls.name)
+        raise Rejected('Servidor sobrecarregado. Tente novamente mais tarde.', wait - cls.max_wait, 'capacity')
+
+    # Um job maior que o balde é aceito com o balde cheio, deixando o saldo negativo
+    bucket = f'cost:{cls.name}:{client_id()}'
+    ok, retry = db.take_tokens(bucket, cost, cls.rate, cls.burst, time.time())
+    if not ok:
+        metrics.inc('video_admission_rejected_total', reason='cost', priority=cls.name)
+        raise Rejected('Limite de processamento do cliente atingido. Tente novamente mais tarde.', retry, 'cost')
+    ticket['bucket'] = bucket
+    return ticket
+
+
+def refund(ticket):
+    """Devolve o custo de um job que não será processado (ex.: resultado reaproveitado)."""
+    if ticket and ticket.get('bucket'):
+        cls = PRIORITY_CLASSES[ticket['priority']]
+        db.return_tokens(ticket['bucket'], ticket['cost'], cls.burst)
+
+
+def rejected_response(error):
+    """Resposta 429 com Retry-After (segundos inteiros) para uma requisição recusada."""
+    retry_after = max(1, math.ceil(error.retry_after))
+    response = jsonify({'error': str(error), 'reason': error.reason, 'retry_after': retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
@@ -1,23 +1,78 @@
-from flask import Flask
+import os
+from flask import Flask, request, jsonify
 from . import database as db
 from . import storage
+from . import jobs
+from . import utils
 from .routes import bp
 
-def create_app():
+# Papel do processo: 'all' atende todas as rotas; 'upload' recebe uploads e atende a API
+# (sem /media); 'media' atende apenas /media. Permite pools de workers separados atrás
+# de um proxy reverso, para que downloads longos não ocupem os workers de upload.
+SERVER_ROLE = os.environ.get('VIDEO_SERVER_ROLE', 'all')
+ROLES = ('all', 'upload', 'media')
+# Tamanho máximo do corpo de uma requisição (uploads maiores recebem 413)
+MAX_UPLOAD_BYTES = int(os.environ.get('VIDEO_MAX_UPLOAD_MB', '4096')) * 1024 * 1024
+# Os workers de mídia não recebem corpos de requisição
+MEDIA_MAX_BODY_BYTES = 64 * 1024
+
+# Rotas atendidas por cada papel (além de /metrics, atendida por todos)
+MEDIA_ENDPOINTS = ('routes.serve_media', 'routes.serve_derived')
+SHARED_ENDPOINTS = ('routes.get_metrics', 'static')
+
+
+def _role_guard(role):
+    """Recusa (421) as rotas que não pertencem ao papel deste processo."""
+    def guard():
+        endpoint = request.endpoint
+        if endpoint is None or endpoint in SHARED_ENDPOINTS:
+            return None
+        is_media = endpoint in MEDIA_ENDPOINTS
+        if (role == 'media') != is_media:
+            return jsonify({'error': f"Esta rota não é atendida pelos workers de '{role}'"}), 421
+        return None
+    return guard
+
+
+def create_app(role=None):
     """Cria e configura a aplicação Flask."""
+    role = role or SERVER_ROLE
+    if role not in ROLES:
+        raise ValueError(f"Papel do servidor desconhecido: '{role}' (use {', '.join(ROLES)})")
+
     app = Flask(__name__)
-    
+    app.config['SERVER_ROLE'] = role
+    app.config['MAX_CONTENT_LENGTH'] = MEDIA_MAX_BODY_BYTES if role == 'media' else MAX_UPLOAD_BYTES
+
     # Registra o Blueprint com as rotas
     app.register_blueprint(bp)
-    
+    if role != 'all':
+        app.before_request(_role_guard(role))
+
     with app.app_context():
-        # Inicializa o banco de dados e as pastas na primeira execução
+        initialize()
+
+    return app
+
+
+def initialize():
+    """
+    Inicializa o banco de dados e as pastas na primeira execução. Com vários
+    workers iniciando ao mesmo tempo, a trava faz com que um de cada vez o faça.
+    """
+    with utils.file_lock(db.DATABASE_PATH + '.init.lock'):
         storage.setup_directories()
         db.init_db()
-        
-    return app
 
 if __name__ == '__main__':
+    # Servidor de desenvolvimento; em produção use "python -m servidor.serve"
+    debug = os.environ.get('VIDEO_DEBUG', '1') == '1'
     app = create_app()
+
+    # Com o reloader do modo debug ativo, o script roda em dois processos;
+    # o pool de workers só é iniciado no processo que atende as requisições.
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        jobs.start_worker_pool()
+
     # Executa o servidor em todas as interfaces de rede na porta 5000
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=debug)
@@ -1,28 +1,200 @@
 import sqlite3
 import os
+import json
+import time
+import queue
+import atexit
+import threading
+
+from . import metrics
 
 # Define o caminho do banco de dados na pasta do servidor
 DATABASE_PATH = os.path.join(os.path.dirname(__file__), 'videos.db')
 
-def get_db_connection():
-    """Cria e retorna uma conexão com o banco de dados."""
-    conn = sqlite3.connect(DATABASE_PATH)
+# Tempo máximo (ms) que uma conexão espera por um lock antes de falhar com "database is locked"
+BUSY_TIMEOUT_MS = int(os.environ.get('VIDEO_DB_BUSY_TIMEOUT_MS', '5000'))
+# Cache de páginas por conexão, em KiB
+CACHE_SIZE_KB = int(os.environ.get('VIDEO_DB_CACHE_KB', '16384'))
+# Região do arquivo mapeada em memória para leituras, em bytes
+MMAP_SIZE = int(os.environ.get('VIDEO_DB_MMAP_SIZE', str(256 * 1024 * 1024)))
+# Quantidade de comandos preparados mantidos em cache por conexão
+STATEMENT_CACHE_SIZE = 256
+# Máximo de escritas agrupadas em uma única transação pelo escritor em lote
+WRITE_BATCH_SIZE = int(os.environ.get('VIDEO_DB_WRITE_BATCH', '100'))
+
+_local = threading.local()
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def _connect(path=None):
+    """Abre uma conexão nova já configurada (WAL e PRAGMAs de desempenho)."""
+    conn = sqlite3.connect(
+        path or DATABASE_PATH,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE
+    )
     conn.row_factory = sqlite3.Row  # Permite acessar colunas por nome
+    # WAL permite leituras simultâneas a uma escrita; com ele, synchronous=NORMAL
+    # continua seguro contra corrupção e evita um fsync a cada commit
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store = MEMORY')
     return conn
 
-def init_db():
-    """Inicializa o banco de dados, criando a tabela de vídeos se não existir."""
-    if os.path.exists(DATABASE_PATH):
-        print("Banco de dados já existe.")
-        return
-
-    print("Criando banco de dados...")
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Script SQL para criar a tabela conforme especificado
-    cursor.execute("""
-    CREATE TABLE videos (
+def get_db_connection():
+    """
+    Retorna a conexão da thread atual, criada na primeira chamada e reaproveitada
+    nas seguintes (junto com o cache de comandos preparados). Uma conexão nunca é
+    compartilhada entre threads nem herdada por processos filhos.
+    """
+    key = (os.getpid(), DATABASE_PATH)
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.key != key:
+        conn = _connect()
+        _local.conn = conn
+        _local.key = key
+    return conn
+
+def close_db_connection():
+    """Fecha a conexão da thread atual, se houver."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.key[0] == os.getpid():
+        conn.close()
+    _local.conn = None
+
+# --- Escritas em lote ---
+
+class PendingWrite:
+    """Escrita enviada ao WriteBatcher; wait() bloqueia até o commit e retorna o rowcount."""
+
+    def __init__(self, statements):
+        self.statements = statements
+        self.rowcount = None
+        self.error = None
+        self.done = threading.Event()
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.rowcount
+
+
+class WriteBatcher:
+    """
+    Thread única de escrita do processo. As escritas enfileiradas por qualquer
+    thread são agrupadas em uma transação (commit em grupo): enquanto um lote é
+    gravado, as próximas escritas se acumulam na fila e entram no lote seguinte.
+    Cada escrita roda em um SAVEPOINT, então a falha de uma não desfaz as demais.
+    """
+
+    def __init__(self, path, batch_size=None):
+        self.path = path
+        self.batch_size = batch_size or WRITE_BATCH_SIZE
+        self.queue = queue.Queue()
+        self.pid = os.getpid()
+        self.thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self.thread.start()
+
+    def submit(self, statements):
+        """Enfileira uma lista de (sql, parâmetros) executada atomicamente."""
+        pending = PendingWrite(statements)
+        self.queue.put(pending)
+        return pending
+
+    def flush(self):
+        """Aguarda a gravação de todas as escritas enfileiradas até agora."""
+        self.submit([]).wait()
+
+    def _run(self):
+        conn = _connect(self.path)
+        conn.isolation_level = None  # Transações controladas explicitamente
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit(conn, batch)
+
+    def _commit(self, conn, batch):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for pending in batch:
+                conn.execute('SAVEPOINT write')
+                try:
+                    rowcount = 0
+                    for sql, params in pending.statements:
+                        rowcount = conn.execute(sql, params).rowcount
+                    pending.rowcount = rowcount
+                    conn.execute('RELEASE write')
+                except sqlite3.Error as e:
+                    conn.execute('ROLLBACK TO write')
+                    conn.execute('RELEASE write')
+                    pending.error = e
+            conn.execute('COMMIT')
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            for pending in batch:
+                pending.error = pending.error or e
+        for pending in batch:
+            if pending.error is not None:
+                print(f"Erro ao gravar no banco de dados: {pending.error}")
+            pending.done.set()
+
+
+def _get_batcher():
+    """Retorna o escritor em lote deste processo (criado sob demanda)."""
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None or _batcher.pid != os.getpid() or _batcher.path != DATABASE_PATH:
+            _batcher = WriteBatcher(DATABASE_PATH)
+        return _batcher
+
+def _write(sql, params=(), wait=True):
+    """
+    Executa uma escrita pelo escritor em lote. Com `wait=True` retorna o rowcount
+    após o commit (e propaga o erro, se houver); com `wait=False` retorna na hora.
+    """
+    return _write_all([(sql, params)], wait)
+
+def _write_all(statements, wait=True):
+    """Como _write, mas executa vários comandos atomicamente; retorna o rowcount do último."""
+    if not wait:
+        _get_batcher().submit(statements)
+        return None
+    started = time.perf_counter()
+    try:
+        return _get_batcher().submit(statements).wait()
+    finally:
+        # Inclui a espera pelo commit em grupo: é a latência percebida por quem escreve
+        metrics.observe('video_db_seconds', time.perf_counter() - started, op='write')
+
+def flush_writes():
+    """Aguarda a gravação das escritas pendentes deste processo."""
+    if _batcher is not None and _batcher.pid == os.getpid():
+        _batcher.flush()
+
+atexit.register(flush_writes)
+
+def pending_writes():
+    """Quantidade de escritas na fila do escritor em lote deste processo."""
+    if _batcher is None or _batcher.pid != os.getpid():
+        return 0
+    return _batcher.queue.qsize()
+
+# --- Esquema e migrações ---
+
+def _migration_videos(conn):
+    """cria a tabela 'videos'"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS videos (
         id TEXT PRIMARY KEY,
         original_name TEXT NOT NULL,
         original_ext TEXT NOT NULL,
@@ -36,23 +208,256 @@ def init_db():
         created_at TEXT NOT NULL,
         path_original TEXT NOT NULL,
         path_processed TEXT NOT NULL
-    );
+    )
+    """)
+
+def _migration_jobs(conn):
+    """cria a fila de processamento (jobs)"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        video_id TEXT NOT NULL,
+        state TEXT NOT NULL,
+        progress REAL NOT NULL DEFAULT 0,
+        payload TEXT NOT NULL,
+        error TEXT,
+        worker TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT NOT NULL,
+        started_at TEXT,
+        updated_at TEXT,
+        finished_at TEXT
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state_created ON jobs (state, created_at)")
+
+def _migration_dedup(conn):
+    """adiciona 'videos.checksum' e o cache de resultados"""
+    columns = [row['name'] for row in conn.execute("PRAGMA table_info(videos)")]
+    if 'checksum' not in columns:
+        conn.execute("ALTER TABLE videos ADD COLUMN checksum TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_videos_checksum ON videos (checksum)")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS results (
+        cache_key TEXT PRIMARY KEY,
+        checksum TEXT NOT NULL,
+        filter TEXT NOT NULL,
+        video_id TEXT NOT NULL,
+        path_processed TEXT NOT NULL,
+        path_thumbnail TEXT,
+        path_preview TEXT,
+        metadata TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )
     """)
-    
-    conn.commit()
-    conn.close()
-    print("Banco de dados e tabela 'videos' criados com sucesso.")
-
-def add_video_record(metadata):
-    """Adiciona um novo registro de vídeo ao banco de dados."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-    INSERT INTO videos (
-        id, original_name, original_ext, mime_type, size_bytes, duration_sec, 
-        fps, width, height, filter, created_at, path_original, path_processed
-    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_results_checksum ON results (checksum)")
+
+def _migration_uploads(conn):
+    """cria a tabela das sessões de upload em partes"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS uploads (
+        id TEXT PRIMARY KEY,
+        filename TEXT NOT NULL,
+        size_bytes INTEGER NOT NULL,
+        mime_type TEXT,
+        filter TEXT NOT NULL,
+        segments INTEGER,
+        state TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    )
+    """)
+
+def _migration_media_etags(conn):
+    """cria a tabela de hashes dos arquivos servidos em /media (ETags)"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS media_etags (
+        path TEXT PRIMARY KEY,
+        size_bytes INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        sha256 TEXT NOT NULL
+    )
+    """)
+
+def _migration_listing_indexes(conn):
+    """cria os índices da listagem paginada de vídeos"""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_videos_created_id ON videos (created_at DESC, id DESC)")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_videos_filter_created_id ON videos (filter, created_at DESC, id DESC)"
+    )
+
+def _migration_video_streams(conn):
+    """adiciona 'videos.streams' (manifestos HLS/DASH)"""
+    conn.execute("ALTER TABLE videos ADD COLUMN streams TEXT")
+
+def _migration_upload_profile(conn):
+    """adiciona 'uploads.profile' (perfil de codificação)"""
+    conn.execute("ALTER TABLE uploads ADD COLUMN profile TEXT")
+
+def _migration_derivatives(conn):
+    """cria o índice LRU das derivadas (thumbnails, sprites e previews sob demanda)"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS derivatives (
+        path TEXT PRIMARY KEY,
+        video_id TEXT NOT NULL,
+        size_bytes INTEGER NOT NULL,
+        created_at TEXT NOT NULL,
+        last_access TEXT NOT NULL
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_derivatives_last_access ON derivatives (last_access)")
+
+def _migration_posix_paths(conn):
+    """grava os caminhos de mídia com '/' (chaves do armazenamento) também nos registros antigos"""
+    for table, columns in (('videos', ('path_original', 'path_processed')),
+                           ('results', ('path_processed', 'path_thumbnail', 'path_preview'))):
+        for column in columns:
+            conn.execute(f"UPDATE {table} SET {column} = REPLACE({column}, '\\', '/') WHERE {column} LIKE '%\\%'")
+    # Os hashes guardados com o caminho antigo são recalculados no próximo acesso
+    conn.execute("DELETE FROM media_etags WHERE path LIKE '%\\%'")
+
+def _migration_admission(conn):
+    """adiciona prioridade e custo estimado aos jobs e os baldes de limite de uso por cliente"""
+    conn.execute("ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 0")
+    conn.execute("ALTER TABLE jobs ADD COLUMN cost REAL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state_priority ON jobs (state, priority DESC, created_at)")
+    conn.execute("ALTER TABLE uploads ADD COLUMN priority TEXT")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS rate_limits (
+        bucket TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated_at REAL NOT NULL
+    )
+    """)
+
+def _migration_video_changes(conn):
+    """cria o registro de alterações dos vídeos (GET /videos/changes, sincronização incremental)"""
+    # Uma linha por vídeo, com o número da sua alteração mais recente: um cliente que
+    # parou no número N recebe exatamente os vídeos alterados depois dele
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS video_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        video_id TEXT NOT NULL UNIQUE,
+        op TEXT NOT NULL
+    )
+    """)
+    for event, op, row in (('INSERT', 'upsert', 'NEW'), ('UPDATE', 'upsert', 'NEW'), ('DELETE', 'delete', 'OLD')):
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS video_changes_{event.lower()} AFTER {event} ON videos
+        BEGIN
+            DELETE FROM video_changes WHERE video_id = {row}.id;
+            INSERT INTO video_changes (video_id, op) VALUES ({row}.id, '{op}');
+        END
+        """)
+    conn.execute("""
+    INSERT INTO video_changes (video_id, op)
+    SELECT id, 'upsert' FROM videos ORDER BY created_at, id
+    """)
+
+def _migration_renditions(conn):
+    """cria a tabela de saídas (renditions) de cada vídeo e as saídas extras das sessões de upload"""
+    # Uma linha por combinação de filtro e perfil gerada para o vídeo; a saída principal
+    # continua também em videos.path_processed
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS renditions (
+        id TEXT PRIMARY KEY,
+        video_id TEXT NOT NULL REFERENCES videos (id),
+        filter TEXT NOT NULL,
+        profile TEXT,
+        path TEXT NOT NULL,
+        width INTEGER,
+        height INTEGER,
+        fps REAL,
+        size_bytes INTEGER,
+        created_at TEXT NOT NULL
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_renditions_video ON renditions (video_id, created_at)")
+    # Vídeos anteriores: a saída única vira a primeira rendition (o perfil usado não foi registrado)
+    conn.execute("""
+    INSERT INTO renditions (id, video_id, filter, profile, path, width, height, fps, created_at)
+    SELECT lower(hex(randomblob(16))), id, filter, NULL, path_processed, width, height, fps, created_at
+    FROM videos
+    """)
+    conn.execute("ALTER TABLE uploads ADD COLUMN outputs TEXT")
+
+def _migration_rendition_unique(conn):
+    """torna única cada saída (vídeo, filtro, perfil) em renditions"""
+    # Jobs repetidos (reenfileirados ou reenviados) gravavam a mesma saída mais de uma vez:
+    # fica a linha mais recente de cada uma
+    conn.execute("""
+    DELETE FROM renditions WHERE rowid NOT IN (
+        SELECT MAX(rowid) FROM renditions GROUP BY video_id, filter, profile
+    )
+    """)
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_renditions_output ON renditions (video_id, filter, profile)"
+    )
+
+# Migrações em ordem: a versão do esquema (PRAGMA user_version) é a quantidade já aplicada.
+# Novas alterações de esquema devem ser adicionadas sempre ao final da lista.
+# As migrações usam IF NOT EXISTS para também atualizar bancos criados antes do versionamento.
+MIGRATIONS = [
+    _migration_videos,
+    _migration_jobs,
+    _migration_dedup,
+    _migration_uploads,
+    _migration_media_etags,
+    _migration_listing_indexes,
+    _migration_video_streams,
+    _migration_upload_profile,
+    _migration_derivatives,
+    _migration_posix_paths,
+    _migration_admission,
+    _migration_video_changes,
+    _migration_renditions,
+    _migration_rendition_unique,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def init_db():
+    """
+    Cria o banco de dados (se necessário) e aplica as migrações pendentes.
+    Tudo acontece em uma única transação BEGIN IMMEDIATE, então vários processos
+    iniciando ao mesmo tempo aplicam cada migração exatamente uma vez.
+    """
+    conn = _connect()
+    conn.isolation_level = None
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version > SCHEMA_VERSION:
+            raise RuntimeError(
+                f"Banco de dados na versão {version}, mais nova que a suportada ({SCHEMA_VERSION})"
+            )
+        if version == SCHEMA_VERSION:
+            conn.execute('ROLLBACK')
+            print(f"Banco de dados já existe (esquema na versão {version}).")
+            return
+
+        for number in range(version, SCHEMA_VERSION):
+            migration = MIGRATIONS[number]
+            print(f"Aplicando migração {number + 1}: {migration.__doc__}")
+            migration(conn)
+        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        conn.execute('COMMIT')
+        print(f"Banco de dados atualizado para a versão {SCHEMA_VERSION}.")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+# --- Vídeos ---
+
+def add_video_record(metadata, replace=False):
+    """Adiciona um novo registro de vídeo ao banco de dados (ou o substitui, com `replace=True`)."""
+    _write(f"""
+    INSERT {'OR REPLACE ' if replace else ''}INTO videos (
+        id, original_name, original_ext, mime_type, size_bytes, duration_sec,
+        fps, width, height, filter, created_at, path_original, path_processed, checksum, streams
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     """, (
         metadata['id'],
         metadata['original_name'],
@@ -66,15 +471,429 @@ def add_video_record(metadata):
         metadata.get('filter'),
         metadata['created_at'],
         metadata['path_original'],
-        metadata['path_processed']
+        metadata['path_processed'],
+        metadata.get('checksum'),
+        json.dumps(metadata['streams']) if metadata.get('streams') else None
     ))
-    
-    conn.commit()
-    conn.close()
 
 def get_all_videos():
     """Retorna todos os registros de vídeos do banco de dados."""
     conn = get_db_connection()
     videos = conn.execute('SELECT * FROM videos ORDER BY created_at DESC').fetchall()
-    conn.close()
-    return [dict(video) for video in videos]
\ No newline at end of file
+    return [dict(video) for video in videos]
+
+# Colunas que podem ser solicitadas na listagem paginada (projeção)
+VIDEO_COLUMNS = (
+    'id', 'original_name', 'original_ext', 'mime_type', 'size_bytes', 'duration_sec', 'fps',
+    'width', 'height', 'filter', 'created_at', 'path_original', 'path_processed', 'checksum', 'streams'
+)
+
+@metrics.timed('video_db_seconds', op='list_videos')
+def list_videos(limit=50, after=None, filter_name=None, since=None, until=None,
+                min_duration=None, max_duration=None, min_width=None, max_width=None,
+                min_height=None, max_height=None, columns=None):
+    """
+    Lista vídeos do mais recente para o mais antigo usando paginação por chave
+    (keyset): `after` é o par (created_at, id) do último item da página anterior.
+    `since` é inclusivo e `until` exclusivo. Retorna (vídeos, chave do último item
+    ou None se não houver mais páginas).
+    """
+    selected = [c for c in VIDEO_COLUMNS if columns is None or c in columns]
+    # created_at e id são necessários para montar o cursor da próxima página
+    for required in ('created_at', 'id'):
+        if required not in selected:
+            selected.append(required)
+
+    conditions, params = [], []
+    if after is not None:
+        conditions.append("(created_at, id) < (?, ?)")
+        params.extend(after)
+    for clause, value in (
+        ("filter = ?", filter_name),
+        ("created_at >= ?", since),
+        ("created_at < ?", until),
+        ("duration_sec >= ?", min_duration),
+        ("duration_sec <= ?", max_duration),
+        ("width >= ?", min_width),
+        ("width <= ?", max_width),
+        ("height >= ?", min_height),
+        ("height <= ?", max_height),
+    ):
+        if value is not None:
+            conditions.append(clause)
+            params.append(value)
+
+    query = f"SELECT {', '.join(selected)} FROM videos"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    # Busca um item a mais para saber se existe uma próxima página
+    query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    conn = get_db_connection()
+    rows = conn.execute(query, params).fetchall()
+
+    videos = [dict(row) for row in rows[:limit]]
+    for video in videos:
+        if video.get('streams'):
+            video['streams'] = json.loads(video['streams'])
+    last_key = None
+    if len(rows) > limit:
+        last_key = (videos[-1]['created_at'], videos[-1]['id'])
+    return videos, last_key
+
+def get_videos_version():
+    """
+    Número da última alteração nos vídeos (inclusão, atualização ou remoção, por
+    qualquer processo); muda sempre que add_video_record grava. Usado para invalidar
+    as respostas em cache.
+    """
+    conn = get_db_connection()
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM video_changes").fetchone()[0]
+
+@metrics.timed('video_db_seconds', op='list_video_changes')
+def list_video_changes(since=0, limit=500, columns=None):
+    """
+    Retorna os vídeos alterados depois do número de alteração `since`, na ordem
+    das alterações: [{'seq', 'op' ('upsert' ou 'delete'), 'id', 'video' (dados
+    atuais; None se removido)}], e se há mais alterações além do limite.
+    """
+    selected = [c for c in VIDEO_COLUMNS if columns is None or c in columns]
+    if 'id' not in selected:
+        selected.append('id')
+    conn = get_db_connection()
+    rows = conn.execute(f"""
+    SELECT c.seq AS change_seq, c.op AS change_op, c.video_id AS change_video_id,
+           {', '.join(f'v.{column}' for column in selected)}
+    FROM video_changes c LEFT JOIN videos v ON v.id = c.video_id
+    WHERE c.seq > ? ORDER BY c.seq LIMIT ?
+    """, (since, limit + 1)).fetchall()
+
+    changes = []
+    for row in rows[:limit]:
+        video = None
+        if row['change_op'] == 'upsert' and row['id'] is not None:
+            video = {column: row[column] for column in selected}
+            if video.get('streams'):
+                video['streams'] = json.loads(video['streams'])
+        changes.append({
+            'seq': row['change_seq'],
+            'op': 'upsert' if video is not None else 'delete',
+            'id': row['change_video_id'],
+            'video': video,
+        })
+    return changes, len(rows) > limit
+
+@metrics.timed('video_db_seconds', op='get_video')
+def get_video(video_id):
+    """Retorna um vídeo pelo ID, ou None se não existir."""
+    conn = get_db_connection()
+    row = conn.execute("SELECT * FROM videos WHERE id = ?", (video_id,)).fetchone()
+    return dict(row) if row else None
+
+def find_video_by_checksum(checksum):
+    """Retorna o vídeo mais antigo com o conteúdo original informado, ou None."""
+    conn = get_db_connection()
+    row = conn.execute(
+        "SELECT * FROM videos WHERE checksum = ? ORDER BY created_at LIMIT 1", (checksum,)
+    ).fetchone()
+    return dict(row) if row else None
+
+# --- ETags dos arquivos de mídia ---
+
+def get_media_etag(path):
+    """Retorna o hash registrado para um arquivo de mídia (caminho relativo), ou None."""
+    conn = get_db_connection()
+    row = conn.execute("SELECT * FROM media_etags WHERE path = ?", (path,)).fetchone()
+    return dict(row) if row else None
+
+def set_media_etag(path, size_bytes, mtime_ns, sha256):
+    """Registra o hash de uma versão (tamanho + mtime) de um arquivo de mídia, sem aguardar o commit."""
+    _write(
+        "INSERT OR REPLACE INTO media_etags (path, size_bytes, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+        (path, size_bytes, mtime_ns, sha256), wait=False
+    )
+
+# --- Derivadas geradas sob demanda (cache LRU em disco) ---
+
+def add_derivative(path, video_id, size_bytes, now):
+    """Registra uma derivada recém-gerada no índice LRU."""
+    _write(
+        "INSERT OR REPLACE INTO derivatives (path, video_id, size_bytes, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+        (path, video_id, size_bytes, now, now)
+    )
+
+def touch_derivative(path, now):
+    """Atualiza o último acesso de uma derivada, sem aguardar o commit."""
+    _write("UPDATE derivatives SET last_access = ? WHERE path = ?", (now, path), wait=False)
+
+def get_derivatives_size():
+    """Retorna o espaço total (bytes) ocupado pelas derivadas registradas."""
+    conn = get_db_connection()
+    return conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM derivatives").fetchone()[0]
+
+def get_oldest_derivatives(limit=100):
+    """Retorna as derivadas acessadas há mais tempo (candidatas à remoção)."""
+    conn = get_db_connection()
+    rows = conn.execute(
+        "SELECT path, size_bytes FROM derivatives ORDER BY last_access LIMIT ?", (limit,)
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+def delete_derivatives(paths):
+    """Remove derivadas do índice LRU (e as ETags guardadas para elas)."""
+    statements = []
+    for path in paths:
+        statements.append(("DELETE FROM derivatives WHERE path = ?", (path,)))
+        statements.append(("DELETE FROM media_etags WHERE path = ?", (path,)))
+    if statements:
+        _write_all(statements)
+
+# --- Saídas (renditions) de cada vídeo ---
+
+def add_rendition(rendition):
+    """
+    Registra uma saída gerada para um vídeo (filtro + perfil de codificação). Se a
+    saída já estiver registrada (ex.: job repetido), atualiza o arquivo e as dimensões.
+    """
+    _write("""
+    INSERT INTO renditions (id, video_id, filter, profile, path, width, height, fps, size_bytes, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (video_id, filter, profile) DO UPDATE SET
+        path = excluded.path, width = excluded.width, height = excluded.height,
+        fps = excluded.fps, size_bytes = excluded.size_bytes
+    """, (
+        rendition['id'],
+        rendition['video_id'],
+        rendition['filter'],
+        rendition.get('profile'),
+        rendition['path'],
+        rendition.get('width'),
+        rendition.get('height'),
+        rendition.get('fps'),
+        rendition.get('size_bytes'),
+        rendition['created_at'],
+    ))
+
+def get_renditions(video_id):
+    """Retorna as saídas de um vídeo, da mais antiga para a mais recente."""
+    conn = get_db_connection()
+    rows = conn.execute(
+        "SELECT * FROM renditions WHERE video_id = ? ORDER BY created_at, rowid", (video_id,)
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+# --- Cache de resultados (deduplicação de processamentos) ---
+
+def get_result(cache_key):
+    """Retorna o resultado de processamento armazenado para a chave, ou None."""
+    conn = get_db_connection()
+    row = conn.execute("SELECT * FROM results WHERE cache_key = ?", (cache_key,)).fetchone()
+    if row is None:
+        return None
+    result = dict(row)
+    result['metadata'] = json.loads(result['metadata'])
+    return result
+
+def add_result(result):
+    """Registra (ou substitui) o resultado de um processamento no cache."""
+    _write("""
+    INSERT OR REPLACE INTO results (
+        cache_key, checksum, filter, video_id, path_processed, path_thumbnail,
+        path_preview, metadata, created_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (
+        result['cache_key'],
+        result['checksum'],
+        result['filter'],
+        result['video_id'],
+        result['path_processed'],
+        result.get('path_thumbnail'),
+        result.get('path_preview'),
+        json.dumps(result['metadata']),
+        result['created_at']
+    ))
+
+# --- Sessões de upload em partes ---
+
+def add_upload_session(session):
+    """Registra uma nova sessão de upload em partes no estado 'open'."""
+    _write("""
+    INSERT INTO uploads (id, filename, size_bytes, mime_type, filter, segments, profile, priority, outputs,
+                         state, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'open', ?, ?)
+    """, (
+        session['id'],
+        session['filename'],
+        session['size_bytes'],
+        session.get('mime_type'),
+        session['filter'],
+        session.get('segments'),
+        session.get('profile'),
+        session.get('priority'),
+        json.dumps(session['outputs']) if session.get('outputs') else None,
+        session['created_at'],
+        session['created_at']
+    ))
+
+def get_upload_session(upload_id):
+    """Retorna uma sessão de upload pelo ID, ou None se não existir."""
+    conn = get_db_connection()
+    row = conn.execute("SELECT * FROM uploads WHERE id = ?", (upload_id,)).fetchone()
+    if row is None:
+        return None
+    session = dict(row)
+    session['outputs'] = json.loads(session['outputs']) if session.get('outputs') else []
+    return session
+
+def touch_upload_session(upload_id, now):
+    """Atualiza o horário da última parte recebida de um upload, sem aguardar o commit."""
+    _write("UPDATE uploads SET updated_at = ? WHERE id = ?", (now, upload_id), wait=False)
+
+def finish_upload_session(upload_id, now, state='complete'):
+    """
+    Encerra um upload em partes ('complete' ou 'rejected', se o arquivo não for um vídeo).
+    Retorna False se ele já havia sido encerrado.
+    """
+    rowcount = _write(
+        "UPDATE uploads SET state = ?, updated_at = ? WHERE id = ? AND state = 'open'", (state, now, upload_id)
+    )
+    return rowcount == 1
+
+# --- Fila de processamento (jobs) ---
+
+def _job_to_dict(row):
+    """Converte uma linha da tabela jobs em dicionário, decodificando o payload."""
+    job = dict(row)
+    job['payload'] = json.loads(job['payload'])
+    return job
+
+def add_job(job_id, video_id, payload, created_at, priority=0, cost=None):
+    """Insere um novo job na fila com o estado 'queued'."""
+    _write("""
+    INSERT INTO jobs (id, video_id, state, progress, payload, created_at, updated_at, priority, cost)
+    VALUES (?, ?, 'queued', 0, ?, ?, ?, ?, ?)
+    """, (job_id, video_id, json.dumps(payload), created_at, created_at, priority, cost))
+
+@metrics.timed('video_db_seconds', op='claim_next_job')
+def claim_next_job(worker, now, priority_floor=None, max_below_floor=None):
+    """
+    Reserva atomicamente o job de maior prioridade (e, entre eles, o mais antigo)
+    para o worker informado. Com `priority_floor`, jobs de prioridade menor só são
+    reservados enquanto menos de `max_below_floor` deles estiverem em execução.
+    Retorna o job (já no estado 'running') ou None se a fila estiver vazia.
+    """
+    conn = get_db_connection()
+    # O bloco `with` faz commit ao sair (ou rollback em caso de erro), liberando o lock
+    with conn:
+        # BEGIN IMMEDIATE garante que dois workers não reservem o mesmo job
+        conn.execute('BEGIN IMMEDIATE')
+        query, params = "SELECT * FROM jobs WHERE state = 'queued'", []
+        if priority_floor is not None:
+            running_below = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state = 'running' AND priority < ?", (priority_floor,)
+            ).fetchone()[0]
+            if running_below >= max_below_floor:
+                query += " AND priority >= ?"
+                params.append(priority_floor)
+        row = conn.execute(query + " ORDER BY priority DESC, created_at LIMIT 1", params).fetchone()
+        if row is None:
+            return None
+        conn.execute("""
+        UPDATE jobs SET state = 'running', worker = ?, started_at = ?, updated_at = ?,
+            attempts = attempts + 1
+        WHERE id = ?
+        """, (worker, now, now, row['id']))
+    job = _job_to_dict(row)
+    job.update({'state': 'running', 'worker': worker, 'started_at': now,
+                'updated_at': now, 'attempts': row['attempts'] + 1})
+    return job
+
+def update_job_progress(job_id, progress, now):
+    """Atualiza o progresso (0.0 a 1.0) de um job em execução, sem aguardar o commit."""
+    _write("UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ?", (progress, now, job_id), wait=False)
+
+def finish_job(job_id, state, now, error=None):
+    """Marca um job como concluído ('done') ou com falha ('failed')."""
+    # Passa pela mesma fila das atualizações de progresso, que assim nunca sobrescrevem o estado final
+    _write("""
+    UPDATE jobs SET state = ?, error = ?, updated_at = ?, finished_at = ?,
+        progress = CASE WHEN ? = 'done' THEN 1 ELSE progress END
+    WHERE id = ?
+    """, (state, error, now, now, state, job_id))
+
+def requeue_stale_jobs(cutoff, max_attempts):
+    """
+    Devolve para a fila os jobs 'running' sem atualização desde `cutoff`
+    (ex.: worker encerrado no meio do processamento). Jobs que já esgotaram
+    as tentativas são marcados como 'failed'.
+    """
+    return _write_all([
+        ("""
+        UPDATE jobs SET state = 'failed', error = 'Número máximo de tentativas excedido', finished_at = ?
+        WHERE state = 'running' AND updated_at < ? AND attempts >= ?
+        """, (cutoff, cutoff, max_attempts)),
+        ("""
+        UPDATE jobs SET state = 'queued', worker = NULL, progress = 0
+        WHERE state = 'running' AND updated_at < ?
+        """, (cutoff,)),
+    ])
+
+def pending_job_cost(min_priority):
+    """Custo estimado ainda por processar nos jobs (na fila ou em execução) com prioridade >= min_priority."""
+    conn = get_db_connection()
+    return conn.execute("""
+    SELECT COALESCE(SUM(cost * (1 - progress)), 0) FROM jobs
+    WHERE state IN ('queued', 'running') AND priority >= ?
+    """, (min_priority,)).fetchone()[0]
+
+@metrics.timed('video_db_seconds', op='count_jobs')
+def count_jobs(state):
+    """Retorna quantos jobs estão no estado informado."""
+    conn = get_db_connection()
+    return conn.execute("SELECT COUNT(*) FROM jobs WHERE state = ?", (state,)).fetchone()[0]
+
+def get_job(job_id):
+    """Retorna um job pelo ID, ou None se não existir."""
+    conn = get_db_connection()
+    row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _job_to_dict(row) if row else None
+
+def get_jobs(state=None, limit=100):
+    """Retorna os jobs mais recentes, opcionalmente filtrados por estado."""
+    conn = get_db_connection()
+    if state:
+        rows = conn.execute(
+            "SELECT * FROM jobs WHERE state = ? ORDER BY created_at DESC LIMIT ?", (state, limit)
+        ).fetchall()
+    else:
+        rows = conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+    return [_job_to_dict(row) for row in rows]
+
+# --- Limites de uso (baldes de fichas por cliente) ---
+
+@metrics.timed('video_db_seconds', op='take_tokens')
+def take_tokens(bucket, amount, rate, burst, now):
+    """
+    Balde de fichas compartilhado entre os processos: repõe `rate` fichas por segundo
+    até `burst` e retira `amount` se houver saldo. Um pedido maior que o balde é aceito
+    com o balde cheio (o saldo fica negativo). Retorna (aceito, segundos até haver saldo).
+    """
+    conn = get_db_connection()
+    with conn:
+        # Mesmo lock de escrita de claim_next_job: leitura e atualização do saldo são atômicas
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute("SELECT tokens, updated_at FROM rate_limits WHERE bucket = ?", (bucket,)).fetchone()
+        tokens = burst if row is None else min(burst, row['tokens'] + max(0, now - row['updated_at']) * rate)
+        needed = min(amount, burst)
+        if tokens < needed:
+            return False, (needed - tokens) / rate if rate > 0 else float('inf')
+        conn.execute("""
+        INSERT INTO rate_limits (bucket, tokens, updated_at) VALUES (?, ?, ?)
+        ON CONFLICT(bucket) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at
+        """, (bucket, tokens - amount, now))
+    return True, 0
+
+def return_tokens(bucket, amount, burst):
+    """Devolve fichas a um balde (sem ultrapassar a capacidade)."""
+    _write("UPDATE rate_limits SET tokens = MIN(?, tokens + ?) WHERE bucket = ?", (burst, amount, bucket))
@@ -0,0 +1,255 @@
+import io
+import os
+import re
+import threading
+
+import cv2
+import numpy as np
+from PIL import Image
+from flask import abort
+
+from . import database as db
+from . import storage
+from . import utils
+from . import media
+from . import sampling
+from . import metrics
+
+# Larguras aceitas nas URLs das derivadas (evita que tamanhos arbitrários encham o cache)
+DERIVED_WIDTHS = tuple(int(w) for w in os.environ.get('VIDEO_DERIVED_WIDTHS', '160,320,480,640').split(','))
+# Espaço máximo em disco ocupado pelas derivadas; acima dele, as menos acessadas são removidas
+DERIVED_CACHE_MAX_BYTES = int(os.environ.get('VIDEO_DERIVED_CACHE_MB', '1024')) * 1024 * 1024
+# Após uma remoção, o cache fica com no máximo esta fração do limite (evita remoções a cada acesso)
+EVICT_TARGET = 0.9
+# Frames e intervalo (ms) dos previews animados
+PREVIEW_FRAMES = 30
+PREVIEW_FRAME_MS = 100
+# Grade das sprite sheets (colunas x linhas), usadas para miniaturas ao percorrer a linha do tempo
+SPRITE_COLUMNS = 10
+SPRITE_ROWS = 10
+# Tempo máximo (s) que uma requisição espera por outra que já está gerando a mesma derivada
+COALESCE_TIMEOUT = 120
+
+DERIVED_DIR = 'derived'
+# Tipo de derivada -> formatos aceitos
+FORMATS = {
+    'thumb': ('jpg', 'webp'),
+    'sprite': ('jpg', 'webp'),
+    'preview': ('gif', 'webp'),
+}
+
+# O sufixo -t<ms> (só em thumbs) escolhe o instante do frame; sem ele, vale sampling.THUMBNAIL_POSITION
+_NAME = re.compile(r'^(thumb|sprite|preview)-(\d+)(?:-t(\d+))?\.(jpg|webp|gif)$')
+_UUID = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+
+# Derivadas sendo geradas neste processo: caminho relativo -> Event sinalizado ao terminar
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def parse_name(name):
+    """
+    Interpreta um nome como "thumb-320.jpg", "thumb-320-t1500.jpg", "sprite-160.jpg"
+    ou "preview-320.webp". Retorna (tipo, largura, formato, instante em ms ou None)
+    ou None se o nome não for válido.
+    """
+    match = _NAME.match(name)
+    if not match:
+        return None
+    kind, width, at_ms, fmt = match.group(1), int(match.group(2)), match.group(3), match.group(4)
+    if fmt not in FORMATS[kind] or width not in DERIVED_WIDTHS or (at_ms is not None and kind != 'thumb'):
+        return None
+    return kind, width, fmt, None if at_ms is None else int(at_ms)
+
+
+def name_at(name, seconds):
+    """
+    Acrescenta o instante `seconds` (parâmetro ?t= da URL) ao nome de um thumbnail:
+    ("thumb-320.jpg", "1.5") -> "thumb-320-t1500.jpg". Retorna None se for inválido.
+    """
+    try:
+        at_ms = int(round(float(seconds) * 1000))
+    except (TypeError, ValueError):
+        return None
+    match = _NAME.match(name)
+    if not match or match.group(1) != 'thumb' or match.group(3) is not None or not 0 <= at_ms < 10 ** 9:
+        return None
+    return f"thumb-{match.group(2)}-t{at_ms}.{match.group(4)}"
+
+
+def _resize(frame, width):
+    """Reduz o frame para a largura informada, mantendo a proporção (nunca amplia)."""
+    h, w = frame.shape[:2]
+    if w <= width:
+        return frame
+    return cv2.resize(frame, (width, max(1, round(h * width / w))), interpolation=cv2.INTER_AREA)
+
+
+def _encode_image(frame, fmt):
+    ext = '.jpg' if fmt == 'jpg' else '.webp'
+    ok, data = cv2.imencode(ext, frame)
+    return data.tobytes() if ok else None
+
+
+def build_thumbnail(video_path, width, fmt, index_path=None, at_ms=None):
+    """Thumbnail no instante `at_ms` ou, sem ele, na posição padrão (sampling.frame_at)."""
+    frame = sampling.frame_at(video_path, None if at_ms is None else at_ms / 1000, index_path)
+    return _encode_image(_resize(frame, width), fmt) if frame is not None else None
+
+
+def build_sprite(video_path, width, fmt, index_path=None, at_ms=None):
+    """Sprite sheet: grade SPRITE_COLUMNS x SPRITE_ROWS de frames espaçados ao longo do vídeo."""
+    frames = [_resize(f, width) for f in sampling.sample_evenly(video_path, SPRITE_COLUMNS * SPRITE_ROWS, index_path)]
+    if not frames:
+        return None
+    h, w = frames[0].shape[:2]
+    rows = -(-len(frames) // SPRITE_COLUMNS)
+    sheet = np.zeros((rows * h, SPRITE_COLUMNS * w, 3), np.uint8)
+    for i, frame in enumerate(frames):
+        row, col = divmod(i, SPRITE_COLUMNS)
+        sheet[row * h:(row + 1) * h, col * w:col * w + frame.shape[1]] = frame[:h]
+    return _encode_image(sheet, fmt)
+
+
+def build_preview(video_path, width, fmt, index_path=None, at_ms=None):
+    """Preview animado (GIF ou WebP) com PREVIEW_FRAMES frames espaçados ao longo do vídeo."""
+    images = [
+        Image.fromarray(cv2.cvtColor(_resize(f, width), cv2.COLOR_BGR2RGB))
+        for f in sampling.sample_evenly(video_path, PREVIEW_FRAMES, index_path)
+    ]
+    if not images:
+        return None
+    buffer = io.BytesIO()
+    images[0].save(buffer, format='GIF' if fmt == 'gif' else 'WEBP', save_all=True,
+                   append_images=images[1:], duration=PREVIEW_FRAME_MS, loop=0)
+    return buffer.getvalue()
+
+
+BUILDERS = {
+    'thumb': build_thumbnail,
+    'sprite': build_sprite,
+    'preview': build_preview,
+}
+# Nome da etapa nas métricas de cada tipo de derivada
+STAGES = {
+    'thumb': 'thumbnail',
+    'sprite': 'sprite',
+    'preview': 'preview',
+}
+
+
+def building():
+    """Quantidade de derivadas sendo geradas neste processo."""
+    with _inflight_lock:
+        return len(_inflight)
+
+
+def evict(max_bytes=None):
+    """Remove as derivadas menos acessadas até o cache ficar abaixo de EVICT_TARGET do limite."""
+    max_bytes = DERIVED_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    total = db.get_derivatives_size()
+    if total <= max_bytes:
+        return 0
+
+    removed = 0
+    target = max_bytes * EVICT_TARGET
+    while total > target:
+        oldest = db.get_oldest_derivatives()
+        if not oldest:
+            break
+        paths = []
+        for item in oldest:
+            if total <= target:
+                break
+            try:
+                storage.backend().remove(item['path'])
+            except OSError as e:
+                # Ex.: arquivo aberto no Windows; fica para a próxima remoção
+                print(f"Não foi possível remover a derivada {item['path']}: {e}")
+                continue
+            paths.append(item['path'])
+            total -= item['size_bytes']
+        if not paths:
+            break
+        db.delete_derivatives(paths)
+        removed += len(paths)
+    print(f"Cache de derivadas: {removed} arquivo(s) removido(s), {total / 1024 / 1024:.1f} MB em uso.")
+    return removed
+
+
+def _generate(video, rel_path, kind, width, fmt, at_ms):
+    """Gera a derivada e a grava de forma atômica (arquivo temporário + rename)."""
+    backend = storage.backend()
+    source = backend.fetch(video['path_original'])
+    if source is None:
+        return False
+    index_path = storage.local_path(sampling.index_path_for(video))
+    with metrics.stage(STAGES[kind], video_id=video['id'], derivative=os.path.basename(rel_path)):
+        data = BUILDERS[kind](source, width, fmt, index_path, at_ms)
+    if data is None:
+        return False
+
+    full_path = storage.local_path(rel_path)
+    tmp_path = f"{full_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, full_path)
+    backend.publish(rel_path)
+
+    metrics.inc('video_bytes_total', len(data), direction='out', kind='derivative')
+    db.add_derivative(rel_path, video['id'], len(data), utils.get_current_timestamp())
+    evict()
+    return True
+
+
+def get_derivative(video_id, name):
+    """
+    Retorna a chave (caminho relativo com '/') da derivada, gerando-a se ainda não
+    existir. Requisições simultâneas pela mesma derivada aguardam uma única geração.
+    Retorna None se o vídeo ou o nome forem inválidos ou se a geração falhar.
+    """
+    parsed = parse_name(name)
+    if parsed is None or not _UUID.match(video_id):
+        return None
+    rel_path = '/'.join((DERIVED_DIR, video_id, name))
+    backend = storage.backend()
+
+    if backend.exists(rel_path):
+        db.touch_derivative(rel_path, utils.get_current_timestamp())
+        return rel_path
+
+    with _inflight_lock:
+        event = _inflight.get(rel_path)
+        owner = event is None
+        if owner:
+            event = _inflight[rel_path] = threading.Event()
+
+    if not owner:
+        event.wait(COALESCE_TIMEOUT)
+        return rel_path if backend.exists(rel_path) else None
+
+    try:
+        video = db.get_video(video_id)
+        if video is None or not _generate(video, rel_path, *parsed):
+            return None
+        return rel_path
+    finally:
+        with _inflight_lock:
+            del _inflight[rel_path]
+        event.set()
+
+
+def send_derived(video_id, name, at=None):
+    """
+    Serve uma derivada (gerada no primeiro acesso) com os recursos de media.send_media.
+    `at` (segundos) escolhe o instante de um thumbnail; cada instante é uma derivada própria.
+    """
+    if at is not None:
+        name = name_at(name, at)
+        if name is None:
+            abort(404)
+    rel_path = get_derivative(video_id, name)
+    if rel_path is None:
+        abort(404)
+    # O conteúdo de uma URL de derivada nunca muda: pode ser guardado indefinidamente
+    return media.send_media(rel_path, cache_control=media.IMMUTABLE_CACHE_CONTROL)
@@ -0,0 +1,402 @@
+import os
+
+import cv2
+import numpy as np
+
+# Separadores da sintaxe de cadeias: "resize:width=640|grayscale|edges:low=50,high=150"
+CHAIN_SEPARATOR = '|'
+PARAMS_SEPARATOR = ':'
+
+# Backend dos filtros no processamento dos vídeos:
+#   frame  um frame por vez (FilterChain)
+#   batch  lotes de frames com buffers do lote alocados uma vez (BatchFilterChain)
+#   umat   como 'batch', executando os filtros pela T-API do OpenCV (cv2.UMat), que usa
+#          OpenCL quando há um dispositivo; sem ele, o backend 'batch' é usado
+# Os três geram o mesmo resultado, bit a bit, na CPU (ver benchmarks/filter_backends.py).
+FILTER_BACKEND = os.environ.get('VIDEO_FILTER_BACKEND', 'frame')
+BACKENDS = ('frame', 'batch', 'umat')
+# Frames por lote nos backends 'batch' e 'umat'
+FILTER_BATCH_SIZE = int(os.environ.get('VIDEO_FILTER_BATCH', '8'))
+
+_REGISTRY = {}
+
+
+class Param:
+    """Parâmetro inteiro declarado por um filtro, com valor padrão e limites."""
+
+    def __init__(self, name, default, minimum, maximum, description=''):
+        self.name = name
+        self.default = default
+        self.minimum = minimum
+        self.maximum = maximum
+        self.description = description
+
+    def parse(self, filter_name, raw):
+        """Converte e valida o valor informado na especificação da cadeia."""
+        try:
+            value = int(raw)
+        except (TypeError, ValueError):
+            raise ValueError(f"Parâmetro '{self.name}' do filtro '{filter_name}' deve ser inteiro")
+        if not self.minimum <= value <= self.maximum:
+            raise ValueError(f"Parâmetro '{self.name}' do filtro '{filter_name}' deve estar "
+                             f"entre {self.minimum} e {self.maximum}")
+        return value
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'type': 'int',
+            'default': self.default,
+            'min': self.minimum,
+            'max': self.maximum,
+            'description': self.description,
+        }
+
+
+class Filter:
+    """
+    Base dos filtros do registro. Cada subclasse declara `name`, `description` e
+    `params` e implementa setup() (aloca os buffers para um formato de entrada)
+    e apply() (processa um frame escrevendo nos buffers pré-alocados).
+    Frames coloridos são BGR (3 canais); frames em tons de cinza têm 2 dimensões.
+    Depois de setup(), `passthrough` indica que o filtro não altera o frame.
+    """
+    name = None
+    description = ''
+    params = ()
+    passthrough = False
+
+    def __init__(self, **values):
+        self.values = values
+
+    def setup(self, shape):
+        """Prepara os buffers para entradas com o `shape` informado e retorna o shape da saída."""
+        return shape
+
+    def apply(self, frame, dst=None):
+        """
+        Processa o frame e retorna o resultado: em `dst` (com o shape de saída de
+        setup), se informado, ou em um buffer interno.
+        """
+        return frame
+
+    def apply_umat(self, frame):
+        """
+        Processa um frame cv2.UMat (T-API) e retorna um novo UMat. Filtros sem
+        versão própria processam o frame na memória principal com apply(); o UMat
+        criado copia o resultado, então o buffer interno pode ser reaproveitado.
+        """
+        return cv2.UMat(self.apply(frame.get()))
+
+
+def register(cls):
+    """Decorador que adiciona um filtro ao registro."""
+    _REGISTRY[cls.name] = cls
+    return cls
+
+
+@register
+class Grayscale(Filter):
+    name = 'grayscale'
+    description = 'Converte o vídeo para tons de cinza'
+
+    def setup(self, shape):
+        self.passthrough = len(shape) == 2
+        if not self.passthrough:
+            self.gray = np.empty(shape[:2], np.uint8)
+        return shape[:2]
+
+    def apply(self, frame, dst=None):
+        if frame.ndim == 2:
+            return frame
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.gray if dst is None else dst)
+
+    def apply_umat(self, frame):
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+
+@register
+class Pixelize(Filter):
+    name = 'pixelize'
+    description = 'Efeito de pixelização em blocos'
+    params = (Param('size', 16, 2, 256, 'Tamanho do bloco em pixels'),)
+
+    def setup(self, shape):
+        h, w = shape[:2]
+        size = self.values['size']
+        self.size = (w, h)
+        self.small_size = (max(1, w // size), max(1, h // size))
+        self.small = np.empty((self.small_size[1], self.small_size[0]) + tuple(shape[2:]), np.uint8)
+        self.out = np.empty(shape, np.uint8)
+        return shape
+
+    def apply(self, frame, dst=None):
+        cv2.resize(frame, self.small_size, dst=self.small, interpolation=cv2.INTER_LINEAR)
+        return cv2.resize(self.small, self.size, dst=self.out if dst is None else dst,
+                          interpolation=cv2.INTER_NEAREST)
+
+    def apply_umat(self, frame):
+        small = cv2.resize(frame, self.small_size, interpolation=cv2.INTER_LINEAR)
+        return cv2.resize(small, self.size, interpolation=cv2.INTER_NEAREST)
+
+
+@register
+class Edges(Filter):
+    name = 'edges'
+    description = 'Detecção de bordas (Canny)'
+    params = (
+        Param('low', 100, 0, 1000, 'Limiar inferior do Canny'),
+        Param('high', 200, 0, 1000, 'Limiar superior do Canny'),
+    )
+
+    def setup(self, shape):
+        self.color_input = len(shape) == 3
+        if self.color_input:
+            self.gray = np.empty(shape[:2], np.uint8)
+        self.edges = np.empty(shape[:2], np.uint8)
+        return shape[:2]
+
+    def apply(self, frame, dst=None):
+        gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        return cv2.Canny(gray, self.values['low'], self.values['high'], edges=self.edges if dst is None else dst)
+
+    def apply_umat(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if self.color_input else frame
+        return cv2.Canny(gray, self.values['low'], self.values['high'])
+
+
+@register
+class Resize(Filter):
+    name = 'resize'
+    description = 'Reduz o vídeo para uma largura máxima, mantendo a proporção'
+    params = (Param('width', 640, 16, 7680, 'Largura máxima em pixels'),)
+
+    def setup(self, shape):
+        original_height, original_width = shape[:2]
+        target_width = self.values['width']
+        self.active = original_width > target_width
+        self.passthrough = not self.active
+        if not self.active:
+            return shape
+
+        aspect_ratio = original_height / original_width
+        self.size = (target_width, int(target_width * aspect_ratio))
+        out_shape = (self.size[1], self.size[0]) + tuple(shape[2:])
+        self.out = np.empty(out_shape, np.uint8)
+        return out_shape
+
+    def apply(self, frame, dst=None):
+        if not self.active:
+            return frame
+        return cv2.resize(frame, self.size, dst=self.out if dst is None else dst, interpolation=cv2.INTER_AREA)
+
+    def apply_umat(self, frame):
+        return cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+
+
+def get_filter(name):
+    """Retorna a classe do filtro registrado com o nome informado."""
+    if name not in _REGISTRY:
+        raise ValueError(f"Filtro desconhecido: '{name}'")
+    return _REGISTRY[name]
+
+
+def list_filters():
+    """Descreve os filtros registrados (usado por GET /filters)."""
+    return [
+        {
+            'name': cls.name,
+            'description': cls.description,
+            'params': [param.to_dict() for param in cls.params],
+        }
+        for cls in _REGISTRY.values()
+    ]
+
+
+def parse_chain(spec):
+    """
+    Interpreta uma especificação como "resize:width=640|grayscale|edges:low=50"
+    e retorna a lista de passos [(nome, {parâmetro: valor})] com os padrões preenchidos.
+    Lança ValueError se a especificação for inválida.
+    """
+    if not spec or not spec.strip():
+        raise ValueError("Nenhum filtro informado")
+
+    steps = []
+    for part in spec.split(CHAIN_SEPARATOR):
+        name, _, raw_params = part.strip().partition(PARAMS_SEPARATOR)
+        cls = get_filter(name.strip())
+        declared = {param.name: param for param in cls.params}
+        values = {param.name: param.default for param in cls.params}
+        for item in filter(None, (p.strip() for p in raw_params.split(','))):
+            key, sep, raw = item.partition('=')
+            key = key.strip()
+            if not sep or key not in declared:
+                raise ValueError(f"Parâmetro inválido '{item}' para o filtro '{cls.name}'")
+            values[key] = declared[key].parse(cls.name, raw.strip())
+        steps.append((cls.name, values))
+    return steps
+
+
+def format_chain(steps):
+    """Gera a forma canônica de uma cadeia, omitindo parâmetros com valor padrão."""
+    parts = []
+    for name, values in steps:
+        defaults = {param.name: param.default for param in get_filter(name).params}
+        custom = [f"{key}={values[key]}" for key in sorted(values) if values[key] != defaults[key]]
+        parts.append(name + (PARAMS_SEPARATOR + ','.join(custom) if custom else ''))
+    return CHAIN_SEPARATOR.join(parts)
+
+
+def canonical_name(spec):
+    """Normaliza uma especificação de cadeia (ex.: 'pixelize:size=16' -> 'pixelize')."""
+    return format_chain(parse_chain(spec))
+
+
+def slug(spec):
+    """Converte uma especificação de cadeia em um nome de diretório seguro em qualquer SO."""
+    return (canonical_name(spec)
+            .replace(CHAIN_SEPARATOR, '+')
+            .replace(PARAMS_SEPARATOR, '_')
+            .replace('=', '-')
+            .replace(',', '_'))
+
+
+class FilterChain:
+    """
+    Cadeia de filtros fundida: os buffers de cada passo são alocados uma vez
+    (e realocados apenas se o tamanho dos frames mudar), e os passos trabalham
+    em tons de cinza enquanto possível, convertendo para BGR só no final.
+    Uma instância não é thread-safe; use uma cadeia por thread.
+    """
+
+    def __init__(self, steps):
+        self.steps = [get_filter(name)(**values) for name, values in steps]
+        self.input_shape = None
+
+    def setup(self, shape):
+        """Aloca os buffers para entradas com o `shape` informado e retorna o shape da saída (BGR)."""
+        self.input_shape = tuple(shape)
+        for step in self.steps:
+            shape = step.setup(shape)
+        self.gray_output = len(shape) == 2
+        self.output_shape = tuple(shape[:2]) + (3,)
+        self.bgr = np.empty(self.output_shape, np.uint8) if self.gray_output else None
+        return self.output_shape
+
+    def __call__(self, frame, detach=False):
+        """
+        Aplica a cadeia a um frame BGR e retorna um frame BGR.
+        Por padrão o resultado pode ser um buffer interno, válido até a próxima
+        chamada; com `detach=True` o resultado é sempre um array independente.
+        """
+        if frame.shape != self.input_shape:
+            self.setup(frame.shape)
+
+        result = frame
+        for step in self.steps:
+            result = step.apply(result)
+
+        if self.gray_output:
+            return cv2.cvtColor(result, cv2.COLOR_GRAY2BGR, dst=None if detach else self.bgr)
+        if detach and result is not frame:
+            return result.copy()
+        return result
+
+
+class BatchFilterChain:
+    """
+    Cadeia de filtros que processa lotes de até `batch_size` frames do mesmo
+    tamanho, gravando os resultados em um buffer de saída do lote inteiro
+    (N x H x W x 3) alocado por quem chama e reaproveitado entre lotes. Os passos
+    ignoram os filtros que não alteram o frame e o último passo escreve direto
+    na saída, sem cópias nem alocações por frame. Cada frame atravessa a cadeia
+    inteira antes do próximo, para que seus buffers intermediários continuem no
+    cache. Com `use_umat=True`, os passos rodam sobre cv2.UMat (T-API do OpenCV).
+    O resultado é o mesmo da FilterChain. Uma instância não é thread-safe; use
+    uma cadeia por thread.
+    """
+
+    def __init__(self, steps, batch_size=FILTER_BATCH_SIZE, use_umat=False):
+        self.steps = [get_filter(name)(**values) for name, values in steps]
+        self.batch_size = batch_size
+        self.use_umat = use_umat
+        self.input_shape = None
+
+    def setup(self, shape):
+        """Aloca os buffers para frames com o `shape` informado e retorna o shape da saída (BGR)."""
+        self.input_shape = tuple(shape)
+        for step in self.steps:
+            shape = step.setup(shape)
+        self.active = [step for step in self.steps if not step.passthrough]
+        self.gray_output = len(shape) == 2
+        self.output_shape = tuple(shape[:2]) + (3,)
+        return self.output_shape
+
+    def new_output(self):
+        """Aloca um buffer de saída para um lote inteiro."""
+        return np.empty((self.batch_size,) + self.output_shape, np.uint8)
+
+    def __call__(self, frames, out):
+        """
+        Aplica a cadeia a uma lista de frames BGR, gravando os resultados (BGR) em
+        `out` (ver new_output). Retorna a parte de `out` preenchida ou, se nenhum
+        passo altera os frames, os próprios frames.
+        """
+        if frames[0].shape != self.input_shape:
+            self.setup(frames[0].shape)
+        if not self.active:
+            return frames
+        out = out[:len(frames)]
+        if self.use_umat:
+            for frame, dst in zip(frames, out):
+                result = cv2.UMat(frame)
+                for step in self.active:
+                    result = step.apply_umat(result)
+                if self.gray_output:
+                    result = cv2.cvtColor(result, cv2.COLOR_GRAY2BGR)
+                dst[...] = result.get()
+            return out
+
+        *inner, last = self.active
+        for frame, dst in zip(frames, out):
+            for step in inner:
+                frame = step.apply(frame)
+            if self.gray_output:
+                cv2.cvtColor(last.apply(frame), cv2.COLOR_GRAY2BGR, dst=dst)
+            else:
+                last.apply(frame, dst)
+        return out
+
+
+def backend():
+    """
+    Backend dos filtros configurado em VIDEO_FILTER_BACKEND. 'umat' só é usado
+    quando o OpenCV tem um dispositivo OpenCL; sem ele, a T-API apenas acrescenta
+    cópias, e o backend 'batch' é usado no lugar.
+    """
+    if FILTER_BACKEND not in BACKENDS:
+        raise ValueError(f"Backend de filtros desconhecido: '{FILTER_BACKEND}' (use {', '.join(BACKENDS)})")
+    if FILTER_BACKEND == 'umat' and not cv2.ocl.haveOpenCL():
+        return 'batch'
+    return FILTER_BACKEND
+
+
+def _chain_steps(spec, max_width):
+    steps = parse_chain(spec)
+    if max_width:
+        steps.insert(0, ('resize', {'width': max_width}))
+    return steps
+
+
+def build_chain(spec, max_width=None):
+    """
+    Cria uma FilterChain a partir da especificação. Com `max_width`, o frame é
+    reduzido a essa largura antes dos demais filtros.
+    """
+    return FilterChain(_chain_steps(spec, max_width))
+
+
+def build_batch_chain(spec, max_width=None, batch_size=FILTER_BATCH_SIZE, use_umat=False):
+    """Como build_chain, para uma BatchFilterChain."""
+    return BatchFilterChain(_chain_steps(spec, max_width), batch_size, use_umat)
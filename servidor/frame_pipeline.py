@@ -0,0 +1,157 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Número de threads do estágio de filtro (1 = pipeline serial, sem threads)
+FILTER_THREADS = int(os.environ.get('VIDEO_FILTER_THREADS', str(min(4, os.cpu_count() or 1))))
+# Máximo de frames em trânsito entre a decodificação e a codificação (backpressure)
+MAX_FRAMES_IN_FLIGHT = int(os.environ.get('VIDEO_MAX_FRAMES_IN_FLIGHT', '32'))
+
+_END = object()
+
+
+class StageCounter:
+    """Contador de throughput de um estágio do pipeline (thread-safe)."""
+
+    def __init__(self, name):
+        self.name = name
+        self.frames = 0
+        self.busy_sec = 0.0
+        self.wait_sec = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, busy, wait=0.0, frames=1):
+        with self._lock:
+            self.frames += frames
+            self.busy_sec += busy
+            self.wait_sec += wait
+
+    def snapshot(self, workers=1):
+        """Retorna os contadores; `fps` é o throughput do estágio considerando seus workers."""
+        with self._lock:
+            per_worker = self.busy_sec / workers
+            return {
+                'frames': self.frames,
+                'busy_sec': round(self.busy_sec, 4),
+                'wait_sec': round(self.wait_sec, 4),
+                'workers': workers,
+                'fps': round(self.frames / per_worker, 2) if per_worker > 0 else None,
+            }
+
+
+def _batched(sink):
+    """Indica se o sink filtra os frames em lotes (prepare_batch()/write_batch())."""
+    return getattr(sink, 'batch_size', 1) > 1
+
+
+def run_threaded(cap, sinks, start_frame, end_frame, threads, progress_callback=None,
+                 total_frames=0, max_in_flight=None):
+    """
+    Executa o laço de frames em três estágios ligados por uma fila limitada:
+      - decodificação (thread própria): lê os frames e alimenta os sinks leves via consume();
+      - filtro (pool de `threads` threads): executa prepare() dos sinks que o definem;
+      - codificação (thread atual): chama write() desses sinks respeitando a ordem dos frames.
+    O OpenCV libera o GIL durante decodificação, filtros e codificação, então os estágios
+    executam de fato em paralelo. Se algum sink define `batch_size` > 1, os frames seguem
+    em lotes desse tamanho: esses sinks recebem o lote em prepare_batch()/write_batch(),
+    e os demais, frame a frame em prepare()/write().
+    Retorna (frames processados, contadores por estágio).
+    """
+    max_in_flight = max_in_flight or MAX_FRAMES_IN_FLIGHT
+    heavy = [sink for sink in sinks if hasattr(sink, 'prepare')]
+    light = [sink for sink in sinks if not hasattr(sink, 'prepare')]
+    batch_size = max([getattr(sink, 'batch_size', 1) for sink in heavy] + [1])
+
+    counters = {name: StageCounter(name) for name in ('decode', 'filter', 'encode')}
+    # A fila conta lotes: o limite de frames em trânsito é mantido
+    pending = queue.Queue(maxsize=max(1, max_in_flight // batch_size))
+    stop = threading.Event()
+    errors = []
+
+    def filter_batch(indices, frames):
+        started = time.perf_counter()
+        prepared = []
+        for sink in heavy:
+            if _batched(sink):
+                prepared.append(sink.prepare_batch(indices, frames))
+            else:
+                prepared.append([sink.prepare(index, frame) for index, frame in zip(indices, frames)])
+        counters['filter'].add(time.perf_counter() - started, frames=len(indices))
+        return prepared
+
+    def decode(executor):
+        index = start_frame
+        indices, frames = [], []
+        try:
+            while not stop.is_set() and (end_frame is None or index < end_frame):
+                started = time.perf_counter()
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                for sink in light:
+                    sink.consume(index, frame)
+                indices.append(index)
+                frames.append(frame)
+                decoded = time.perf_counter()
+
+                if len(indices) == batch_size:
+                    # put() bloqueia quando há frames demais em trânsito (backpressure)
+                    pending.put((indices, executor.submit(filter_batch, indices, frames)))
+                    indices, frames = [], []
+                counters['decode'].add(decoded - started, time.perf_counter() - decoded)
+                index += 1
+            if indices and not stop.is_set():
+                pending.put((indices, executor.submit(filter_batch, indices, frames)))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            pending.put(_END)
+
+    written = 0
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='frame-filter') as executor:
+        decoder = threading.Thread(target=decode, args=(executor,), name='frame-decoder', daemon=True)
+        decoder.start()
+        try:
+            while True:
+                waited = time.perf_counter()
+                item = pending.get()
+                if item is _END:
+                    break
+                indices, future = item
+                prepared = future.result()
+
+                started = time.perf_counter()
+                for sink, data in zip(heavy, prepared):
+                    if _batched(sink):
+                        sink.write_batch(data)
+                    else:
+                        for index, frame in zip(indices, data):
+                            sink.write(index, frame)
+                counters['encode'].add(time.perf_counter() - started, started - waited, frames=len(indices))
+
+                written += len(indices)
+                if progress_callback and total_frames > 0:
+                    progress_callback(min(written / total_frames, 1.0))
+        except Exception:
+            stop.set()
+            # Esvazia a fila para liberar a thread de decodificação bloqueada em put()
+            while decoder.is_alive():
+                try:
+                    pending.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            raise
+        finally:
+            decoder.join()
+
+    if errors:
+        raise errors[0]
+
+    stages = {
+        'decode': counters['decode'].snapshot(),
+        'filter': counters['filter'].snapshot(threads),
+        'encode': counters['encode'].snapshot(),
+    }
+    return written, stages
@@ -0,0 +1,453 @@
+import os
+import atexit
+import posixpath
+import signal
+import socket
+import time
+import multiprocessing
+from datetime import datetime, timedelta
+
+from . import database as db
+from . import storage
+from . import utils
+from . import video_processor
+from . import segments
+from . import filters
+from . import streaming
+from . import profiles
+from . import metrics
+
+# Número de processos que consomem a fila de processamento
+JOB_WORKERS = int(os.environ.get('VIDEO_JOB_WORKERS', '2'))
+# Intervalo (s) entre consultas à fila quando ela está vazia
+JOB_POLL_INTERVAL = float(os.environ.get('VIDEO_JOB_POLL_INTERVAL', '1.0'))
+# Máximo de jobs aguardando na fila antes de recusar novos uploads
+MAX_QUEUED_JOBS = int(os.environ.get('VIDEO_MAX_QUEUED_JOBS', '500'))
+# Tempo (s) sem atualização após o qual um job 'running' é considerado abandonado
+JOB_STALE_AFTER = int(os.environ.get('VIDEO_JOB_STALE_AFTER', '600'))
+# Número máximo de tentativas de um job antes de marcá-lo como falho
+JOB_MAX_ATTEMPTS = 3
+# Prioridades na fila (maior primeiro); as classes e seus limites estão em admission.py
+PRIORITY_INTERACTIVE = 10
+PRIORITY_BATCH = 0
+# Máximo de workers ocupados ao mesmo tempo com jobs 'batch': os demais ficam livres
+# para os uploads interativos, cuja espera não depende das cargas em massa
+BATCH_MAX_RUNNING = int(os.environ.get('VIDEO_BATCH_MAX_RUNNING', str(max(1, JOB_WORKERS - 1))))
+# Intervalo mínimo (s) entre gravações de progresso no banco
+PROGRESS_INTERVAL = 1.0
+# Metadados guardados no cache de resultados para registrar vídeos deduplicados
+CACHED_METADATA = ('duration_sec', 'fps', 'width', 'height', 'frame_count', 'streams')
+
+_workers = []
+_stop_event = None
+
+
+class QueueFullError(Exception):
+    """Lançada quando a fila de processamento atingiu o limite configurado."""
+
+
+def enqueue_job(video_id, payload, priority=PRIORITY_INTERACTIVE, cost=None):
+    """Registra um novo job de processamento e retorna seu ID. `cost` é a estimativa de admission.py."""
+    if db.count_jobs('queued') >= MAX_QUEUED_JOBS:
+        raise QueueFullError("Fila de processamento cheia. Tente novamente mais tarde.")
+
+    job_id = utils.generate_uuid()
+    db.add_job(job_id, video_id, payload, utils.get_current_timestamp(), priority=priority, cost=cost)
+    return job_id
+
+
+def job_to_response(job):
+    """Prepara um job para ser retornado como JSON pela API."""
+    started = job.get('started_at')
+    finished = job.get('finished_at')
+    queued_sec = None
+    elapsed_sec = None
+    if started:
+        queued_sec = _seconds_between(job['created_at'], started)
+        elapsed_sec = _seconds_between(started, finished or utils.get_current_timestamp())
+
+    return {
+        'id': job['id'],
+        'video_id': job['video_id'],
+        'state': job['state'],
+        'progress': round(job['progress'], 4),
+        'error': job.get('error'),
+        'attempts': job.get('attempts'),
+        'filter': job['payload'].get('filter'),
+        'profile': job['payload'].get('profile'),
+        'outputs': [{'filter': o['filter'], 'profile': o['profile']} for o in job['payload'].get('outputs', [])],
+        'priority': job['payload'].get('priority'),
+        'cost': job.get('cost'),
+        'original_name': job['payload'].get('original_name'),
+        'created_at': job['created_at'],
+        'started_at': started,
+        'finished_at': finished,
+        'queued_sec': queued_sec,
+        'elapsed_sec': elapsed_sec,
+    }
+
+
+def _seconds_between(start_iso, end_iso):
+    """Diferença em segundos entre dois timestamps ISO 8601."""
+    delta = datetime.fromisoformat(end_iso) - datetime.fromisoformat(start_iso)
+    return round(delta.total_seconds(), 3)
+
+
+def _progress_reporter(job_id):
+    """Retorna report(progresso, force=False), que grava no banco no máximo a cada PROGRESS_INTERVAL s."""
+    last_report = [0.0]
+
+    def report(progress, force=False):
+        now = time.monotonic()
+        if force or now - last_report[0] >= PROGRESS_INTERVAL:
+            last_report[0] = now
+            db.update_job_progress(job_id, progress, utils.get_current_timestamp())
+    return report
+
+
+def run_job(job):
+    """Executa o processamento completo de um vídeo descrito pelo job."""
+    payload = job['payload']
+    if payload.get('kind') == 'renditions':
+        return run_renditions_job(job)
+    backend = storage.backend()
+    paths = {key: storage.local_path(rel) for key, rel in payload['paths'].items()}
+    # Com um backend remoto (S3), o worker baixa o original para o cache local
+    with metrics.stage('fetch'):
+        paths['original'] = backend.fetch(payload['paths']['original'])
+    if paths['original'] is None:
+        raise Exception("Arquivo original não encontrado no armazenamento.")
+    report = _progress_reporter(job['id'])
+
+    profile = profiles.get_profile(payload.get('profile'))
+
+    # 1. Perfis com rascunho codificam antes uma versão rápida de baixa resolução, já
+    # registrada para que o vídeo possa ser assistido enquanto a versão final é gerada
+    draft_registered = False
+    if profile.draft and paths.get('draft'):
+        print(f"[job {job['id']}] Gerando rascunho com o perfil '{profile.draft}'...")
+        with metrics.stage('draft'):
+            draft_meta = video_processor.process_draft(
+                paths['original'], paths, payload['filter'], profiles.get_profile(profile.draft),
+                progress_callback=lambda fraction: report(0.15 * fraction)
+            )
+        if draft_meta is not None:
+            backend.publish(payload['paths']['draft'])
+            # replace=True: um job reenfileirado após uma falha pode já ter registrado o vídeo
+            register_video(job['video_id'], {**payload, 'paths': {**payload['paths'], 'processed': payload['paths']['draft']}},
+                           draft_meta, replace=True)
+            draft_registered = True
+
+    # 2. Decodifica o original uma única vez gerando o vídeo filtrado e os
+    # metadados (responsável pela maior parte do tempo do job)
+    print(f"[job {job['id']}] Aplicando filtro '{payload['filter']}' com o perfil '{profile.name}'...")
+    # Saídas extras (outros filtros/perfis) são gravadas na mesma decodificação do original
+    outputs = [(storage.local_path(o['path']), o['filter'], profiles.get_profile(o['profile']))
+               for o in payload.get('outputs', [])]
+    use_segments = not outputs and (payload.get('segments') or segments.SEGMENT_COUNT) > 1
+    # As renditions HLS/DASH (opcionais) são codificadas a partir dos frames filtrados na
+    # resolução do original, ao lado do vídeo processado (processed/<filtro>/hls, .../dash)
+    streams_dir = os.path.dirname(paths['processed']) if streaming.enabled() else None
+    # No modo segmentado, as renditions exigem outra decodificação, que ocupa o fim da barra
+    first = 0.15 if draft_registered else 0.0
+    last = 0.7 if streams_dir and use_segments else 0.98
+    progress = lambda fraction: report(first + (last - first) * fraction)
+    video_meta = None
+    if use_segments:
+        video_meta = segments.process_video_segmented(
+            paths['original'], paths, payload['filter'], payload.get('segments'), progress_callback=progress,
+            profile_name=profile.name
+        )
+    if video_meta is None:
+        if streams_dir:
+            print(f"[job {job['id']}] Gerando também o streaming adaptativo ({', '.join(streaming.STREAM_FORMATS)})...")
+        video_meta = video_processor.process_video(paths['original'], paths, payload['filter'],
+                                                   progress_callback=progress, profile=profile, outputs=outputs,
+                                                   streams_dir=streams_dir)
+    if video_meta is None:
+        raise Exception(f"Falha ao processar e salvar o vídeo. O codec do perfil '{profile.name}' pode não estar disponível.")
+    report(last, force=True)
+    record_pipeline_metrics(video_meta, paths['processed'])
+
+    # 3. Modo segmentado: gera as renditions HLS/DASH em uma passagem própria pelo original
+    if streams_dir and 'streams' not in video_meta:
+        print(f"[job {job['id']}] Gerando streaming adaptativo ({', '.join(streaming.STREAM_FORMATS)})...")
+        with metrics.stage('streaming'):
+            video_meta['streams'] = video_processor.build_streams(
+                paths['original'], streams_dir, payload['filter'],
+                progress_callback=lambda fraction: report(last + (0.98 - last) * fraction)
+            )
+        report(0.98, force=True)
+
+    # 4. Publica o vídeo processado e as renditions no backend de armazenamento
+    with metrics.stage('publish'):
+        backend.publish(payload['paths']['processed'])
+        processed_dir = posixpath.dirname(payload['paths']['processed'])
+        for name in _stream_dirs(video_meta.get('streams')):
+            backend.publish_tree(posixpath.join(processed_dir, name))
+        for output in payload.get('outputs', []):
+            backend.publish(output['path'])
+
+    with metrics.stage('db_insert'):
+        # 5. Salva metadados no banco e no meta.json, substituindo o registro do rascunho
+        # (ou o de uma execução anterior do mesmo job, reenfileirado após uma falha)
+        register_video(job['video_id'], payload, video_meta, replace=True)
+        # A saída principal e as extras ficam registradas como renditions do vídeo
+        requested = [{'filter': payload['filter'], 'profile': profile.name, 'path': payload['paths']['processed']}]
+        requested += payload.get('outputs', [])
+        # O processamento segmentado não informa as saídas: usa as dimensões do vídeo
+        written = video_meta.get('outputs') or [
+            {'width': video_meta.get('width'), 'height': video_meta.get('height'), 'fps': video_meta.get('fps')}
+        ]
+        add_renditions(job['video_id'], [{**info, **output} for output, info in zip(requested, written)])
+
+        # 6. Registra o resultado no cache para reaproveitá-lo em reenvios do mesmo conteúdo
+        if payload.get('checksum'):
+            rel = payload['paths']
+            db.add_result({
+                'cache_key': result_cache_key(payload),
+                'checksum': payload['checksum'],
+                'filter': payload['filter'],
+                'video_id': job['video_id'],
+                'path_processed': rel['processed'],
+                # Thumbnails e previews agora são derivadas geradas sob demanda (ver derivatives.py)
+                'path_thumbnail': None,
+                'path_preview': None,
+                'metadata': {key: video_meta.get(key) for key in CACHED_METADATA},
+                'created_at': utils.get_current_timestamp()
+            })
+
+
+def run_renditions_job(job):
+    """
+    Gera novas saídas (filtros/perfis) de um vídeo já registrado, em uma única
+    decodificação do original (POST /videos/<id>/process).
+    """
+    payload = job['payload']
+    backend = storage.backend()
+    with metrics.stage('fetch'):
+        original = backend.fetch(payload['source'])
+    if original is None:
+        raise Exception("Arquivo original não encontrado no armazenamento.")
+
+    outputs = payload['outputs']
+    report = _progress_reporter(job['id'])
+    print(f"[job {job['id']}] Gerando {len(outputs)} saída(s) em uma única passagem...")
+    video_meta = video_processor.render_outputs(
+        original,
+        [(storage.local_path(o['path']), o['filter'], profiles.get_profile(o['profile'])) for o in outputs],
+        progress_callback=lambda fraction: report(0.98 * fraction)
+    )
+    if video_meta is None:
+        raise Exception("Falha ao gerar as saídas. O codec de algum perfil pode não estar disponível.")
+    for name, seconds in video_meta['stats']['stage_sec'].items():
+        metrics.record_stage(name, seconds)
+    metrics.inc('video_frames_processed_total', video_meta['stats'].get('frames_decoded', 0))
+
+    with metrics.stage('publish'):
+        for output in outputs:
+            backend.publish(output['path'])
+    add_renditions(job['video_id'], [{**info, **output} for output, info in zip(outputs, video_meta['outputs'])])
+
+
+def add_renditions(video_id, outputs):
+    """Registra as saídas geradas (filter, profile, path e as dimensões de cada uma)."""
+    now = utils.get_current_timestamp()
+    for output in outputs:
+        local = storage.backend().path(output['path'])
+        db.add_rendition({
+            'id': utils.generate_uuid(),
+            'video_id': video_id,
+            'filter': output['filter'],
+            'profile': output['profile'],
+            'path': output['path'],
+            'width': output.get('width'),
+            'height': output.get('height'),
+            'fps': output.get('fps'),
+            'size_bytes': os.path.getsize(local) if os.path.exists(local) else None,
+            'created_at': now,
+        })
+
+
+def record_pipeline_metrics(video_meta, processed_path):
+    """Registra nas métricas as etapas (metadata, filter, encode), os frames e os bytes gerados."""
+    stats = video_meta.get('stats', {})
+    for name, seconds in stats.get('stage_sec', {}).items():
+        metrics.record_stage(name, seconds)
+    metrics.inc('video_frames_processed_total', stats.get('frames_decoded', 0))
+    if os.path.exists(processed_path):
+        metrics.inc('video_bytes_total', os.path.getsize(processed_path), direction='out', kind='processed')
+
+
+def register_video(video_id, payload, video_meta, replace=False):
+    """
+    Grava o registro do vídeo no banco e os metadados extras no meta.json.
+    Com `replace=True`, substitui um registro anterior do mesmo vídeo (ex.: o do rascunho).
+    """
+    original_path = storage.backend().path(payload['paths']['original'])
+    db.add_video_record({
+        'id': video_id,
+        'original_name': payload['original_name'],
+        'original_ext': payload['original_ext'],
+        'mime_type': payload.get('mime_type'),
+        'size_bytes': payload.get('size_bytes') or os.path.getsize(original_path),
+        'duration_sec': video_meta.get('duration_sec'),
+        'fps': video_meta.get('fps'),
+        'width': video_meta.get('width'),
+        'height': video_meta.get('height'),
+        'filter': payload['filter'],
+        'created_at': payload['created_at'],
+        'path_original': payload['paths']['original'],
+        'path_processed': payload['paths']['processed'],
+        'checksum': payload.get('checksum'),
+        'streams': stream_paths(payload, video_meta.get('streams'))
+    }, replace=replace)
+
+    # O checksum do original já é conhecido: evita recalculá-lo ao servir o arquivo em /media
+    if payload.get('checksum') and os.path.exists(original_path):
+        stat = os.stat(original_path)
+        db.set_media_etag(payload['paths']['original'], stat.st_size, stat.st_mtime_ns, payload['checksum'])
+
+    storage.save_meta_json(payload['paths']['meta'], {
+        'checksum': payload.get('checksum'),
+        'profile': payload.get('profile') or profiles.DEFAULT_PROFILE,
+        'filter_params': [{'name': name, 'params': params} for name, params in filters.parse_chain(payload['filter'])]
+    })
+
+
+def stream_paths(payload, streams):
+    """Converte os manifestos (relativos à pasta do processado) em chaves do armazenamento."""
+    if not streams:
+        return None
+    base = posixpath.dirname(payload['paths']['processed'])
+    return {name: posixpath.join(base, manifest) for name, manifest in streams.items()}
+
+
+def _stream_dirs(streams):
+    """Pastas (hls/, dash/) das renditions, a partir dos manifestos relativos à pasta do processado."""
+    return {manifest.split('/')[0] for manifest in (streams or {}).values()}
+
+
+def result_cache_key(payload):
+    """Chave do cache de resultados para o conteúdo, filtro e configurações de saída do payload."""
+    return utils.compute_cache_key(payload['checksum'], payload['filter'], video_processor.output_settings(profiles.get_profile(payload.get('profile'))))
+
+
+def reuse_cached_result(video_id, payload):
+    """
+    Se o mesmo conteúdo já foi processado com o mesmo filtro e as mesmas
+    configurações de saída, vincula os arquivos existentes (hard link) ao novo
+    vídeo e o registra sem reprocessar. Retorna True se o resultado foi reaproveitado.
+    """
+    # O cache guarda uma saída por conteúdo: com saídas extras, o vídeo é processado
+    if payload.get('outputs'):
+        return False
+    cached = db.get_result(result_cache_key(payload))
+    if cached is None:
+        return False
+
+    backend = storage.backend()
+    links = {
+        'processed': cached['path_processed'],
+        'thumbnail': cached['path_thumbnail'],
+        'preview': cached['path_preview'],
+    }
+    links = {key: rel for key, rel in links.items() if rel}
+    # Os arquivos podem ter sido removidos desde que o resultado foi registrado
+    if not all(backend.exists(rel) for rel in links.values()):
+        return False
+
+    # As pastas de streaming (hls/, dash/) também são vinculadas arquivo a arquivo
+    streams = cached['metadata'].get('streams') or {}
+    src_dir = posixpath.dirname(links['processed'])
+    dst_dir = posixpath.dirname(payload['paths']['processed'])
+    if not all(backend.exists(posixpath.join(src_dir, manifest)) for manifest in streams.values()):
+        return False
+
+    for key, src in links.items():
+        backend.copy(src, payload['paths'][key])
+    for name in _stream_dirs(streams):
+        backend.copy_tree(posixpath.join(src_dir, name), posixpath.join(dst_dir, name))
+    register_video(video_id, payload, cached['metadata'])
+    # A rendition reaproveitada tem as mesmas dimensões da original
+    source = next((r for r in db.get_renditions(cached['video_id']) if r['path'] == cached['path_processed']), {})
+    add_renditions(video_id, [{
+        'width': source.get('width'), 'height': source.get('height'), 'fps': source.get('fps'),
+        'filter': payload['filter'], 'profile': payload.get('profile') or profiles.DEFAULT_PROFILE,
+        'path': payload['paths']['processed'],
+    }])
+    print(f"Resultado reaproveitado do vídeo {cached['video_id']} (checksum {payload['checksum'][:12]}).")
+    return True
+
+
+def _worker_loop(stop_event, poll_interval):
+    """Laço principal de um processo worker: consome a fila até receber o sinal de parada."""
+    # O encerramento é coordenado pelo processo principal através do stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker_name = f"{socket.gethostname()}:{os.getpid()}"
+
+    while not stop_event.is_set():
+        job = db.claim_next_job(worker_name, utils.get_current_timestamp(),
+                                priority_floor=PRIORITY_INTERACTIVE, max_below_floor=BATCH_MAX_RUNNING)
+        if job is None:
+            stop_event.wait(poll_interval)
+            continue
+
+        started = time.perf_counter()
+        with metrics.correlation(job_id=job['id'], video_id=job['video_id'],
+                                 request_id=job['payload'].get('request_id')):
+            try:
+                run_job(job)
+                db.finish_job(job['id'], 'done', utils.get_current_timestamp())
+                print(f"[job {job['id']}] Concluído.")
+                state, error = 'done', None
+            except Exception as e:
+                print(f"[job {job['id']}] ERRO: {e}")
+                db.finish_job(job['id'], 'failed', utils.get_current_timestamp(), error=str(e))
+                state, error = 'failed', str(e)
+            elapsed = time.perf_counter() - started
+            metrics.inc('video_jobs_finished_total', state=state)
+            metrics.observe('video_job_seconds', elapsed)
+            metrics.log('job_finished', state=state, error=error, duration_ms=round(elapsed * 1000, 3))
+        # Publica as métricas do job sem esperar o intervalo de gravação
+        metrics.flush(force=True)
+
+
+def start_worker_pool(num_workers=None):
+    """Inicia o pool de processos que processam a fila de jobs."""
+    global _stop_event
+    if _workers:
+        return
+
+    num_workers = num_workers or JOB_WORKERS
+    cutoff = (datetime.now() - timedelta(seconds=JOB_STALE_AFTER)).isoformat()
+    requeued = db.requeue_stale_jobs(cutoff, JOB_MAX_ATTEMPTS)
+    if requeued:
+        print(f"{requeued} job(s) abandonado(s) devolvido(s) à fila.")
+
+    segments.warn_if_unavailable()
+    _stop_event = multiprocessing.Event()
+    for i in range(num_workers):
+        process = multiprocessing.Process(
+            target=_worker_loop, args=(_stop_event, JOB_POLL_INTERVAL),
+            # Não-daemon: o modo por segmentos precisa criar processos filhos
+            name=f"video-worker-{i}", daemon=False
+        )
+        process.start()
+        _workers.append(process)
+
+    atexit.register(stop_worker_pool)
+    print(f"Pool de processamento iniciado com {num_workers} worker(s).")
+
+
+def stop_worker_pool(timeout=5):
+    """Sinaliza a parada dos workers e aguarda seu encerramento."""
+    if not _workers:
+        return
+
+    _stop_event.set()
+    for process in _workers:
+        process.join(timeout)
+        if process.is_alive():
+            process.terminate()
+    _workers.clear()
@@ -0,0 +1,247 @@
+import os
+import re
+import mimetypes
+from datetime import datetime, timezone
+
+from flask import Response, abort, current_app, redirect, request, send_file
+from werkzeug.http import http_date, quote_etag
+from werkzeug.security import safe_join
+
+from . import database as db
+from . import storage
+
+# Cache longo para os arquivos de mídia (vídeo e imagem) dentro de videos/AAAA/MM/DD/<uuid>/,
+# que nunca são reescritos. Os demais arquivos da pasta (meta.json, keyframes.json,
+# manifestos HLS/DASH) podem ser regravados e são sempre revalidados pela ETag
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Demais arquivos podem ser guardados, mas devem ser revalidados a cada uso
+DEFAULT_CACHE_CONTROL = 'no-cache'
+# Máximo de intervalos aceitos em uma única requisição com vários ranges
+MAX_RANGES = 16
+# Tempo (s) que o cliente pode reutilizar o redirecionamento para uma URL assinada (backend S3)
+REDIRECT_MAX_AGE = 300
+# Manifestos e segmentos HLS/DASH referenciam os demais arquivos por caminhos relativos, que
+# não carregariam a assinatura: com o backend S3, são servidos a partir do cache local
+STREAMING_EXTENSIONS = ('.m3u8', '.mpd', '.ts', '.m4s')
+
+_UUID_PATH = re.compile(
+    r'^videos/\d{4}/\d{2}/\d{2}/[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}/'
+)
+_BLOCK_SIZE = 256 * 1024
+
+# Tipos MIME servidos com IMMUTABLE_CACHE_CONTROL
+IMMUTABLE_TYPES = ('video/', 'image/')
+
+# Tipos dos arquivos de streaming adaptativo, nem sempre presentes no registro do sistema
+mimetypes.add_type('application/vnd.apple.mpegurl', '.m3u8')
+mimetypes.add_type('video/mp2t', '.ts')
+mimetypes.add_type('application/dash+xml', '.mpd')
+mimetypes.add_type('video/iso.segment', '.m4s')
+
+# ETags já calculadas neste processo: caminho -> (tamanho, mtime_ns, sha256)
+_etag_cache = {}
+
+
+def content_etag(rel_path, full_path, stat):
+    """
+    Retorna o SHA-256 do arquivo, usado como ETag forte. O valor é calculado
+    uma única vez por versão do arquivo (tamanho + mtime) e guardado no banco.
+    """
+    version = (stat.st_size, stat.st_mtime_ns)
+    cached = _etag_cache.get(rel_path)
+    if cached and cached[:2] == version:
+        return cached[2]
+
+    stored = db.get_media_etag(rel_path)
+    if stored and (stored['size_bytes'], stored['mtime_ns']) == version:
+        checksum = stored['sha256']
+    else:
+        checksum = storage.file_checksum(full_path)
+        db.set_media_etag(rel_path, stat.st_size, stat.st_mtime_ns, checksum)
+
+    _etag_cache[rel_path] = version + (checksum,)
+    return checksum
+
+
+def cache_control_for(rel_path):
+    """Cache-Control padrão de um arquivo do armazenamento, escolhido pelo caminho e pelo tipo."""
+    mimetype = mimetypes.guess_type(rel_path)[0] or ''
+    if _UUID_PATH.match(rel_path) and mimetype.startswith(IMMUTABLE_TYPES):
+        return IMMUTABLE_CACHE_CONTROL
+    return DEFAULT_CACHE_CONTROL
+
+
+def _parse_ranges(size):
+    """
+    Converte o cabeçalho Range em uma lista ordenada de intervalos (início, fim
+    exclusivo), unindo os que se sobrepõem. Retorna None se não houver Range
+    válido e [] se nenhum intervalo puder ser atendido.
+    """
+    # O parser do Werkzeug recusa intervalos fora de ordem ou sobrepostos, que a RFC 9110 permite
+    header = request.headers.get('Range')
+    if not header:
+        return None
+    units, _, spec = header.partition('=')
+    parts = spec.split(',')
+    if units.strip().lower() != 'bytes' or len(parts) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for part in parts:
+        first, sep, last = part.strip().partition('-')
+        if not sep:
+            return None
+        try:
+            if not first:
+                # Sufixo: os últimos N bytes
+                start, stop = max(size - int(last), 0), size
+            else:
+                start = int(first)
+                if last and int(last) < start:
+                    return None
+                stop = size if not last else min(int(last) + 1, size)
+        except ValueError:
+            return None
+        if start < stop:
+            ranges.append([start, stop])
+
+    ranges.sort()
+    merged = []
+    for start, stop in ranges:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], stop)
+        else:
+            merged.append([start, stop])
+    return [tuple(r) for r in merged]
+
+
+def _not_modified(etag, mtime):
+    """Avalia If-None-Match / If-Modified-Since (RFC 9110: If-None-Match tem precedência)."""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since:
+        return int(mtime) <= request.if_modified_since.timestamp()
+    return False
+
+
+def _if_range_matches(etag, mtime):
+    """If-Range: o Range só é atendido se o arquivo não mudou desde a cópia do cliente."""
+    if_range = request.if_range
+    if if_range.etag is None and if_range.date is None:
+        return True
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    return int(mtime) <= if_range.date.timestamp()
+
+
+def _read_range(full_path, start, stop):
+    """Gera o conteúdo do arquivo entre start e stop em blocos."""
+    with open(full_path, 'rb') as f:
+        f.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            chunk = f.read(min(_BLOCK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _file_body(full_path, start, stop):
+    """
+    Corpo da resposta para um único intervalo. Se o servidor WSGI oferece
+    wsgi.file_wrapper (ex.: gunicorn), o arquivo é entregue a ele já posicionado,
+    permitindo o envio com sendfile (zero cópia) limitado pelo Content-Length.
+    """
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    if file_wrapper is None:
+        return _read_range(full_path, start, stop)
+    f = open(full_path, 'rb')
+    f.seek(start)
+    return file_wrapper(f, _BLOCK_SIZE)
+
+
+def _part_header(boundary, mimetype, start, stop, size):
+    """Cabeçalho de uma parte da resposta multipart/byteranges."""
+    return (f"\r\n--{boundary}\r\nContent-Type: {mimetype}\r\n"
+            f"Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n").encode('latin-1')
+
+
+def _multipart_body(full_path, ranges, mimetype, size, boundary):
+    """Gera o corpo multipart/byteranges de uma resposta com vários intervalos."""
+    for start, stop in ranges:
+        yield _part_header(boundary, mimetype, start, stop, size)
+        yield from _read_range(full_path, start, stop)
+    yield f"\r\n--{boundary}--\r\n".encode('latin-1')
+
+
+def send_media(filename, cache_control=None):
+    """
+    Serve um arquivo do armazenamento com suporte completo a HTTP Range (206,
+    inclusive vários intervalos), ETag forte baseada no conteúdo, respostas 304
+    condicionais e cache imutável para os vídeos e imagens endereçados por UUID.
+    `cache_control` substitui o Cache-Control escolhido pelo caminho.
+    Com um backend remoto (S3), redireciona para uma URL assinada (exceto os
+    arquivos de streaming, baixados para o cache local e servidos daqui).
+    """
+    rel_path = filename.replace(os.sep, '/')
+    # Recusa caminhos que escapariam da raiz (ex.: "../")
+    if safe_join(storage.MEDIA_ROOT, rel_path) is None:
+        abort(404)
+
+    backend = storage.backend()
+    if backend.remote and not rel_path.endswith(STREAMING_EXTENSIONS):
+        # O cliente baixa direto do serviço; o redirecionamento vale menos que a assinatura
+        response = redirect(backend.url(rel_path), 302)
+        response.headers['Cache-Control'] = f'private, max-age={REDIRECT_MAX_AGE}'
+        return response
+
+    full_path = backend.fetch(rel_path)
+    if full_path is None:
+        abort(404)
+
+    if cache_control is None:
+        cache_control = cache_control_for(rel_path)
+
+    # Com X-Sendfile ativo, o servidor web à frente do Flask entrega o arquivo
+    if current_app.config.get('USE_X_SENDFILE'):
+        response = send_file(full_path, conditional=True)
+        response.headers['Cache-Control'] = cache_control
+        return response
+
+    stat = os.stat(full_path)
+    size = stat.st_size
+    etag = content_etag(rel_path, full_path, stat)
+    mimetype = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    headers = {
+        'ETag': quote_etag(etag),
+        'Last-Modified': http_date(datetime.fromtimestamp(stat.st_mtime, timezone.utc)),
+        'Cache-Control': cache_control,
+        'Accept-Ranges': 'bytes',
+    }
+
+    if _not_modified(etag, stat.st_mtime):
+        return Response(status=304, headers=headers)
+
+    ranges = _parse_ranges(size) if _if_range_matches(etag, stat.st_mtime) else None
+    if ranges == []:
+        headers['Content-Range'] = f'bytes */{size}'
+        return Response(status=416, headers=headers)
+
+    if not ranges:
+        headers['Content-Length'] = str(size)
+        return Response(_file_body(full_path, 0, size), 200, headers, mimetype=mimetype, direct_passthrough=True)
+
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+        headers['Content-Length'] = str(stop - start)
+        return Response(_file_body(full_path, start, stop), 206, headers, mimetype=mimetype, direct_passthrough=True)
+
+    boundary = os.urandom(12).hex()
+    headers['Content-Length'] = str(
+        sum(len(_part_header(boundary, mimetype, start, stop, size)) + stop - start for start, stop in ranges)
+        + len(f"\r\n--{boundary}--\r\n")
+    )
+    return Response(_multipart_body(full_path, ranges, mimetype, size, boundary), 206, headers,
+                    content_type=f'multipart/byteranges; boundary={boundary}', direct_passthrough=True)
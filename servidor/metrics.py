@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import atexit
+import threading
+import functools
+from contextlib import contextmanager
+from datetime import datetime
+
+# Pasta onde cada processo (servidor, workers da fila) grava periodicamente seus
+# contadores; GET /metrics soma os arquivos de todos os processos. Vazio = só o processo atual.
+METRICS_DIR = os.environ.get('VIDEO_METRICS_DIR', os.path.join(os.path.dirname(__file__), 'metrics'))
+# Intervalo mínimo (s) entre gravações do arquivo de métricas de um processo
+FLUSH_INTERVAL = float(os.environ.get('VIDEO_METRICS_FLUSH_SEC', '5'))
+# Logs estruturados (uma linha JSON por evento) com o ID de correlação da requisição/job
+JSON_LOGS = os.environ.get('VIDEO_JSON_LOGS', '1') == '1'
+
+# Limites (s) dos histogramas de duração
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# Métricas conhecidas: nome -> (tipo, descrição)
+DEFINITIONS = {
+    'video_stage_seconds': ('histogram', 'Duração de cada etapa de um upload/processamento'),
+    'video_http_request_seconds': ('histogram', 'Duração das requisições HTTP por rota'),
+    'video_http_requests_total': ('counter', 'Requisições HTTP por rota, método e status'),
+    'video_http_response_bytes_total': ('counter', 'Bytes enviados nas respostas HTTP por rota'),
+    'video_bytes_total': ('counter', 'Bytes de vídeo recebidos (in) e gerados (out)'),
+    'video_frames_processed_total': ('counter', 'Frames decodificados pelo pipeline de processamento'),
+    'video_jobs_finished_total': ('counter', 'Jobs de processamento finalizados por estado'),
+    'video_job_seconds': ('histogram', 'Duração total dos jobs de processamento'),
+    'video_db_seconds': ('histogram', 'Latência das operações no banco de dados'),
+    'video_storage_seconds': ('histogram', 'Duração das transferências com o armazenamento remoto (S3)'),
+    'video_storage_bytes_total': ('counter', 'Bytes enviados ao armazenamento remoto (S3)'),
+    'video_response_cache_total': ('counter', 'Respostas da página inicial e de /videos servidas do cache (hit) ou geradas (miss)'),
+    'video_admission_rejected_total': ('counter', 'Requisições recusadas (429) por limite de uso ou capacidade'),
+}
+
+_lock = threading.Lock()
+_counters = {}    # (nome, labels) -> valor
+_histograms = {}  # (nome, labels) -> [contagem por limite..., +Inf, soma]
+_last_flush = [0.0]
+_context = threading.local()
+
+
+def _reset():
+    """Descarta os valores herdados do processo pai (chamado no processo filho após um fork)."""
+    _counters.clear()
+    _histograms.clear()
+    _last_flush[0] = 0.0
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset)
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Soma `value` ao contador `name` com os labels informados."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+    flush()
+
+
+def observe(name, seconds, **labels):
+    """Registra uma duração (s) no histograma `name`."""
+    key = _key(name, labels)
+    with _lock:
+        values = _histograms.get(key)
+        if values is None:
+            values = _histograms[key] = [0] * (len(DEFAULT_BUCKETS) + 1) + [0.0]
+        for i, bound in enumerate(DEFAULT_BUCKETS):
+            if seconds <= bound:
+                values[i] += 1
+        values[len(DEFAULT_BUCKETS)] += 1
+        values[-1] += seconds
+    flush()
+
+
+def timed(name, **labels):
+    """Decorador que registra a duração de cada chamada da função no histograma `name`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - started, **labels)
+        return wrapper
+    return decorator
+
+
+# --- Correlação e logs estruturados ---
+
+def current():
+    """Campos de correlação (request_id, job_id...) da thread atual."""
+    return dict(getattr(_context, 'fields', {}))
+
+
+def set_context(**fields):
+    """Substitui os campos de correlação da thread atual (ex.: no início de cada requisição)."""
+    _context.fields = {k: v for k, v in fields.items() if v is not None}
+
+
+@contextmanager
+def correlation(**fields):
+    """Associa os campos (ex.: request_id, job_id) aos logs emitidos dentro do bloco, nesta thread."""
+    previous = getattr(_context, 'fields', {})
+    _context.fields = {**previous, **{k: v for k, v in fields.items() if v is not None}}
+    try:
+        yield
+    finally:
+        _context.fields = previous
+
+
+def log(event, **fields):
+    """Emite um evento como uma linha JSON, com os campos de correlação da thread."""
+    if not JSON_LOGS:
+        return
+    record = {'ts': datetime.now().isoformat(), 'event': event, 'pid': os.getpid(), **current(), **fields}
+    print(json.dumps(record, ensure_ascii=False, default=str), flush=True)
+
+
+def record_stage(stage, seconds, **fields):
+    """Registra a duração de uma etapa no histograma e no log estruturado."""
+    observe('video_stage_seconds', seconds, stage=stage)
+    log('stage', stage=stage, duration_ms=round(seconds * 1000, 3), **fields)
+
+
+@contextmanager
+def stage(name, **fields):
+    """Mede o bloco como a etapa `name` (ver record_stage)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started, **fields)
+
+
+# --- Agregação entre processos ---
+
+def _snapshot():
+    with _lock:
+        return {
+            'counters': [[name, list(labels), value] for (name, labels), value in _counters.items()],
+            'histograms': [[name, list(labels), list(values)] for (name, labels), values in _histograms.items()],
+        }
+
+
+def flush(force=False):
+    """Grava os valores deste processo em METRICS_DIR (no máximo a cada FLUSH_INTERVAL s)."""
+    now = time.monotonic()
+    if not METRICS_DIR or (not force and now - _last_flush[0] < FLUSH_INTERVAL):
+        return
+    _last_flush[0] = now
+    snapshot = _snapshot()
+    if not snapshot['counters'] and not snapshot['histograms']:
+        return
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = os.path.join(METRICS_DIR, f'{os.getpid()}.json')
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Não foi possível gravar as métricas: {e}")
+
+
+atexit.register(flush, True)
+
+
+def collect():
+    """
+    Soma os valores deste processo (atuais) com os gravados pelos demais processos.
+    Os arquivos de processos já encerrados continuam somando, para que os contadores
+    nunca diminuam; a pasta pode ser apagada ao reiniciar o servidor.
+    """
+    snapshots = [_snapshot()]
+    if METRICS_DIR and os.path.isdir(METRICS_DIR):
+        own = f'{os.getpid()}.json'
+        for filename in os.listdir(METRICS_DIR):
+            if not filename.endswith('.json') or filename == own:
+                continue
+            try:
+                with open(os.path.join(METRICS_DIR, filename), encoding='utf-8') as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            total = histograms.setdefault(key, [0] * len(values))
+            for i, value in enumerate(values):
+                total[i] += value
+    return counters, histograms
+
+
+def _labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in items)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + '}'
+
+
+def render(gauges=()):
+    """
+    Gera o texto no formato de exposição do Prometheus. `gauges` é uma lista de
+    (nome, descrição, {labels (tupla de pares): valor}) calculados no momento da coleta.
+    """
+    counters, histograms = collect()
+    lines = []
+    by_name = {}
+    for (name, labels), value in counters.items():
+        by_name.setdefault(name, []).append((labels, value))
+    for (name, labels), values in histograms.items():
+        by_name.setdefault(name, []).append((labels, values))
+
+    for name in sorted(by_name):
+        kind, description = DEFINITIONS.get(name, ('untyped', name))
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(by_name[name]):
+            if kind == 'histogram':
+                for bound, count in zip(DEFAULT_BUCKETS, value):
+                    lines.append(f'{name}_bucket{_labels(labels, [("le", bound)])} {count}')
+                lines.append(f'{name}_bucket{_labels(labels, [("le", "+Inf")])} {value[len(DEFAULT_BUCKETS)]}')
+                lines.append(f'{name}_sum{_labels(labels)} {value[-1]:.6f}')
+                lines.append(f'{name}_count{_labels(labels)} {value[len(DEFAULT_BUCKETS)]}')
+            else:
+                lines.append(f'{name}{_labels(labels)} {value}')
+
+    for name, description, values in gauges:
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} gauge')
+        for labels, value in values.items():
+            lines.append(f'{name}{_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
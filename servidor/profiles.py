@@ -0,0 +1,240 @@
+import os
+import json
+import shutil
+import subprocess
+
+import cv2
+
+# Perfil usado quando o upload não escolhe um e o filtro não tem perfil associado
+DEFAULT_PROFILE = os.environ.get('VIDEO_DEFAULT_PROFILE', 'default')
+# Arquivo JSON opcional com perfis adicionais e perfis por filtro:
+# {"profiles": {"nome": {"codec": "libx264", ...}}, "filters": {"edges": "h264"}}
+PROFILES_FILE = os.environ.get('VIDEO_ENCODER_PROFILES', '')
+# Perfis por filtro também podem vir do ambiente: "edges=h264,grayscale=vp9"
+FILTER_PROFILES_SPEC = os.environ.get('VIDEO_FILTER_PROFILES', '')
+
+_REGISTRY = {}
+_FILTER_PROFILES = {}
+
+
+class EncoderProfile:
+    """
+    Perfil de codificação do vídeo processado. Com backend 'ffmpeg', os frames
+    filtrados são enviados crus a um processo ffmpeg, que aplica codec, CRF,
+    bitrate, threads e opções extras; com backend 'opencv', o cv2.VideoWriter
+    grava com o `fourcc` informado. Sem ffmpeg no PATH, perfis 'ffmpeg' que
+    declaram um `fourcc` recorrem ao OpenCV.
+    """
+
+    def __init__(self, name, description='', backend='ffmpeg', container='webm', codec='libvpx',
+                 fourcc='VP80', crf=None, bitrate=None, max_width=None, max_height=None,
+                 max_fps=None, threads=0, options=None, draft=None):
+        self.name = name
+        self.description = description
+        self.backend = backend
+        self.container = container
+        self.codec = codec
+        self.fourcc = fourcc
+        self.crf = crf
+        self.bitrate = bitrate
+        self.max_width = max_width
+        self.max_height = max_height
+        self.max_fps = max_fps
+        self.threads = threads
+        self.options = options or {}
+        # Perfil de um rascunho rápido codificado antes da versão final (None = sem rascunho)
+        self.draft = draft
+
+    def uses_ffmpeg(self):
+        """Indica se este perfil será codificado pelo ffmpeg nesta instalação."""
+        if self.backend != 'ffmpeg':
+            return False
+        return shutil.which('ffmpeg') is not None or not self.fourcc
+
+    def frame_width(self, width, height):
+        """Largura máxima dos frames de saída para uma entrada width x height (None = sem limite)."""
+        limits = []
+        if self.max_width:
+            limits.append(self.max_width)
+        if self.max_height and height:
+            limits.append(int(self.max_height * width / height))
+        return min(limits) if limits else None
+
+    def output_fps(self, fps):
+        """Taxa de quadros da saída, limitada por max_fps."""
+        if self.max_fps and fps > self.max_fps:
+            return float(self.max_fps)
+        return fps
+
+    def ffmpeg_args(self):
+        """Argumentos de codificação do ffmpeg para este perfil."""
+        # Codecs com subamostragem 4:2:0 exigem dimensões pares
+        args = ['-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2', '-c:v', self.codec, '-pix_fmt', 'yuv420p']
+        if self.crf is not None:
+            args += ['-crf', str(self.crf)]
+            if self.codec.startswith('libvpx') and not self.bitrate:
+                # No VP8/VP9, CRF sem teto de bitrate exige -b:v 0 (qualidade constante)
+                args += ['-b:v', '0']
+        if self.bitrate:
+            args += ['-b:v', str(self.bitrate)]
+        if self.threads:
+            args += ['-threads', str(self.threads)]
+        for option, value in self.options.items():
+            args += [option, str(value)]
+        if self.container == 'mp4':
+            # Coloca o índice no início do arquivo para a reprodução começar antes do download terminar
+            args += ['-movflags', '+faststart']
+        return args
+
+    def settings(self):
+        """Configurações que determinam o arquivo gerado (fazem parte da chave do cache de resultados)."""
+        settings = {
+            'container': self.container,
+            'max_width': self.max_width,
+            'max_height': self.max_height,
+            'max_fps': self.max_fps,
+        }
+        if self.uses_ffmpeg():
+            settings.update({'encoder': 'ffmpeg', 'codec': self.codec, 'crf': self.crf,
+                             'bitrate': self.bitrate, 'options': self.options})
+        else:
+            settings.update({'encoder': 'opencv', 'codec': self.fourcc})
+        return settings
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'description': self.description,
+            'draft': self.draft,
+            **self.settings(),
+        }
+
+
+def register(profile):
+    """Adiciona (ou substitui) um perfil no registro."""
+    _REGISTRY[profile.name] = profile
+    return profile
+
+
+register(EncoderProfile(
+    'default', 'VP8/WebM pelo OpenCV, até 1280 px de largura',
+    backend='opencv', codec=None, max_width=1280,
+))
+register(EncoderProfile(
+    'vp9', 'VP9/WebM com qualidade constante (CRF 33), até 1920 px',
+    codec='libvpx-vp9', fourcc='VP90', crf=33, max_width=1920,
+    options={'-deadline': 'good', '-cpu-used': 2, '-row-mt': 1},
+))
+register(EncoderProfile(
+    'h264', 'H.264/MP4 rápido (CRF 23, preset veryfast), até 1920 px',
+    container='mp4', codec='libx264', fourcc='avc1', crf=23, max_width=1920,
+    options={'-preset': 'veryfast'},
+))
+register(EncoderProfile(
+    'draft', 'Rascunho de baixa resolução: VP8 em tempo real, 480 px e 15 fps',
+    codec='libvpx', crf=30, bitrate='600k', max_width=480, max_fps=15,
+    options={'-deadline': 'realtime', '-cpu-used': 8},
+))
+register(EncoderProfile(
+    'fast-preview', 'Gera primeiro o rascunho (perfil draft) e depois o VP9 em qualidade final',
+    codec='libvpx-vp9', fourcc='VP90', crf=33, max_width=1920,
+    options={'-deadline': 'good', '-cpu-used': 2, '-row-mt': 1}, draft='draft',
+))
+
+
+def _parse_filter_profiles(spec):
+    """Interpreta "filtro=perfil,filtro=perfil" e retorna um dicionário."""
+    mapping = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        filter_name, sep, profile_name = item.partition('=')
+        if not sep:
+            raise ValueError(f"Associação de perfil inválida: '{item}' (use filtro=perfil)")
+        mapping[filter_name.strip()] = profile_name.strip()
+    return mapping
+
+
+def load_config(path=None, filter_spec=None):
+    """Carrega os perfis e as associações filtro -> perfil do arquivo JSON e do ambiente."""
+    path = PROFILES_FILE if path is None else path
+    if path:
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+        for name, values in config.get('profiles', {}).items():
+            register(EncoderProfile(name, **values))
+        _FILTER_PROFILES.update(config.get('filters', {}))
+    _FILTER_PROFILES.update(_parse_filter_profiles(FILTER_PROFILES_SPEC if filter_spec is None else filter_spec))
+
+    for name in [DEFAULT_PROFILE] + list(_FILTER_PROFILES.values()):
+        get_profile(name)
+    for profile in _REGISTRY.values():
+        if profile.draft:
+            get_profile(profile.draft)
+
+
+def get_profile(name=None):
+    """Retorna o perfil com o nome informado (ou o perfil padrão)."""
+    name = name or DEFAULT_PROFILE
+    if name not in _REGISTRY:
+        raise ValueError(f"Perfil de codificação desconhecido: '{name}'")
+    return _REGISTRY[name]
+
+
+def resolve(profile_name, filter_name):
+    """
+    Escolhe o perfil de um upload: o informado explicitamente, senão o associado
+    à cadeia de filtros (primeiro a cadeia inteira, depois cada filtro dela),
+    senão o perfil padrão. Retorna o nome do perfil; lança ValueError se não existir.
+    """
+    if profile_name:
+        return get_profile(profile_name).name
+    candidates = [filter_name] + [step.split(':')[0] for step in filter_name.split('|')]
+    for candidate in candidates:
+        if candidate in _FILTER_PROFILES:
+            return get_profile(_FILTER_PROFILES[candidate]).name
+    return get_profile().name
+
+
+def list_profiles():
+    """Descreve os perfis registrados (usado por GET /profiles)."""
+    return [profile.to_dict() for profile in _REGISTRY.values()]
+
+
+class FfmpegWriter:
+    """Grava frames BGR enviando-os crus pela entrada padrão de um processo ffmpeg."""
+
+    def __init__(self, output_path, profile, fps, size):
+        width, height = size
+        command = [
+            'ffmpeg', '-y', '-v', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-r', f'{fps:.6g}', '-i', '-',
+        ] + profile.ffmpeg_args() + [output_path]
+        try:
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        except OSError as e:
+            print(f"Não foi possível iniciar o ffmpeg: {e}")
+            self.process = None
+
+    def isOpened(self):
+        return self.process is not None and self.process.poll() is None
+
+    def write(self, frame):
+        # O array é enviado sem cópia (buffer contíguo)
+        self.process.stdin.write(frame.data if frame.flags['C_CONTIGUOUS'] else frame.copy().data)
+
+    def release(self):
+        if self.process is None:
+            return
+        self.process.stdin.close()
+        error = self.process.stderr.read()
+        if self.process.wait() != 0:
+            raise RuntimeError(f"ffmpeg falhou ao codificar o vídeo: {error.decode(errors='replace').strip()}")
+
+
+def open_writer(profile, output_path, fps, size):
+    """Abre o gravador do perfil (ffmpeg ou cv2.VideoWriter), com a mesma interface do VideoWriter."""
+    if profile.uses_ffmpeg():
+        return FfmpegWriter(output_path, profile, fps, size)
+    return cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*profile.fourcc), fps, size)
+
+
+load_config()
@@ -0,0 +1,88 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import request, Response, current_app
+from werkzeug.http import quote_etag
+
+from . import database as db
+from . import metrics
+
+# Respostas guardadas em memória por processo (listagens e página inicial); 0 desativa
+CACHE_MAX_ENTRIES = int(os.environ.get('VIDEO_RESPONSE_CACHE_SIZE', '256'))
+# Tempo máximo (s) de uma resposta no cache, mesmo sem alterações nos vídeos
+CACHE_TTL = float(os.environ.get('VIDEO_RESPONSE_CACHE_TTL', '60'))
+
+
+class ResponseCache:
+    """
+    Cache LRU com expiração (TTL) de respostas prontas. Cada entrada guarda a versão
+    dos dados com que foi gerada e só é usada enquanto essa versão for a atual.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # chave -> (versão, expira em, corpo, mimetype, etag)
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != version or entry[1] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, version, body, mimetype):
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        entry = (version, time.monotonic() + self.ttl, body, mimetype, etag)
+        if self.max_entries <= 0:
+            return entry
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = ResponseCache()
+
+
+def cached(build):
+    """
+    Responde a um GET a partir do cache quando os vídeos não mudaram desde que a
+    resposta foi gerada. A chave é a rota com os parâmetros da query string; a versão
+    é o número da última alteração dos vídeos (db.get_videos_version), que muda a
+    cada gravação de add_video_record, inclusive as feitas por outros processos.
+    Responde 304 quando o If-None-Match do cliente coincide com a ETag.
+    `build` gera a resposta (como o retorno de uma rota); só as respostas 200 são guardadas.
+    """
+    version = db.get_videos_version()
+    key = (request.path, tuple(sorted(request.args.items(multi=True))))
+    entry = _cache.get(key, version)
+    if entry is None:
+        metrics.inc('video_response_cache_total', result='miss')
+        response = current_app.make_response(build())
+        if response.status_code != 200:
+            return response
+        entry = _cache.put(key, version, response.get_data(), response.mimetype)
+    else:
+        metrics.inc('video_response_cache_total', result='hit')
+
+    _, _, body, mimetype, etag = entry
+    # no-cache: o navegador sempre confirma com o servidor, que responde 304 se nada mudou
+    headers = {'ETag': quote_etag(etag), 'Cache-Control': 'no-cache'}
+    if request.if_none_match and request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype=mimetype, headers=headers)
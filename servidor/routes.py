@@ -1,130 +1,645 @@
 import os
-import shutil
-from flask import Blueprint, request, jsonify, render_template, send_from_directory
+import re
+import time
+import uuid
+import mimetypes
+import posixpath
+from datetime import datetime
+from flask import Blueprint, request, jsonify, render_template, url_for, g, Response, current_app
 from werkzeug.utils import secure_filename
 
 # Importa funções dos outros módulos do servidor
 from . import database as db
 from . import storage
 from . import utils
-from . import video_processor
+from . import jobs
+from . import filters
+from . import media
+from . import profiles
+from . import derivatives
+from . import metrics
+from . import admission
+from . import response_cache
 
 # Cria um Blueprint para organizar as rotas
 bp = Blueprint('routes', __name__)
 
+# Tamanho padrão e máximo de uma página da listagem de vídeos
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Máximo de saídas (combinações de filtro e perfil) geradas de um vídeo em um pedido
+MAX_OUTPUTS = int(os.environ.get('VIDEO_MAX_OUTPUTS', '8'))
+
+# IDs de correlação aceitos no cabeçalho X-Request-ID (outros valores são substituídos)
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+@bp.before_app_request
+def _start_request():
+    """Associa um ID de correlação à requisição (o do cliente, se válido) e marca o início."""
+    request_id = request.headers.get('X-Request-ID', '')
+    g.request_id = request_id if _REQUEST_ID.match(request_id) else uuid.uuid4().hex
+    g.request_started = time.perf_counter()
+    metrics.set_context(request_id=g.request_id)
+
+@bp.after_app_request
+def _finish_request(response):
+    """Registra a duração, o status e o tamanho da resposta de cada requisição."""
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    # A rota (e não o caminho) é usada como label, para não criar uma série por vídeo
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.observe('video_http_request_seconds', elapsed, route=route)
+    metrics.inc('video_http_requests_total', route=route, method=request.method, status=response.status_code)
+    if response.content_length:
+        metrics.inc('video_http_response_bytes_total', response.content_length, route=route)
+    metrics.log('http_request', method=request.method, path=request.path, route=route,
+                status=response.status_code, bytes=response.content_length,
+                duration_ms=round(elapsed * 1000, 3))
+    response.headers['X-Request-ID'] = g.request_id
+    return response
+
+@bp.teardown_app_request
+def _clear_request(exc):
+    metrics.set_context()
+
+@bp.app_errorhandler(413)
+def _request_too_large(error):
+    """Responde em JSON quando o corpo excede o limite configurado (VIDEO_MAX_UPLOAD_MB)."""
+    limit = current_app.config.get('MAX_CONTENT_LENGTH')
+    return jsonify({'error': 'Arquivo maior que o limite aceito pelo servidor', 'max_bytes': limit}), 413
+
+def _video_query_from_args(args):
+    """
+    Converte os parâmetros da query string (limit, cursor, filter, since, until,
+    min/max_duration, min/max_width, min/max_height, fields) nos argumentos de
+    db.list_videos. Retorna (argumentos, mensagem de erro ou None).
+    """
+    query = {'limit': min(max(args.get('limit', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)}
+    if args.get('cursor'):
+        try:
+            query['after'] = utils.decode_cursor(args['cursor'])
+        except ValueError as e:
+            return None, str(e)
+
+    query['filter_name'] = args.get('filter') or None
+    query['since'] = args.get('since') or None
+    query['until'] = args.get('until') or None
+    for name in ('min_duration', 'max_duration'):
+        query[name] = args.get(name, type=float)
+    for name in ('min_width', 'max_width', 'min_height', 'max_height'):
+        query[name] = args.get(name, type=int)
+
+    if args.get('fields'):
+        fields = [f.strip() for f in args['fields'].split(',') if f.strip()]
+        unknown = [f for f in fields if f not in db.VIDEO_COLUMNS]
+        if unknown:
+            return None, f"Campos desconhecidos: {', '.join(unknown)}"
+        query['columns'] = fields
+    return query, None
+
 @bp.route('/')
 def index():
-    """Renderiza a página HTML principal que lista os vídeos."""
-    videos_from_db = db.get_all_videos()
-    
-    # --- INÍCIO DA CORREÇÃO ---
-    # Prepara os dados para o template, convertendo os caminhos do OS para URLs válidas.
-    # Usar os.sep garante que funcione tanto em Windows ('\') quanto em Linux/Mac ('/').
+    """
+    Renderiza a página HTML principal que lista os vídeos (paginada, com ?cursor=).
+    A página pronta fica em cache até a próxima alteração nos vídeos.
+    """
+    return response_cache.cached(_render_index)
+
+def _render_index():
+    query, error = _video_query_from_args(request.args)
+    if error:
+        return jsonify({'error': error}), 400
+    query.pop('columns', None)
+    videos_from_db, last_key = db.list_videos(**query)
+
+    # Os caminhos no banco já são chaves com '/' (migração 10): servem direto como URLs
     for video in videos_from_db:
-        # Cria chaves novas no dicionário para não alterar os dados originais do DB
-        video['url_original'] = video['path_original'].replace(os.sep, '/')
-        video['url_processed'] = video['path_processed'].replace(os.sep, '/')
+        video['url_original'] = video['path_original']
+        video['url_processed'] = video['path_processed']
 
-        # Gera o caminho da thumbnail de forma robusta e o converte para URL
-        thumb_dir = os.path.dirname(os.path.dirname(video['path_original']))
-        thumb_path_os = os.path.join(thumb_dir, 'thumbs', 'frame_0001.jpg')
-        video['url_thumbnail'] = thumb_path_os.replace(os.sep, '/')
-    # --- FIM DA CORREÇÃO ---
+    next_url = None
+    if last_key:
+        next_url = url_for('routes.index', **{**request.args.to_dict(), 'cursor': utils.encode_cursor(last_key)})
 
     # Envia a lista de vídeos já processada para o template
-    return render_template('index.html', videos=videos_from_db)
+    return render_template('index.html', videos=videos_from_db, next_url=next_url)
 
-@bp.route('/upload', methods=['POST'])
-def upload_video():
-    """Rota para receber o upload de um vídeo do cliente."""
-    if 'video' not in request.files:
-        return jsonify({'error': 'Nenhum arquivo enviado'}), 400
-    
-    file = request.files['video']
-    filter_name = request.form.get('filter')
-
-    if file.filename == '' or not filter_name:
-        return jsonify({'error': 'Nome de arquivo ou filtro inválido'}), 400
-        
-    original_filename = secure_filename(file.filename)
+def _as_list(value):
+    """Aceita um valor único ou uma lista (ex.: campos repetidos do formulário); ignora vazios."""
+    if value is None:
+        return []
+    values = value if isinstance(value, list) else [value]
+    return [v for v in values if v]
+
+def _validate_processing_options(filter_name, segments, profile_name=None, priority=None):
+    """
+    Valida o filtro (ou cadeia de filtros), o número de segmentos, o perfil de
+    codificação e a classe de prioridade de um upload. Filtro e perfil aceitam
+    listas: cada combinação de filtro e perfil é uma saída do vídeo, gerada na
+    mesma decodificação. Retorna ({'filter', 'segments', 'profile', 'priority',
+    'outputs'}, mensagem de erro ou None); 'filter' e 'profile' são os da saída
+    principal e 'outputs' lista as demais ({'filter', 'profile'}).
+    """
+    filter_names = _as_list(filter_name)
+    profile_names = _as_list(profile_name)
+    if not filter_names or not all(isinstance(v, str) for v in filter_names + profile_names):
+        return None, 'Nome de arquivo ou filtro inválido'
+
+    # Valida cada filtro (ou cadeia de filtros) e o normaliza para a forma canônica
+    try:
+        filter_names = [filters.canonical_name(name) for name in filter_names]
+    except ValueError as e:
+        return None, str(e)
+
+    # Número de segmentos para o processamento paralelo (opcional, 1 = serial)
+    if segments is not None and (not isinstance(segments, int) or not 1 <= segments <= (os.cpu_count() or 1)):
+        return None, 'Número de segmentos inválido'
+
+    # Perfil explícito, senão o associado ao filtro, senão o padrão
+    combinations = []
+    try:
+        for name in filter_names:
+            for profile in profile_names or [None]:
+                combination = (name, profiles.resolve(profile, name))
+                if combination not in combinations:
+                    combinations.append(combination)
+        priority = admission.validate_priority(priority)
+    except ValueError as e:
+        return None, str(e)
+    if len(combinations) > MAX_OUTPUTS:
+        return None, f'No máximo {MAX_OUTPUTS} saídas (filtro x perfil) por vídeo'
+
+    (filter_name, profile_name), extra = combinations[0], combinations[1:]
+    return {
+        'filter': filter_name,
+        'segments': segments,
+        'profile': profile_name,
+        'priority': priority,
+        'outputs': [{'filter': name, 'profile': profile} for name, profile in extra],
+    }, None
+
+def _output_filters(options):
+    """Filtros de todas as saídas pedidas (usados na estimativa de custo da admissão)."""
+    return [options['filter']] + [output['filter'] for output in options.get('outputs', [])]
+
+def _rendition_outputs(base_key, outputs):
+    """Acrescenta a chave no armazenamento de cada saída extra ({'filter', 'profile'})."""
+    return [
+        {**output, 'path': storage.rendition_key(base_key, filters.slug(output['filter']), output['profile'],
+                                                 profiles.get_profile(output['profile']).container)}
+        for output in outputs
+    ]
+
+def _register_upload(video_uuid, created, original_filename, mime_type, options, size_bytes, checksum, ticket):
+    """
+    Registra um original já gravado em seu destino definitivo (storage.original_key
+    com o mesmo `video_uuid` e `created`) e enfileira seu processamento (ou
+    reaproveita um resultado já existente). Comum ao upload em uma única
+    requisição e ao upload em partes. `ticket` é o retorno de admission.admit.
+    """
     original_name, original_ext = os.path.splitext(original_filename)
     original_ext = original_ext.lstrip('.')
-
-    # 1. Salva o arquivo temporariamente
-    incoming_path = os.path.join(storage.MEDIA_ROOT, 'incoming', original_filename)
-    file.save(incoming_path)
+    base_key = storage.video_base_key(video_uuid, created)
 
     try:
-        # 2. Gera UUID e timestamp
-        video_uuid = utils.generate_uuid()
+        # 2. Timestamp do registro
         timestamp = utils.get_current_timestamp()
 
-        # 3. Cria a estrutura de pastas, especificando a extensão '.webm' para o arquivo processado
-        output_extension = 'webm'
-        paths = storage.create_video_storage_path(video_uuid, original_ext, filter_name, processed_ext=output_extension)
-
-        # 4. Move o arquivo original para o destino final
-        shutil.move(incoming_path, paths['original'])
-        
-        # 5. Extrai metadados do vídeo
-        video_meta = video_processor.get_video_metadata(paths['original'])
-        file_size = os.path.getsize(paths['original'])
-
-        # 6. Aplica o filtro
-        print(f"Aplicando filtro '{filter_name}' para gerar um arquivo .webm...")
-        
-        # A função apply_filter agora salva em paths['processed'], que já tem a extensão .webm
-        success = video_processor.apply_filter(paths['original'], paths['processed'], filter_name)
-        
-        # A verificação de sucesso agora é confiável
-        if not success:
-            raise Exception("Falha ao processar e salvar o vídeo. O codec VP8 pode não estar disponível.")
-        
-        print("Filtro aplicado e arquivo .webm salvo com sucesso.")
-
-        # 7. Gera thumbnail e preview
-        video_processor.generate_thumbnail(paths['original'], paths['thumbnail'])
-        video_processor.generate_preview_gif(paths['original'], paths['preview'])
-        
-        # 8. Prepara metadados para o banco de dados
-        db_metadata = {
-            'id': video_uuid,
+        # 3. Cria a estrutura de pastas; a extensão do arquivo processado vem do perfil de codificação
+        filter_name = options['filter']
+        profile = profiles.get_profile(options['profile'])
+        # As chaves (caminhos relativos com '/') são as gravadas no payload e no banco
+        paths = storage.create_video_storage_path(video_uuid, original_ext, filters.slug(filter_name),
+                                                  processed_ext=profile.container, created=created)
+        if profile.draft:
+            draft_ext = profiles.get_profile(profile.draft).container
+            paths['draft'] = posixpath.join(posixpath.dirname(paths['processed']), f'draft.{draft_ext}')
+
+        # 4. Publica o original no backend de armazenamento; se o mesmo conteúdo já
+        # estiver armazenado, o arquivo recebido é substituído por um link para ele
+        backend = storage.backend()
+        existing = db.find_video_by_checksum(checksum)
+        with metrics.stage('move'):
+            if existing and backend.exists(existing['path_original']):
+                backend.copy(existing['path_original'], paths['original'])
+            else:
+                backend.publish(paths['original'])
+
+        payload = {
             'original_name': original_name,
             'original_ext': original_ext,
-            'mime_type': file.mimetype,
-            'size_bytes': file_size,
-            'duration_sec': video_meta.get('duration_sec'),
-            'fps': video_meta.get('fps'),
-            'width': video_meta.get('width'),
-            'height': video_meta.get('height'),
+            'mime_type': mime_type,
+            'size_bytes': size_bytes,
+            'checksum': checksum,
             'filter': filter_name,
+            'segments': options['segments'],
+            'profile': profile.name,
+            'priority': ticket['priority'],
+            # Demais combinações de filtro e perfil, gravadas na mesma decodificação
+            'outputs': _rendition_outputs(base_key, options.get('outputs', [])),
             'created_at': timestamp,
-            'path_original': os.path.relpath(paths['original'], storage.MEDIA_ROOT),
-            'path_processed': os.path.relpath(paths['processed'], storage.MEDIA_ROOT)
+            'paths': paths,
+            # Correlaciona os logs do job com os da requisição que o criou
+            'request_id': metrics.current().get('request_id'),
         }
-        
-        # 9. Salva metadados no banco
-        db.add_video_record(db_metadata)
-        
-        # 10. Salva metadados extras no meta.json
-        storage.save_meta_json(paths['meta'], {'checksum': 'TODO', 'filter_params': {}})
 
-        return jsonify({'message': 'Upload e processamento concluídos com sucesso!', 'id': video_uuid}), 201
+        # 5. Conteúdo já processado com o mesmo filtro: reaproveita o resultado
+        if jobs.reuse_cached_result(video_uuid, payload):
+            # Nada será processado: o custo reservado volta para o cliente
+            admission.refund(ticket)
+            return jsonify({
+                'message': 'Este vídeo já foi processado com este filtro; o resultado foi reaproveitado.',
+                'id': video_uuid,
+                'deduplicated': True
+            }), 201
+
+        # 6. Enfileira o processamento; filtro, thumbnail, preview e registro no
+        # banco são executados pelo pool de workers (ver jobs.py)
+        job_id = jobs.enqueue_job(video_uuid, payload,
+                                  priority=admission.PRIORITY_CLASSES[ticket['priority']].priority,
+                                  cost=ticket['cost'])
+
+        return jsonify({
+            'message': 'Upload recebido. O processamento foi enfileirado.',
+            'id': video_uuid,
+            'job_id': job_id,
+            'priority': ticket['priority'],
+            'outputs': [{'filter': filter_name, 'profile': profile.name}] + options.get('outputs', []),
+            'status_url': url_for('routes.get_job_status', job_id=job_id)
+        }), 202
+
+    except jobs.QueueFullError as e:
+        admission.refund(ticket)
+        storage.backend().remove_tree(base_key)
+        return jsonify({'error': str(e)}), 503
 
     except Exception as e:
-        # Em caso de erro, limpa o arquivo temporário se ele ainda existir
-        if os.path.exists(incoming_path):
-            os.remove(incoming_path)
+        # Em caso de erro, remove o original recebido e as pastas do vídeo
+        admission.refund(ticket)
+        storage.backend().remove_tree(base_key)
         print(f"ERRO: {e}")
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/upload', methods=['POST'])
+def upload_video():
+    """
+    Rota para receber o upload de um vídeo do cliente (multipart/form-data, campo
+    'video'). O corpo é lido em blocos direto para o destino definitivo do original.
+    """
+    boundary = request.mimetype_params.get('boundary')
+    if request.mimetype != 'multipart/form-data' or not boundary:
+        return jsonify({'error': 'Nenhum arquivo enviado'}), 400
+
+    # Clientes acima do limite de requisições são recusados antes de enviar o corpo
+    try:
+        admission.check_request_rate()
+    except admission.Rejected as e:
+        return admission.rejected_response(e)
+
+    # 1. O ID do vídeo é gerado antes de receber o arquivo, que já é gravado em sua pasta
+    video_uuid = utils.generate_uuid()
+    created = datetime.now()
+
+    def target_for(filename):
+        original_filename = secure_filename(filename or '')
+        if not original_filename:
+            raise ValueError('Nome de arquivo ou filtro inválido')
+        original_ext = os.path.splitext(original_filename)[1].lstrip('.')
+        return storage.local_path(storage.original_key(video_uuid, original_ext, created))
+
+    base_key = storage.video_base_key(video_uuid, created)
+    try:
+        # Tamanho e SHA-256 são calculados durante a gravação; o contêiner é conferido no início
+        try:
+            with metrics.stage('receive'):
+                form, upload = storage.receive_multipart(request.stream, boundary, 'video', target_for)
+        except storage.UnsupportedMediaError as e:
+            storage.backend().remove_tree(base_key)
+            return jsonify({'error': str(e)}), 415
+        except ValueError as e:
+            storage.backend().remove_tree(base_key)
+            return jsonify({'error': str(e)}), 400
+        if upload is None:
+            return jsonify({'error': 'Nenhum arquivo enviado'}), 400
+        metrics.inc('video_bytes_total', upload['size'], direction='in', kind='upload')
+
+        # 'filter' e 'profile' podem se repetir: uma saída por combinação
+        options, error = _validate_processing_options(
+            form.getlist('filter'), form.get('segments', type=int), form.getlist('profile'), form.get('priority')
+        )
+        if error:
+            storage.backend().remove_tree(base_key)
+            return jsonify({'error': error}), 400
+
+        # Custo estimado (resolução x frames x filtros) contra o limite do cliente e a fila
+        try:
+            ticket = admission.admit(upload['path'], _output_filters(options), options['priority'])
+        except admission.Rejected as e:
+            storage.backend().remove_tree(base_key)
+            return admission.rejected_response(e)
+
+        return _register_upload(video_uuid, created, secure_filename(upload['filename']), upload['mime_type'],
+                                options, upload['size'], upload['checksum'], ticket)
+    except BaseException:
+        # Corpo acima do limite (413), cliente desconectado no meio do envio ou qualquer
+        # outra falha: a pasta do vídeo, com o que já foi gravado, não pode ficar para trás
+        storage.backend().remove_tree(base_key)
+        raise
+
+# --- Upload em partes (retomável) ---
+# 1. POST /uploads                 -> cria a sessão e retorna o upload_id
+# 2. PUT  /uploads/<id>?offset=N   -> grava uma parte (corpo bruto) a partir do byte N
+# 3. GET  /uploads/<id>            -> informa quantos bytes já foram recebidos (para retomar)
+# 4. POST /uploads/<id>/complete   -> finaliza e enfileira o processamento
+
+def _upload_session_response(session):
+    """Prepara uma sessão de upload para ser retornada como JSON."""
+    offset = storage.get_partial_size(session)
+    return {
+        'upload_id': session['id'],
+        'filename': session['filename'],
+        'size': session['size_bytes'],
+        'offset': offset,
+        'state': session['state'],
+        'chunk_size': storage.UPLOAD_CHUNK_SIZE,
+        'upload_url': url_for('routes.upload_chunk', upload_id=session['id']),
+    }
+
+@bp.route('/uploads', methods=['POST'])
+def create_upload():
+    """Inicia um upload em partes."""
+    data = request.get_json(silent=True) or {}
+    original_filename = secure_filename(data.get('filename') or '')
+    size_bytes = data.get('size')
+
+    if not original_filename or not isinstance(size_bytes, int) or size_bytes <= 0:
+        return jsonify({'error': 'Nome de arquivo ou tamanho inválido'}), 400
+
+    options, error = _validate_processing_options(data.get('filters') or data.get('filter'), data.get('segments'),
+                                                  data.get('profiles') or data.get('profile'), data.get('priority'))
+    if error:
+        return jsonify({'error': error}), 400
+
+    try:
+        admission.check_request_rate()
+    except admission.Rejected as e:
+        return admission.rejected_response(e)
+
+    # O ID do upload também será o ID do vídeo: o arquivo parcial já fica na pasta definitiva
+    upload_id = utils.generate_uuid()
+    session = {
+        'id': upload_id,
+        'filename': original_filename,
+        'size_bytes': size_bytes,
+        'mime_type': data.get('mime_type') or mimetypes.guess_type(original_filename)[0],
+        'filter': options['filter'],
+        'segments': options['segments'],
+        'profile': options['profile'],
+        'priority': options['priority'],
+        'outputs': options['outputs'],
+        'created_at': utils.get_current_timestamp()
+    }
+    storage.create_partial_file(session)
+    db.add_upload_session(session)
+    return jsonify(_upload_session_response(db.get_upload_session(upload_id))), 201
+
+@bp.route('/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    """Retorna o estado de um upload em partes (usado para retomar após uma interrupção)."""
+    session = db.get_upload_session(upload_id)
+    if session is None:
+        return jsonify({'error': 'Upload não encontrado'}), 404
+    return jsonify(_upload_session_response(session))
+
+@bp.route('/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """Grava uma parte do arquivo diretamente no disco, a partir do offset informado."""
+    session = db.get_upload_session(upload_id)
+    if session is None or session['state'] != 'open':
+        return jsonify({'error': 'Upload não encontrado ou já finalizado'}), 404
+
+    offset = request.args.get('offset', type=int)
+    current = storage.get_partial_size(session)
+    if offset != current:
+        # O cliente deve retomar a partir do que o servidor já recebeu
+        return jsonify({'error': 'Offset inválido', 'offset': current}), 409
+
+    remaining = session['size_bytes'] - current
+    if request.content_length is not None and request.content_length > remaining:
+        return jsonify({'error': 'A parte excede o tamanho declarado do arquivo', 'offset': current}), 413
+
+    # Se a conexão cair no meio da parte, os bytes já gravados continuam válidos
+    try:
+        with metrics.stage('receive_chunk', upload_id=upload_id):
+            written = storage.write_partial_chunk(session, offset, request.stream, remaining)
+    except storage.UnsupportedMediaError as e:
+        # A primeira parte não é de um vídeo: encerra a sessão sem esperar o restante
+        db.finish_upload_session(upload_id, utils.get_current_timestamp(), state='rejected')
+        storage.discard_partial_file(session)
+        return jsonify({'error': str(e)}), 415
+    metrics.inc('video_bytes_total', written, direction='in', kind='upload')
+    db.touch_upload_session(upload_id, utils.get_current_timestamp())
+    return jsonify({'upload_id': upload_id, 'offset': offset + written})
+
+@bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    """Finaliza um upload em partes e enfileira o processamento do vídeo."""
+    session = db.get_upload_session(upload_id)
+    if session is None or session['state'] != 'open':
+        return jsonify({'error': 'Upload não encontrado ou já finalizado'}), 404
+
+    received = storage.get_partial_size(session)
+    if received != session['size_bytes']:
+        return jsonify({'error': 'Upload incompleto', 'offset': received}), 409
+
+    # Admissão antes de encerrar a sessão: recusado (429), o cliente repete apenas o /complete
+    options = {'filter': session['filter'], 'segments': session['segments'], 'profile': session['profile'],
+               'outputs': session['outputs']}
+    try:
+        ticket = admission.admit(storage.partial_path(session), _output_filters(options),
+                                 session.get('priority') or admission.DEFAULT_PRIORITY)
+    except admission.Rejected as e:
+        return admission.rejected_response(e)
+
+    # Impede que duas finalizações simultâneas enfileirem o mesmo arquivo
+    if not db.finish_upload_session(upload_id, utils.get_current_timestamp()):
+        admission.refund(ticket)
+        return jsonify({'error': 'Upload já finalizado'}), 409
+
+    # Renomeia o parcial para o nome definitivo (mesma pasta); o checksum costuma já estar calculado
+    with metrics.stage('checksum', upload_id=upload_id):
+        _, checksum = storage.finish_partial_file(session)
+
+    return _register_upload(upload_id, datetime.fromisoformat(session['created_at']), session['filename'],
+                            session['mime_type'], options, received, checksum, ticket)
+
+@bp.route('/filters', methods=['GET'])
+def get_filters():
+    """Lista os filtros disponíveis e seus parâmetros, para que o cliente não precise fixá-los."""
+    return jsonify({
+        'filters': filters.list_filters(),
+        'chain_syntax': 'filtro[:param=valor,...]|filtro...  (ex.: resize:width=640|grayscale|edges)'
+    })
+
+@bp.route('/profiles', methods=['GET'])
+def get_profiles():
+    """Lista os perfis de codificação disponíveis e o perfil padrão."""
+    return jsonify({
+        'profiles': profiles.list_profiles(),
+        'default': profiles.DEFAULT_PROFILE
+    })
+
+@bp.route('/jobs', methods=['GET'])
+def list_jobs():
+    """Lista os jobs de processamento mais recentes (opcionalmente filtrados por ?state=)."""
+    state = request.args.get('state')
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    return jsonify([jobs.job_to_response(job) for job in db.get_jobs(state, limit)])
+
+@bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Retorna o estado, o progresso e os tempos de um job de processamento."""
+    job = db.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job não encontrado'}), 404
+    return jsonify(jobs.job_to_response(job))
+
 @bp.route('/videos', methods=['GET'])
 def get_videos():
-    """Retorna uma lista de todos os vídeos registrados no banco."""
-    videos = db.get_all_videos()
-    return jsonify(videos)
+    """
+    Retorna uma página de vídeos, do mais recente para o mais antigo.
+    Use o 'next_cursor' da resposta como ?cursor= para obter a página seguinte.
+    """
+    return response_cache.cached(_list_videos)
+
+def _list_videos():
+    query, error = _video_query_from_args(request.args)
+    if error:
+        return jsonify({'error': error}), 400
+
+    videos, last_key = db.list_videos(**query)
+    return jsonify({
+        'videos': videos,
+        'next_cursor': utils.encode_cursor(last_key) if last_key else None
+    })
+
+@bp.route('/videos/changes', methods=['GET'])
+def get_video_changes():
+    """
+    Alterações no histórico de vídeos depois do cursor ?since= (sem ele, todos os
+    vídeos), para que o cliente mantenha uma cópia local atualizando só o que mudou.
+    Repita a consulta com o 'cursor' da resposta enquanto 'has_more' for verdadeiro.
+    """
+    since = request.args.get('since') or '0'
+    if not since.isdigit():
+        return jsonify({'error': 'Cursor inválido'}), 400
+    limit = min(max(request.args.get('limit', MAX_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+
+    changes, has_more = db.list_video_changes(int(since), limit)
+    return jsonify({
+        'changes': [{'op': c['op'], 'id': c['id'], 'video': c['video']} for c in changes],
+        # Sem alterações novas, o cursor continua o mesmo
+        'cursor': str(changes[-1]['seq']) if changes else since,
+        'has_more': has_more,
+    })
+
+@bp.route('/videos/<video_id>/process', methods=['POST'])
+def process_existing_video(video_id):
+    """
+    Gera novas saídas de um vídeo já registrado, sem reenviar o arquivo: JSON com
+    'filters' (ou 'filter') e opcionalmente 'profiles' (ou 'profile') e 'priority'.
+    Todas as saídas são gravadas em uma única decodificação do original; as que
+    já existem não são geradas de novo.
+    """
+    video = db.get_video(video_id)
+    if video is None:
+        return jsonify({'error': 'Vídeo não encontrado'}), 404
+
+    data = request.get_json(silent=True) or {}
+    options, error = _validate_processing_options(data.get('filters') or data.get('filter'), None,
+                                                  data.get('profiles') or data.get('profile'), data.get('priority'))
+    if error:
+        return jsonify({'error': error}), 400
+
+    existing = {(r['filter'], r['profile']) for r in db.get_renditions(video_id)}
+    requested = [{'filter': options['filter'], 'profile': options['profile']}] + options['outputs']
+    wanted = [o for o in requested if (o['filter'], o['profile']) not in existing]
+    if not wanted:
+        return jsonify({'message': 'Todas as saídas pedidas já existem.', 'id': video_id,
+                        'renditions_url': url_for('routes.get_renditions', video_id=video_id)})
+
+    try:
+        admission.check_request_rate()
+        ticket = admission.admit_metadata(video, [o['filter'] for o in wanted], options['priority'])
+    except admission.Rejected as e:
+        return admission.rejected_response(e)
+
+    # As novas saídas ficam na pasta do vídeo: videos/AAAA/MM/DD/<uuid>/processed/<filtro>/<perfil>.<ext>
+    base_key = posixpath.dirname(posixpath.dirname(video['path_original']))
+    payload = {
+        'kind': 'renditions',
+        'source': video['path_original'],
+        'outputs': _rendition_outputs(base_key, wanted),
+        'priority': ticket['priority'],
+        'request_id': metrics.current().get('request_id'),
+    }
+    try:
+        job_id = jobs.enqueue_job(video_id, payload,
+                                  priority=admission.PRIORITY_CLASSES[ticket['priority']].priority,
+                                  cost=ticket['cost'])
+    except jobs.QueueFullError as e:
+        admission.refund(ticket)
+        return jsonify({'error': str(e)}), 503
+
+    return jsonify({
+        'message': 'O processamento das novas saídas foi enfileirado.',
+        'id': video_id,
+        'job_id': job_id,
+        'priority': ticket['priority'],
+        'outputs': wanted,
+        'status_url': url_for('routes.get_job_status', job_id=job_id),
+        'renditions_url': url_for('routes.get_renditions', video_id=video_id),
+    }), 202
+
+@bp.route('/videos/<video_id>/renditions', methods=['GET'])
+def get_renditions(video_id):
+    """Lista as saídas (filtro, perfil, dimensões e URL) geradas para um vídeo."""
+    if db.get_video(video_id) is None:
+        return jsonify({'error': 'Vídeo não encontrado'}), 404
+    renditions = db.get_renditions(video_id)
+    for rendition in renditions:
+        rendition['url'] = url_for('routes.serve_media', filename=rendition['path'])
+    return jsonify({'renditions': renditions})
+
+@bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Métricas no formato de exposição do Prometheus: duração das etapas dos uploads,
+    frames e bytes processados, latência do banco e das rotas, somadas entre o
+    servidor e os workers da fila, e as profundidades das filas neste momento.
+    """
+    gauges = [
+        ('video_jobs', 'Jobs de processamento por estado',
+         {(('state', state),): db.count_jobs(state) for state in ('queued', 'running')}),
+        ('video_db_pending_writes', 'Escritas aguardando o commit em grupo neste processo',
+         {(): db.pending_writes()}),
+        ('video_derivatives_building', 'Derivadas sendo geradas neste processo',
+         {(): derivatives.building()}),
+    ]
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/media/derived/<video_id>/<name>')
+def serve_derived(video_id, name):
+    """
+    Serve uma derivada do vídeo, gerada no primeiro acesso e mantida em um cache LRU:
+    thumb-<largura>.jpg|webp, sprite-<largura>.jpg|webp ou preview-<largura>.gif|webp.
+    Em thumbs, ?t=<segundos> escolhe o instante do frame (ex.: thumb-320.jpg?t=12.5).
+    """
+    return derivatives.send_derived(video_id, name, request.args.get('t'))
 
 @bp.route('/media/<path:filename>')
 def serve_media(filename):
     """Serve os arquivos de mídia (vídeos, thumbs) para o cliente."""
-    return send_from_directory(storage.MEDIA_ROOT, filename)
\ No newline at end of file
+    return media.send_media(filename)
\ No newline at end of file
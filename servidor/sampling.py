@@ -0,0 +1,250 @@
+import os
+import json
+import posixpath
+import bisect
+import shutil
+import threading
+import subprocess
+from collections import OrderedDict
+
+import cv2
+
+# Custo estimado de um seek, em frames decodificados. Um seek só é usado quando
+# pular até o keyframe anterior ao alvo sai mais barato que decodificar em sequência.
+SEEK_COST_FRAMES = int(os.environ.get('VIDEO_SEEK_COST_FRAMES', '48'))
+# Posição padrão do thumbnail, como fração da duração (o primeiro frame costuma ser preto)
+THUMBNAIL_POSITION = float(os.environ.get('VIDEO_THUMBNAIL_POSITION', '0.1'))
+# Distância máxima (s) para aproximar o thumbnail padrão de um keyframe
+THUMBNAIL_SNAP_SEC = 2.0
+# Nome do índice de keyframes, guardado ao lado do meta.json
+KEYFRAME_INDEX_NAME = 'keyframes.json'
+# Quantidade de índices mantidos em memória por processo
+INDEX_CACHE_SIZE = 256
+
+_index_cache = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def _probe_ffprobe(video_path):
+    """Instantes (s) dos keyframes segundo os pacotes do contêiner (sem decodificar), ou None."""
+    if shutil.which('ffprobe') is None:
+        return None
+    try:
+        output = subprocess.run(
+            ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'packet=pts_time,flags',
+             '-of', 'csv=p=0', video_path],
+            capture_output=True, text=True, timeout=120, check=True
+        ).stdout
+    except (subprocess.SubprocessError, OSError):
+        return None
+
+    times = []
+    for line in output.splitlines():
+        pts_time, _, flags = line.partition(',')
+        if 'K' in flags and pts_time not in ('', 'N/A'):
+            times.append(float(pts_time))
+    return times
+
+
+def _probe_framecrc(video_path):
+    """
+    Alternativa quando só o ffmpeg está instalado: o formato framecrc lista os
+    pacotes copiados (sem decodificar) e marca com F=0x... os que não são keyframes.
+    """
+    if shutil.which('ffmpeg') is None:
+        return None
+    try:
+        output = subprocess.run(
+            ['ffmpeg', '-v', 'error', '-i', video_path, '-map', '0:v:0', '-c', 'copy', '-f', 'framecrc', '-'],
+            capture_output=True, text=True, timeout=120, check=True
+        ).stdout
+    except (subprocess.SubprocessError, OSError):
+        return None
+
+    time_base = None
+    times = []
+    for line in output.splitlines():
+        if line.startswith('#tb 0:'):
+            num, _, den = line.split(':', 1)[1].strip().partition('/')
+            time_base = int(num) / int(den)
+        elif not line.startswith('#') and time_base is not None:
+            fields = [f.strip() for f in line.split(',')]
+            if len(fields) >= 6 and not any(f.startswith('F=') for f in fields[6:]):
+                times.append(int(fields[2]) * time_base)
+    return times
+
+
+def _probe_tools_available():
+    """Indica se há ffprobe ou ffmpeg no PATH para ler os keyframes."""
+    return shutil.which('ffprobe') is not None or shutil.which('ffmpeg') is not None
+
+
+def probe_keyframes(video_path, fps):
+    """
+    Retorna os índices dos keyframes do vídeo (lendo apenas os pacotes do contêiner,
+    pelo ffprobe ou pelo ffmpeg). Retorna None se nenhum dos dois estiver disponível.
+    """
+    if fps <= 0:
+        return None
+    times = _probe_ffprobe(video_path)
+    if times is None:
+        times = _probe_framecrc(video_path)
+    if times is None:
+        return None
+    return sorted(set(int(round(t * fps)) for t in times))
+
+
+def index_path_for(video):
+    """Chave (caminho relativo com '/') do índice de keyframes de um registro de vídeo."""
+    # path_original: videos/AAAA/MM/DD/<uuid>/original/video.ext -> videos/AAAA/MM/DD/<uuid>/keyframes.json
+    return posixpath.join(posixpath.dirname(posixpath.dirname(video['path_original'])), KEYFRAME_INDEX_NAME)
+
+
+def load_index(video_path, index_path=None):
+    """
+    Retorna o índice {'fps', 'frame_count', 'keyframes', 'probed'} do vídeo. É
+    calculado uma única vez por vídeo e gravado em `index_path` (ao lado do
+    meta.json); as chamadas seguintes leem o arquivo ou o cache em memória. Sem
+    ffprobe/ffmpeg, 'keyframes' fica vazio e 'probed' é False: o resultado também
+    é gravado, e a leitura só é refeita quando uma das ferramentas for instalada.
+    Sem keyframes, a amostragem usa o seek do OpenCV (ver sample_frames).
+    """
+    key = index_path or video_path
+    with _index_lock:
+        if key in _index_cache:
+            _index_cache.move_to_end(key)
+            return _index_cache[key]
+
+    index = None
+    if index_path and os.path.exists(index_path):
+        try:
+            with open(index_path, encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = None
+        # Índice gravado sem as ferramentas: refaz a leitura se agora houver uma delas
+        if index is not None and not index.get('probed', True) and _probe_tools_available():
+            index = None
+
+    if index is None:
+        cap = cv2.VideoCapture(video_path)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        keyframes = probe_keyframes(video_path, fps)
+        index = {'fps': fps, 'frame_count': frame_count, 'keyframes': keyframes or [],
+                 'probed': keyframes is not None}
+        if index_path:
+            tmp_path = f"{index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f)
+            os.replace(tmp_path, index_path)
+
+    with _index_lock:
+        _index_cache[key] = index
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
+
+def evenly_spaced(frame_count, count):
+    """Índices de `count` frames espaçados uniformemente em [0, frame_count)."""
+    frame_count = max(frame_count, 1)
+    return sorted(set(int(i * frame_count / count) for i in range(count)))
+
+
+def snap_to_keyframes(targets, keyframes, tolerance):
+    """Troca cada alvo pelo keyframe mais próximo, se houver um a até `tolerance` frames."""
+    if not keyframes:
+        return sorted(set(targets))
+    snapped = set()
+    for target in targets:
+        pos = bisect.bisect_left(keyframes, target)
+        nearest = min(keyframes[max(pos - 1, 0):pos + 1], key=lambda k: abs(k - target))
+        snapped.add(nearest if abs(nearest - target) <= tolerance else target)
+    return sorted(snapped)
+
+
+def sample_frames(video_path, targets, keyframes=(), stats=None):
+    """
+    Decodifica os frames de índices `targets` e retorna [(índice, frame BGR)].
+    Para cada alvo escolhe o mais barato entre continuar decodificando em sequência
+    (grab() sem conversão dos frames intermediários) e saltar para o keyframe
+    anterior ao alvo. Sem `keyframes` (vídeo sem índice), alvos a mais de
+    SEEK_COST_FRAMES frames da posição atual são alcançados com o seek do OpenCV,
+    que vai ao keyframe anterior e decodifica até o alvo.
+    Em `stats` (opcional) ficam os frames decodificados e os seeks.
+    """
+    stats = stats if stats is not None else {}
+    stats.update({'decoded': 0, 'seeks': 0})
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        return []
+
+    frames = []
+    position = 0  # Índice do próximo frame a ser decodificado
+    can_seek = bool(keyframes)
+    for target in sorted(set(targets)):
+        if target < position:
+            continue
+        if can_seek:
+            keyframe = keyframes[bisect.bisect_right(keyframes, target) - 1] if target >= keyframes[0] else None
+            if keyframe is not None and keyframe > position and SEEK_COST_FRAMES + target - keyframe < target - position:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+                if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == keyframe:
+                    position = keyframe
+                    stats['seeks'] += 1
+                else:
+                    # Seek impreciso neste contêiner: recomeça do início e segue só em sequência
+                    cap.release()
+                    cap = cv2.VideoCapture(video_path)
+                    position = 0
+                    can_seek = False
+        elif not keyframes and target - position > SEEK_COST_FRAMES:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+            position = target
+            stats['seeks'] += 1
+
+        while position < target and cap.grab():
+            position += 1
+            stats['decoded'] += 1
+        if position < target or not cap.grab():
+            break
+        position += 1
+        stats['decoded'] += 1
+        ret, frame = cap.retrieve()
+        if ret:
+            frames.append((target, frame))
+
+    cap.release()
+    return frames
+
+
+def sample_evenly(video_path, count, index_path=None, snap=True):
+    """
+    Amostra `count` frames espaçados ao longo do vídeo (previews, sprites).
+    Com `snap`, cada alvo é aproximado do keyframe mais próximo (até meio intervalo
+    entre amostras), o que torna os seeks praticamente gratuitos.
+    """
+    index = load_index(video_path, index_path)
+    targets = evenly_spaced(index['frame_count'], count)
+    if snap:
+        targets = snap_to_keyframes(targets, index['keyframes'], index['frame_count'] / count / 2)
+    return [frame for _, frame in sample_frames(video_path, targets, index['keyframes'])]
+
+
+def frame_at(video_path, seconds=None, index_path=None):
+    """
+    Retorna o frame no instante `seconds` (exato), ou, sem `seconds`, o frame na
+    posição THUMBNAIL_POSITION da duração, aproximado do keyframe mais próximo.
+    Retorna None se o vídeo não puder ser lido.
+    """
+    index = load_index(video_path, index_path)
+    last = max(index['frame_count'] - 1, 0)
+    if seconds is not None:
+        target = min(int(seconds * index['fps']), last) if index['fps'] > 0 else 0
+    else:
+        target = int(last * THUMBNAIL_POSITION)
+        target = snap_to_keyframes([target], index['keyframes'], THUMBNAIL_SNAP_SEC * index['fps'])[0]
+    frames = sample_frames(video_path, [target], index['keyframes'])
+    return frames[0][1] if frames else None
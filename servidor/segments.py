@@ -0,0 +1,155 @@
+import os
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+
+from . import video_processor
+from . import profiles
+from . import sampling
+
+# Número padrão de segmentos processados em paralelo (1 = modo serial)
+SEGMENT_COUNT = int(os.environ.get('VIDEO_SEGMENTS', '1'))
+# Tamanho mínimo (em frames) de cada segmento; vídeos curtos são processados em série
+MIN_SEGMENT_FRAMES = int(os.environ.get('VIDEO_MIN_SEGMENT_FRAMES', '300'))
+# Distância máxima (em frames) para alinhar o limite de um segmento a um keyframe
+KEYFRAME_SNAP_FRAMES = 120
+
+
+def ffmpeg_available():
+    """Indica se o executável ffmpeg está disponível no PATH (os keyframes vêm de sampling)."""
+    return shutil.which('ffmpeg') is not None
+
+
+def warn_if_unavailable():
+    """Avisa, ao iniciar os workers, quando VIDEO_SEGMENTS pede o modo por segmentos sem o ffmpeg instalado."""
+    if SEGMENT_COUNT > 1 and not ffmpeg_available():
+        print(f"AVISO: VIDEO_SEGMENTS={SEGMENT_COUNT}, mas o ffmpeg não foi encontrado no PATH; "
+              "os vídeos serão processados em modo serial.")
+        return False
+    return True
+
+
+def plan_segments(frame_count, segments, keyframes=()):
+    """
+    Divide [0, frame_count) em até `segments` intervalos contíguos de tamanho
+    semelhante, alinhando cada limite ao keyframe mais próximo quando houver um
+    a até KEYFRAME_SNAP_FRAMES frames de distância.
+    """
+    segments = max(1, min(segments, frame_count // MIN_SEGMENT_FRAMES))
+    bounds = [0]
+    for i in range(1, segments):
+        target = i * frame_count // segments
+        nearest = min(keyframes, key=lambda k: abs(k - target), default=None)
+        if nearest is not None and abs(nearest - target) <= KEYFRAME_SNAP_FRAMES:
+            target = nearest
+        if bounds[-1] < target < frame_count:
+            bounds.append(target)
+    bounds.append(frame_count)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _encode_segment(input_path, part_path, filter_name, start, end, profile_name=None):
+    """Processa um segmento em um processo separado (executado pelo ProcessPoolExecutor)."""
+    # Cada segmento já ocupa um núcleo; evita que o OpenCV crie threads adicionais
+    cv2.setNumThreads(1)
+    sinks = [
+        video_processor.FilteredWriterSink(part_path, filter_name, profiles.get_profile(profile_name)),
+        video_processor.StatsSink(),
+    ]
+
+    result = video_processor.run_pipeline(input_path, sinks, start_frame=start, end_frame=end, threads=1)
+    if result is None:
+        return None
+    return {'stats': result['results'][1], 'stage_sec': video_processor.stage_seconds(result, sinks[0])}
+
+
+def concat_parts(part_paths, output_path):
+    """Concatena os arquivos (WebM ou MP4) dos segmentos sem recodificar (ffmpeg concat demuxer)."""
+    list_path = output_path + '.parts.txt'
+    with open(list_path, 'w') as f:
+        for part in part_paths:
+            # Aspas simples precisam ser escapadas no formato do concat demuxer
+            escaped = os.path.abspath(part).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    try:
+        subprocess.run(
+            ['ffmpeg', '-v', 'error', '-y', '-f', 'concat', '-safe', '0', '-i', list_path,
+             '-c', 'copy', output_path],
+            capture_output=True, timeout=600, check=True
+        )
+        return True
+    except (subprocess.SubprocessError, OSError) as e:
+        print(f"Erro ao concatenar segmentos: {e}")
+        return False
+    finally:
+        os.remove(list_path)
+
+
+def process_video_segmented(input_path, paths, filter_name, segments=None, progress_callback=None,
+                            profile_name=None):
+    """
+    Versão paralela de video_processor.process_video: divide o vídeo em segmentos,
+    filtra e codifica cada um em um processo (no perfil de codificação informado)
+    e concatena as partes no arquivo final.
+    Os frames de saída são os mesmos do modo serial. Retorna None quando o vídeo é
+    curto demais, o ffmpeg não está disponível ou algum segmento falha; nesses
+    casos o chamador deve usar o modo serial.
+    """
+    segments = segments or SEGMENT_COUNT
+    if segments <= 1:
+        return None
+    if not ffmpeg_available():
+        print("ffmpeg não encontrado: o vídeo será processado em modo serial.")
+        return None
+
+    info = video_processor.get_video_metadata(input_path)
+    if not info or info['frame_count'] < 2 * MIN_SEGMENT_FRAMES:
+        return None
+
+    # O índice de keyframes fica ao lado do meta.json e é reaproveitado pela amostragem de frames
+    index_path = os.path.join(os.path.dirname(paths['meta']), sampling.KEYFRAME_INDEX_NAME) if paths.get('meta') else None
+    keyframes = sampling.load_index(input_path, index_path)['keyframes']
+    plan = plan_segments(info['frame_count'], segments, keyframes)
+    if len(plan) <= 1:
+        return None
+
+    print(f"Processando {len(plan)} segmentos em paralelo: {plan}")
+    container = profiles.get_profile(profile_name).container
+    part_paths = [f"{paths['processed']}.part{i:03d}.{container}" for i in range(len(plan))]
+    results = [None] * len(plan)
+
+    try:
+        with ProcessPoolExecutor(max_workers=len(plan)) as executor:
+            futures = {
+                # O último segmento lê até o fim do arquivo, como no modo serial
+                executor.submit(_encode_segment, input_path, part_paths[i], filter_name, start,
+                                end if i < len(plan) - 1 else None, profile_name): i
+                for i, (start, end) in enumerate(plan)
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                results[futures[future]] = future.result()
+                if progress_callback:
+                    progress_callback(0.95 * done / len(plan))
+
+        if any(r is None for r in results) or not concat_parts(part_paths, paths['processed']):
+            return None
+    finally:
+        for part in part_paths:
+            if os.path.exists(part):
+                os.remove(part)
+
+    frames_decoded = sum(r['stats']['frames_decoded'] for r in results)
+    elapsed = max(r['stats']['elapsed_sec'] for r in results)
+    stats = {
+        'frames_decoded': frames_decoded,
+        'elapsed_sec': elapsed,
+        'decode_fps': frames_decoded / elapsed if elapsed > 0 else 0,
+        'segments': len(plan),
+        # Tempo ocupado somado entre os segmentos
+        'stage_sec': {
+            stage: sum(r['stage_sec'][stage] for r in results) for stage in ('metadata', 'filter', 'encode')
+        },
+    }
+    return video_processor.finalize_metadata(info, stats)
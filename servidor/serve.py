@@ -0,0 +1,140 @@
+"""
+Ponto de entrada de produção: executa a aplicação em um servidor WSGI com vários
+processos (gunicorn) e threads, em vez do servidor de desenvolvimento do Flask.
+
+    python -m servidor.serve                                   # API, uploads, mídia e fila de jobs
+    python -m servidor.serve --role upload --bind 0.0.0.0:5000 # só API e uploads
+    python -m servidor.serve --role media --bind 0.0.0.0:5001  # só /media (proxy reverso encaminha)
+    python -m servidor.serve --role worker                     # só os workers da fila de jobs
+
+No Windows, onde o gunicorn não roda, é usado o waitress (um processo, várias threads).
+"""
+import os
+import sys
+import signal
+import argparse
+import subprocess
+import threading
+
+from . import app as app_module
+from . import database as db
+from . import jobs
+from . import metrics
+
+# Endereço em que o servidor escuta
+BIND = os.environ.get('VIDEO_BIND', '0.0.0.0:5000')
+# Processos e threads por processo que atendem requisições
+WEB_WORKERS = int(os.environ.get('VIDEO_WEB_WORKERS', str(min(4, (os.cpu_count() or 1) * 2))))
+WEB_THREADS = int(os.environ.get('VIDEO_WEB_THREADS', '8'))
+# Tempo (s) que um worker tem para concluir as requisições em andamento (ex.: uploads) ao encerrar
+GRACEFUL_TIMEOUT = int(os.environ.get('VIDEO_GRACEFUL_TIMEOUT', '120'))
+# Tempo (s) sem sinal de vida após o qual o gunicorn reinicia um worker travado
+WORKER_TIMEOUT = int(os.environ.get('VIDEO_WORKER_TIMEOUT', '60'))
+# Limites da linha de requisição e dos cabeçalhos (o limite do corpo é VIDEO_MAX_UPLOAD_MB)
+LIMIT_REQUEST_LINE = 8190
+LIMIT_REQUEST_FIELDS = 100
+LIMIT_REQUEST_FIELD_SIZE = 8190
+
+ROLES = app_module.ROLES + ('worker',)
+
+
+def _worker_exit(server, worker):
+    """Ao encerrar um worker do gunicorn: grava as escritas pendentes e as métricas do processo."""
+    db.flush_writes()
+    metrics.flush(force=True)
+
+
+def run_gunicorn(role, bind, workers, threads):
+    """Executa a aplicação no gunicorn (bloqueia até o encerramento)."""
+    from gunicorn.app.base import BaseApplication
+
+    class VideoServer(BaseApplication):
+        def load_config(self):
+            options = {
+                'bind': bind,
+                'workers': workers,
+                'threads': threads,
+                # Threads por worker: uploads lentos não bloqueiam o processo inteiro
+                'worker_class': 'gthread',
+                'graceful_timeout': GRACEFUL_TIMEOUT,
+                'timeout': WORKER_TIMEOUT,
+                'limit_request_line': LIMIT_REQUEST_LINE,
+                'limit_request_fields': LIMIT_REQUEST_FIELDS,
+                'limit_request_field_size': LIMIT_REQUEST_FIELD_SIZE,
+                'proc_name': f'video-{role}',
+                'worker_exit': _worker_exit,
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # Cada worker cria sua aplicação; create_app serializa a inicialização com uma trava
+            return app_module.create_app(role)
+
+    VideoServer().run()
+
+
+def run_waitress(role, bind, threads):
+    """Alternativa para o Windows: um processo com várias threads (waitress)."""
+    import waitress
+    application = app_module.create_app(role)
+    waitress.serve(application, listen=bind, threads=threads,
+                   max_request_body_size=application.config['MAX_CONTENT_LENGTH'])
+
+
+def run_workers():
+    """Executa apenas o pool de workers da fila até receber SIGTERM/SIGINT."""
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda signum, frame: stop.set())
+    jobs.start_worker_pool()
+    while not stop.wait(1):
+        pass
+    print("Encerrando os workers da fila...")
+    # Os jobs interrompidos voltam à fila em start_worker_pool (requeue_stale_jobs)
+    jobs.stop_worker_pool(timeout=GRACEFUL_TIMEOUT)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Servidor de produção do sistema de vídeos.')
+    parser.add_argument('--role', default=app_module.SERVER_ROLE, choices=ROLES,
+                        help="'all' (padrão), 'upload', 'media' ou 'worker' (só a fila de jobs)")
+    parser.add_argument('--bind', default=BIND, help=f'endereço:porta (padrão: {BIND})')
+    parser.add_argument('--workers', type=int, default=WEB_WORKERS, help='processos do servidor HTTP')
+    parser.add_argument('--threads', type=int, default=WEB_THREADS, help='threads por processo')
+    parser.add_argument('--no-jobs', action='store_true', help="com --role all, não inicia a fila de jobs")
+    args = parser.parse_args(argv)
+
+    # Inicializa pastas e banco uma vez antes de criar os processos (os workers só conferem)
+    app_module.initialize()
+
+    if args.role == 'worker':
+        run_workers()
+        return 0
+
+    # Com o papel 'all', a fila roda em um processo próprio (o gunicorn recolhe os
+    # processos filhos do seu processo mestre, o que atrapalharia o multiprocessing)
+    job_process = None
+    if args.role == 'all' and not args.no_jobs and jobs.JOB_WORKERS > 0:
+        job_process = subprocess.Popen([sys.executable, '-m', 'servidor.serve', '--role', 'worker'])
+
+    try:
+        if os.name == 'nt':
+            run_waitress(args.role, args.bind, args.threads)
+        else:
+            run_gunicorn(args.role, args.bind, args.workers, args.threads)
+    except ImportError as e:
+        print(f"Servidor de produção indisponível ({e}). Instale as dependências: pip install -r requirements.txt")
+        return 1
+    finally:
+        if job_process is not None:
+            job_process.terminate()
+            try:
+                job_process.wait(GRACEFUL_TIMEOUT + 10)
+            except subprocess.TimeoutExpired:
+                job_process.kill()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
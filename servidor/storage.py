@@ -1,54 +1,317 @@
 import os
 import json
+import shutil
+import hashlib
+import threading
+import posixpath
+from collections import OrderedDict
 from datetime import datetime
 
+from werkzeug.datastructures import MultiDict
+from werkzeug.sansio.multipart import MultipartDecoder, Data, Epilogue, Field, File, NeedData
+
+from . import storage_backends
+
 # Diretório raiz para todos os arquivos de mídia, localizado na raiz do projeto
 MEDIA_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'media'))
 
+# Tamanho sugerido para as partes de um upload retomável e para as gravações em disco
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+WRITE_BUFFER_SIZE = 1024 * 1024
+# Tamanho máximo de um campo de texto de um formulário multipart (filtro, perfil...)
+MAX_FORM_FIELD_BYTES = 64 * 1024
+
+# Confere o cabeçalho do contêiner nos primeiros bytes de cada upload, recusando (415)
+# arquivos que não são vídeo antes de receber o restante do corpo
+PROBE_UPLOADS = os.environ.get('VIDEO_PROBE_UPLOADS', '1') == '1'
+PROBE_BYTES = 512
+# Assinaturas dos contêineres aceitos: (nome, ((offset, bytes), ...)), todas devem coincidir
+CONTAINER_SIGNATURES = (
+    ('mp4', ((4, b'ftyp'),)),                     # MP4, MOV, M4V, 3GP
+    ('mov', ((4, b'moov'),)),
+    ('mov', ((4, b'mdat'),)),
+    ('mov', ((4, b'wide'),)),
+    ('mov', ((4, b'free'),)),
+    ('avi', ((0, b'RIFF'), (8, b'AVI '))),
+    ('matroska', ((0, b'\x1a\x45\xdf\xa3'),)),     # MKV e WebM
+    ('flv', ((0, b'FLV\x01'),)),
+    ('asf', ((0, b'\x30\x26\xb2\x75\x8e\x66\xcf\x11'),)),  # WMV
+    ('ogg', ((0, b'OggS'),)),
+    ('mpeg-ps', ((0, b'\x00\x00\x01\xba'),)),
+    ('mpeg', ((0, b'\x00\x00\x01\xb3'),)),
+    ('mpeg-ts', ((0, b'G'), (188, b'G'))),
+)
+
+
+class UnsupportedMediaError(ValueError):
+    """Lançada quando o início de um upload não corresponde a nenhum contêiner de vídeo conhecido."""
+
+# Backend de armazenamento (ver storage_backends.py), criado no primeiro uso, e o
+# MEDIA_ROOT com que foi criado
+_backend = None
+_backend_root = None
+
+def backend():
+    """
+    Backend configurado em VIDEO_STORAGE_BACKEND ('local', 'sharded' ou 's3').
+    Os uploads em andamento são gravados em local_path() do original e publicados ao final.
+    """
+    global _backend, _backend_root
+    # Recriado se MEDIA_ROOT for alterado (ex.: nos benchmarks, que isolam a mídia)
+    if _backend is None or _backend_root != MEDIA_ROOT:
+        _backend = storage_backends.create_backend(MEDIA_ROOT)
+        _backend_root = MEDIA_ROOT
+    return _backend
+
+def local_path(key):
+    """Caminho local de uma chave (caminho relativo com '/', como os gravados no banco)."""
+    return backend().local_path(key)
+
 def setup_directories():
     """Cria os diretórios base para o armazenamento de mídia."""
     os.makedirs(os.path.join(MEDIA_ROOT, 'incoming'), exist_ok=True)
-    os.makedirs(os.path.join(MEDIA_ROOT, 'videos'), exist_ok=True)
     os.makedirs(os.path.join(MEDIA_ROOT, 'trash'), exist_ok=True)
-    print(f"Diretórios de mídia configurados em: {MEDIA_ROOT}")
+    for root in backend().roots():
+        os.makedirs(os.path.join(root, 'videos'), exist_ok=True)
+    print(f"Diretórios de mídia configurados em: {', '.join(backend().roots())} (backend '{backend().name}')")
 
-def create_video_storage_path(video_uuid, original_ext, filter_name, processed_ext=None):
+def video_base_key(video_uuid, created=None):
+    """Chave da pasta de um vídeo: videos/AAAA/MM/DD/<uuid> (data de `created` ou a atual)."""
+    return posixpath.join('videos', (created or datetime.now()).strftime('%Y/%m/%d'), video_uuid)
+
+def original_key(video_uuid, original_ext, created=None):
+    """Chave do arquivo original de um vídeo, conhecida antes mesmo de o upload terminar."""
+    return posixpath.join(video_base_key(video_uuid, created), 'original', f'video.{original_ext}')
+
+def create_video_storage_path(video_uuid, original_ext, filter_name, processed_ext=None, created=None):
     """
-    Cria a estrutura de pastas para um novo vídeo e retorna os caminhos.
-    Permite uma extensão de arquivo diferente para o vídeo processado.
+    Define as chaves (caminhos relativos com '/') dos arquivos de um novo vídeo e
+    cria as pastas locais correspondentes. Permite uma extensão de arquivo
+    diferente para o vídeo processado. Use local_path() para obter os caminhos em disco.
+    `created` deve ser o mesmo usado em original_key() se o original já foi gravado.
     """
     # Se nenhuma extensão processada for fornecida, usa a original
     if processed_ext is None:
         processed_ext = original_ext
 
-    now = datetime.now()
-    date_path = now.strftime('%Y/%m/%d')
-    
-    base_path = os.path.join(MEDIA_ROOT, 'videos', date_path, video_uuid)
-    
-    # Cria os subdiretórios
-    original_dir = os.path.join(base_path, 'original')
-    processed_dir = os.path.join(base_path, 'processed', filter_name)
-    thumbs_dir = os.path.join(base_path, 'thumbs')
-    
-    for d in [original_dir, processed_dir, thumbs_dir]:
-        os.makedirs(d, exist_ok=True)
-        
-    # Define os caminhos completos dos arquivos
-    paths = {
-        'original': os.path.join(original_dir, f'video.{original_ext}'),
-        'processed': os.path.join(processed_dir, f'video.{processed_ext}'), # <-- USA A NOVA EXTENSÃO
-        'thumbnail': os.path.join(thumbs_dir, 'frame_0001.jpg'),
-        'preview': os.path.join(base_path, 'preview.gif'),
-        'meta': os.path.join(base_path, 'meta.json')
+    base_key = video_base_key(video_uuid, created)
+    keys = {
+        'original': original_key(video_uuid, original_ext, created),
+        'processed': posixpath.join(base_key, 'processed', filter_name, f'video.{processed_ext}'),
+        'thumbnail': posixpath.join(base_key, 'thumbs', 'frame_0001.jpg'),
+        'preview': posixpath.join(base_key, 'preview.gif'),
+        'meta': posixpath.join(base_key, 'meta.json')
     }
-    
-    return paths
+    # Cria os subdiretórios (no ponto de montagem escolhido para o vídeo)
+    for key in keys.values():
+        local_path(key)
+    return keys
+
+def rendition_key(base_key, filter_name, profile_name, processed_ext):
+    """
+    Chave de uma saída extra de um vídeo (além de processed/<filtro>/video.<ext>):
+    processed/<filtro>/<perfil>.<ext>, para que um mesmo filtro possa ser
+    codificado em vários perfis. `base_key` é a pasta do vídeo (video_base_key).
+    """
+    key = posixpath.join(base_key, 'processed', filter_name, f'{profile_name}.{processed_ext}')
+    local_path(key)
+    return key
+
+def detect_container(head):
+    """Nome do contêiner de vídeo identificado pelos primeiros bytes do arquivo, ou None."""
+    for name, signature in CONTAINER_SIGNATURES:
+        if all(head[offset:offset + len(magic)] == magic for offset, magic in signature):
+            return name
+    return None
+
+def _check_container(head):
+    if PROBE_UPLOADS and detect_container(head) is None:
+        raise UnsupportedMediaError('O arquivo enviado não é um vídeo em um formato reconhecido')
+
+def _read_blocks(stream, size):
+    """Blocos lidos do stream, seguidos de None (fim do corpo, como espera o MultipartDecoder)."""
+    while True:
+        data = stream.read(size)
+        if not data:
+            break
+        yield data
+    yield None
+
+def receive_multipart(stream, boundary, file_field, target_for):
+    """
+    Lê um corpo multipart/form-data direto do stream da requisição, sem arquivos
+    temporários: o conteúdo do campo `file_field` é gravado em target_for(nome do
+    arquivo), já o caminho definitivo, em gravações grandes e com o tamanho e o
+    SHA-256 calculados na mesma passagem. O início do arquivo é conferido antes de
+    o restante do corpo ser lido (UnsupportedMediaError; o arquivo é removido).
+    Retorna (MultiDict dos campos de texto, {'filename', 'path', 'size', 'checksum', 'mime_type'} ou None).
+    """
+    # O limite dos campos de texto é conferido abaixo (o do decodificador valeria para o buffer inteiro)
+    decoder = MultipartDecoder(boundary.encode('latin-1'))
+    fields = MultiDict()
+    upload = None
+    part, chunks, out, digest, head = None, [], None, None, None
+    try:
+        for data in _read_blocks(stream, WRITE_BUFFER_SIZE):
+            decoder.receive_data(data)
+            event = decoder.next_event()
+            while not isinstance(event, (Epilogue, NeedData)):
+                if isinstance(event, (Field, File)):
+                    part, chunks = event, []
+                    if isinstance(event, File) and event.name == file_field and upload is None:
+                        path = target_for(event.filename)
+                        out = open(path, 'wb', buffering=WRITE_BUFFER_SIZE)
+                        upload = {'filename': event.filename, 'path': path, 'size': 0,
+                                  'mime_type': event.headers.get('Content-Type')}
+                        digest, head = hashlib.sha256(), b''
+                elif isinstance(event, Data):
+                    if out is not None:
+                        out.write(event.data)
+                        digest.update(event.data)
+                        upload['size'] += len(event.data)
+                        if head is not None:
+                            head += event.data[:PROBE_BYTES - len(head)]
+                            if len(head) >= PROBE_BYTES or not event.more_data:
+                                _check_container(head)
+                                head = None
+                        if not event.more_data:
+                            out.close()
+                            out = None
+                            upload['checksum'] = digest.hexdigest()
+                    elif isinstance(part, Field):
+                        chunks.append(event.data)
+                        if sum(map(len, chunks)) > MAX_FORM_FIELD_BYTES:
+                            raise ValueError(f"Campo '{part.name}' excede o tamanho máximo")
+                        if not event.more_data:
+                            fields.add(part.name, b''.join(chunks).decode('utf-8', 'replace'))
+                    # Outros arquivos do formulário são descartados
+                event = decoder.next_event()
+        if upload is not None and 'checksum' not in upload:
+            raise ValueError('Corpo da requisição incompleto')
+    except BaseException:
+        if out is not None:
+            out.close()
+        if upload is not None and os.path.exists(upload['path']):
+            os.remove(upload['path'])
+        raise
+    return fields, upload
+
+def file_checksum(path):
+    """Calcula o SHA-256 de um arquivo lendo-o em blocos."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(WRITE_BUFFER_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# --- Arquivos parciais dos uploads em partes ---
+# O arquivo parcial já fica na pasta definitiva do vídeo (o ID do upload é o ID do
+# vídeo): ao finalizar, basta renomeá-lo, sem copiar entre sistemas de arquivos.
+
+# SHA-256 incremental dos uploads cujas partes chegaram em ordem a este processo:
+# upload_id -> (bytes já incluídos, hash). Com vários processos, a parte seguinte
+# pode chegar a outro; nesse caso o checksum é calculado ao finalizar.
+MAX_PARTIAL_DIGESTS = 256
+_partial_digests = OrderedDict()
+_partial_digests_lock = threading.Lock()
+
+def upload_original_key(session):
+    """Chave definitiva do original de um upload em partes (ID e data da sessão)."""
+    original_ext = os.path.splitext(session['filename'])[1].lstrip('.')
+    return original_key(session['id'], original_ext, datetime.fromisoformat(session['created_at']))
+
+def partial_path(session):
+    """Caminho do arquivo parcial de um upload em partes, ao lado do destino definitivo."""
+    legacy_path = os.path.join(MEDIA_ROOT, 'incoming', f"{session['id']}.part")
+    if os.path.exists(legacy_path):
+        # Sessões abertas antes de o parcial passar a ficar na pasta do vídeo
+        return legacy_path
+    return backend().path(upload_original_key(session)) + '.part'
+
+def create_partial_file(session):
+    """Cria o arquivo parcial (vazio) de um novo upload em partes."""
+    path = partial_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+
+def get_partial_size(session):
+    """Quantidade de bytes já recebidos de um upload em partes."""
+    try:
+        return os.path.getsize(partial_path(session))
+    except OSError:
+        return 0
+
+def write_partial_chunk(session, offset, stream, limit):
+    """
+    Grava no arquivo parcial, a partir de `offset`, o conteúdo lido do stream
+    (no máximo `limit` bytes), diretamente em disco. A primeira parte tem o
+    contêiner conferido (UnsupportedMediaError). Retorna os bytes gravados.
+    """
+    with _partial_digests_lock:
+        entry = _partial_digests.pop(session['id'], None)
+    digest = entry[1] if entry and entry[0] == offset else (hashlib.sha256() if offset == 0 else None)
+    head = b'' if offset == 0 else None
+
+    written = 0
+    with open(partial_path(session), 'r+b', buffering=WRITE_BUFFER_SIZE) as f:
+        f.seek(offset)
+        while written < limit:
+            chunk = stream.read(min(WRITE_BUFFER_SIZE, limit - written))
+            if not chunk:
+                break
+            if head is not None:
+                head += chunk[:PROBE_BYTES - len(head)]
+                if len(head) >= PROBE_BYTES or written + len(chunk) >= limit:
+                    _check_container(head)
+                    head = None
+            f.write(chunk)
+            if digest is not None:
+                digest.update(chunk)
+            written += len(chunk)
+    if head:
+        # Primeira parte menor que PROBE_BYTES
+        _check_container(head)
+
+    if digest is not None:
+        with _partial_digests_lock:
+            _partial_digests[session['id']] = (offset + written, digest)
+            while len(_partial_digests) > MAX_PARTIAL_DIGESTS:
+                _partial_digests.popitem(last=False)
+    return written
+
+def finish_partial_file(session):
+    """
+    Renomeia o arquivo parcial completo para o destino definitivo do original.
+    Retorna (chave do original, SHA-256), usando o hash calculado durante o
+    recebimento quando todas as partes passaram por este processo.
+    """
+    with _partial_digests_lock:
+        entry = _partial_digests.pop(session['id'], None)
+    path = partial_path(session)
+    checksum = entry[1].hexdigest() if entry and entry[0] == session['size_bytes'] else file_checksum(path)
+
+    key = upload_original_key(session)
+    if os.path.dirname(path) == os.path.dirname(local_path(key)):
+        os.replace(path, local_path(key))
+    else:
+        shutil.move(path, local_path(key))
+    return key, checksum
+
+def discard_partial_file(session):
+    """Remove o arquivo parcial (e o hash em memória) de um upload recusado."""
+    with _partial_digests_lock:
+        _partial_digests.pop(session['id'], None)
+    try:
+        os.remove(partial_path(session))
+    except FileNotFoundError:
+        pass
+    backend().remove_tree(video_base_key(session['id'], datetime.fromisoformat(session['created_at'])))
 
-def save_meta_json(path, data):
-    """Salva um dicionário de metadados em um arquivo meta.json."""
+def save_meta_json(key, data):
+    """Salva um dicionário de metadados no meta.json indicado pela chave e o publica."""
     try:
-        with open(path, 'w') as f:
+        with open(local_path(key), 'w') as f:
             json.dump(data, f, indent=4)
+        backend().publish(key)
     except Exception as e:
         print(f"Erro ao salvar meta.json: {e}")
\ No newline at end of file
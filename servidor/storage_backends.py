@@ -0,0 +1,331 @@
+"""
+Backends de armazenamento dos arquivos de mídia. Os arquivos são identificados por
+chaves relativas separadas por '/' (ex.: "videos/2025/01/31/<uuid>/original/video.mp4"),
+que são as gravadas no banco. O processamento sempre trabalha sobre caminhos locais:
+local_path() indica onde gravar/ler cada chave e publish() torna o arquivo gravado
+visível aos demais servidores (no S3, envia o arquivo; em disco, não faz nada).
+
+    local    um diretório (MEDIA_ROOT), o comportamento original
+    sharded  vários pontos de montagem; cada vídeo fica inteiro em um deles (hash do UUID)
+    s3       bucket S3 ou compatível (MinIO, Ceph...), com MEDIA_ROOT como cache local
+"""
+import os
+import re
+import shutil
+import hashlib
+import mimetypes
+import posixpath
+
+from . import metrics
+
+# Backend usado pelo servidor: 'local', 'sharded' ou 's3'
+STORAGE_BACKEND = os.environ.get('VIDEO_STORAGE_BACKEND', 'local')
+# Pontos de montagem do backend 'sharded', separados por os.pathsep (':' no Linux, ';' no Windows)
+STORAGE_ROOTS = [p for p in os.environ.get('VIDEO_STORAGE_ROOTS', '').split(os.pathsep) if p]
+
+# Configuração do backend 's3'; as credenciais seguem o padrão do boto3 (AWS_ACCESS_KEY_ID etc.)
+S3_BUCKET = os.environ.get('VIDEO_S3_BUCKET', '')
+# Endereço de um serviço compatível (ex.: http://127.0.0.1:9000 para um MinIO local); vazio = AWS
+S3_ENDPOINT_URL = os.environ.get('VIDEO_S3_ENDPOINT_URL') or None
+S3_REGION = os.environ.get('VIDEO_S3_REGION') or None
+# Prefixo das chaves no bucket (permite compartilhar um bucket entre instalações)
+S3_PREFIX = os.environ.get('VIDEO_S3_PREFIX', '').strip('/')
+# Validade (s) das URLs assinadas entregues aos clientes em /media
+S3_URL_EXPIRES = int(os.environ.get('VIDEO_S3_URL_EXPIRES', '3600'))
+# Arquivos acima deste tamanho são enviados em partes (multipart upload), em paralelo
+S3_MULTIPART_THRESHOLD = int(os.environ.get('VIDEO_S3_MULTIPART_MB', '64')) * 1024 * 1024
+S3_MULTIPART_CHUNK_SIZE = int(os.environ.get('VIDEO_S3_PART_MB', '16')) * 1024 * 1024
+S3_MAX_CONCURRENCY = int(os.environ.get('VIDEO_S3_CONCURRENCY', '4'))
+
+BACKENDS = ('local', 'sharded', 's3')
+
+
+
+class StorageConfigError(ValueError):
+    """Configuração do backend de armazenamento inválida ou incompleta (detectada ao criá-lo)."""
+
+
+_UUID = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+
+
+def normalize_key(key):
+    """Converte um caminho relativo (inclusive os antigos, gravados com '\\') em chave com '/'."""
+    return posixpath.normpath(key.replace('\\', '/')).lstrip('/')
+
+
+def link_or_copy(src, dst):
+    """Cria um hard link de src em dst; se o sistema de arquivos não permitir, copia o arquivo."""
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        # Ex.: origem e destino em pontos de montagem diferentes
+        shutil.copy2(src, dst)
+
+
+def _walk_files(directory):
+    """Caminhos relativos (com '/') de todos os arquivos sob `directory`."""
+    for root, _, files in os.walk(directory):
+        rel_root = os.path.relpath(root, directory)
+        for name in files:
+            yield name if rel_root == '.' else '/'.join(rel_root.split(os.sep) + [name])
+
+
+class StorageBackend:
+    """Interface comum dos backends. As chaves são relativas e usam '/' como separador."""
+
+    name = None
+    # True quando os arquivos não são servidos a partir do disco local (ex.: S3)
+    remote = False
+
+    def roots(self):
+        """Diretórios locais usados pelo backend (criados em setup_directories)."""
+        raise NotImplementedError
+
+    def path(self, key):
+        """Caminho local da chave (sem criar pastas)."""
+        raise NotImplementedError
+
+    def local_path(self, key):
+        """Caminho local em que a chave é (ou deve ser) gravada; cria a pasta, se necessário."""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def exists(self, key):
+        return os.path.isfile(self.path(key))
+
+    def fetch(self, key):
+        """Garante uma cópia local da chave e retorna seu caminho (None se ela não existir)."""
+        path = self.path(key)
+        return path if os.path.isfile(path) else None
+
+    def publish(self, key):
+        """Publica o arquivo gravado em local_path(key)."""
+
+    def publish_tree(self, prefix):
+        """Publica todos os arquivos gravados localmente sob o prefixo."""
+        for rel in _walk_files(self.path(prefix)):
+            self.publish(posixpath.join(prefix, rel))
+
+    def copy(self, src_key, dst_key):
+        """Copia (ou vincula) um arquivo já armazenado para outra chave."""
+        link_or_copy(self.path(src_key), self.local_path(dst_key))
+
+    def copy_tree(self, src_prefix, dst_prefix):
+        for rel in _walk_files(self.path(src_prefix)):
+            self.copy(posixpath.join(src_prefix, rel), posixpath.join(dst_prefix, rel))
+
+    def remove(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def remove_tree(self, prefix):
+        shutil.rmtree(self.path(prefix), ignore_errors=True)
+
+    def url(self, key, expires=None):
+        """URL de download direto da chave (ex.: assinada), ou None se deve ser servida pelo Flask."""
+        return None
+
+
+class LocalBackend(StorageBackend):
+    """Todos os arquivos em um único diretório (MEDIA_ROOT)."""
+
+    name = 'local'
+
+    def __init__(self, root):
+        self.root = root
+
+    def roots(self):
+        return [self.root]
+
+    def _path(self, root, key):
+        return os.path.join(root, *normalize_key(key).split('/'))
+
+    def path(self, key):
+        return self._path(self.root, key)
+
+
+class ShardedBackend(LocalBackend):
+    """
+    Distribui os vídeos entre vários pontos de montagem. O ponto de cada vídeo é
+    escolhido por rendezvous hashing do seu UUID: todos os arquivos de um vídeo
+    (original, processados, derivadas) ficam no mesmo disco, e ao acrescentar um
+    ponto de montagem só ~1/N dos vídeos novos mudam de lugar. Arquivos gravados
+    antes da mudança continuam sendo encontrados nos pontos antigos, sem migração.
+    """
+
+    name = 'sharded'
+
+    def __init__(self, roots):
+        if not roots:
+            raise StorageConfigError("O backend 'sharded' requer VIDEO_STORAGE_ROOTS com ao menos um diretório")
+        self.shards = [os.path.abspath(root) for root in roots]
+
+    def roots(self):
+        return list(self.shards)
+
+    def ranking(self, key):
+        """Pontos de montagem em ordem de preferência para a chave."""
+        key = normalize_key(key)
+        match = _UUID.search(key)
+        token = match.group(0) if match else key
+        return sorted(self.shards, reverse=True,
+                      key=lambda root: hashlib.sha1(f'{root}\0{token}'.encode()).digest())
+
+    def path(self, key):
+        ranking = self.ranking(key)
+        candidates = [self._path(root, key) for root in ranking]
+        for path in candidates:
+            if os.path.exists(path):
+                return path
+        # Arquivo novo: fica junto dos demais arquivos da mesma pasta, se ela já existir
+        for path in candidates:
+            if os.path.isdir(os.path.dirname(path)):
+                return path
+        return candidates[0]
+
+    def remove_tree(self, prefix):
+        # Uma pasta pode existir em mais de um ponto (ex.: derivadas geradas antes de um novo disco)
+        for root in self.shards:
+            shutil.rmtree(self._path(root, prefix), ignore_errors=True)
+
+
+class S3Backend(StorageBackend):
+    """
+    Bucket S3 (ou compatível). Os arquivos são gravados primeiro em `cache_root` e
+    enviados com publish() (multipart acima de S3_MULTIPART_THRESHOLD); a cópia
+    local continua servindo de cache para o processamento. /media redireciona o
+    cliente para uma URL assinada, sem passar o conteúdo pelo servidor.
+    `client` permite usar um cliente já criado (ex.: um substituto nos testes) no
+    lugar do criado pelo boto3, que então não precisa estar instalado.
+    """
+
+    name = 's3'
+    remote = True
+
+    def __init__(self, cache_root, bucket, endpoint_url=None, region=None, prefix='', client=None):
+        if not bucket:
+            raise StorageConfigError("O backend 's3' requer VIDEO_S3_BUCKET")
+
+        self.cache_root = cache_root
+        self.bucket = bucket
+        self.prefix = prefix
+        # Sem um cliente próprio, as transferências usam a configuração padrão do cliente
+        self.transfer = None
+        if client is None:
+            try:
+                import boto3
+                from boto3.s3.transfer import TransferConfig
+                from botocore.config import Config
+            except ImportError as e:
+                raise StorageConfigError(
+                    "O backend 's3' (VIDEO_STORAGE_BACKEND=s3) requer o boto3, que não está instalado: "
+                    "pip install -r requirements-s3.txt"
+                ) from e
+            # Serviços compatíveis (MinIO) costumam exigir o endereçamento por caminho
+            config = Config(signature_version='s3v4',
+                            s3={'addressing_style': 'path' if endpoint_url else 'auto'})
+            client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region, config=config)
+            self.transfer = TransferConfig(multipart_threshold=S3_MULTIPART_THRESHOLD,
+                                           multipart_chunksize=S3_MULTIPART_CHUNK_SIZE,
+                                           max_concurrency=S3_MAX_CONCURRENCY)
+        self.client = client
+        self._client_error = client.exceptions.ClientError
+
+    def roots(self):
+        return [self.cache_root]
+
+    def object_key(self, key):
+        key = normalize_key(key)
+        return f'{self.prefix}/{key}' if self.prefix else key
+
+    def path(self, key):
+        return os.path.join(self.cache_root, *normalize_key(key).split('/'))
+
+    def _head(self, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+        except self._client_error as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def exists(self, key):
+        return os.path.isfile(self.path(key)) or self._head(key) is not None
+
+    @metrics.timed('video_storage_seconds', op='fetch')
+    def fetch(self, key):
+        path = self.local_path(key)
+        if os.path.isfile(path):
+            return path
+        if self._head(key) is None:
+            return None
+        tmp_path = f'{path}.{os.getpid()}.download'
+        self.client.download_file(self.bucket, self.object_key(key), tmp_path, Config=self.transfer)
+        os.replace(tmp_path, path)
+        return path
+
+    @metrics.timed('video_storage_seconds', op='publish')
+    def publish(self, key):
+        path = self.path(key)
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        # upload_file divide automaticamente em partes (multipart) acima do limite
+        self.client.upload_file(path, self.bucket, self.object_key(key),
+                                ExtraArgs={'ContentType': mimetype}, Config=self.transfer)
+        metrics.inc('video_storage_bytes_total', os.path.getsize(path), op='publish')
+
+    @metrics.timed('video_storage_seconds', op='copy')
+    def copy(self, src_key, dst_key):
+        # Cópia feita pelo próprio serviço (sem baixar o conteúdo), em partes se necessário
+        self.client.copy({'Bucket': self.bucket, 'Key': self.object_key(src_key)},
+                         self.bucket, self.object_key(dst_key), Config=self.transfer)
+        src_path = self.path(src_key)
+        if os.path.isfile(src_path):
+            link_or_copy(src_path, self.local_path(dst_key))
+
+    def _list(self, prefix):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.object_key(prefix) + '/'):
+            for item in page.get('Contents', []):
+                yield item['Key']
+
+    def copy_tree(self, src_prefix, dst_prefix):
+        src = self.object_key(src_prefix) + '/'
+        for object_key in list(self._list(src_prefix)):
+            rel = object_key[len(src):]
+            self.copy(posixpath.join(src_prefix, rel), posixpath.join(dst_prefix, rel))
+
+    def remove(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+        super().remove(key)
+
+    def remove_tree(self, prefix):
+        keys = list(self._list(prefix))
+        # delete_objects aceita até 1000 chaves por chamada
+        for i in range(0, len(keys), 1000):
+            self.client.delete_objects(Bucket=self.bucket, Delete={
+                'Objects': [{'Key': k} for k in keys[i:i + 1000]], 'Quiet': True
+            })
+        shutil.rmtree(self.path(prefix), ignore_errors=True)
+
+    def url(self, key, expires=None):
+        return self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': self.object_key(key)},
+            ExpiresIn=expires or S3_URL_EXPIRES
+        )
+
+
+def create_backend(media_root, name=None):
+    """Cria o backend configurado (VIDEO_STORAGE_BACKEND) tendo `media_root` como diretório local."""
+    name = name or STORAGE_BACKEND
+    if name == 'local':
+        return LocalBackend(media_root)
+    if name == 'sharded':
+        return ShardedBackend(STORAGE_ROOTS)
+    if name == 's3':
+        return S3Backend(media_root, S3_BUCKET, S3_ENDPOINT_URL, S3_REGION, S3_PREFIX)
+    raise StorageConfigError(f"Backend de armazenamento desconhecido: '{name}' (use {', '.join(BACKENDS)})")
@@ -0,0 +1,225 @@
+import os
+import shutil
+import tempfile
+import subprocess
+
+# Formatos de streaming adaptativo gerados após o processamento ('hls', 'dash' ou 'hls,dash').
+# Vazio (padrão) desativa a etapa: apenas o video.webm é gerado.
+STREAM_FORMATS = [f.strip() for f in os.environ.get('VIDEO_STREAM_FORMATS', '').split(',') if f.strip()]
+# Escada de renditions no formato "altura:kbps", da maior para a menor
+STREAM_LADDER_SPEC = os.environ.get('VIDEO_STREAM_LADDER', '1080:5000,720:2800,480:1400,240:400')
+# Duração (s) de cada segmento; os keyframes de todas as renditions são alinhados a ela
+STREAM_SEGMENT_SEC = int(os.environ.get('VIDEO_STREAM_SEGMENT_SEC', '4'))
+# Preset do x264: mais rápido = arquivos maiores para a mesma qualidade
+STREAM_PRESET = os.environ.get('VIDEO_STREAM_PRESET', 'veryfast')
+# Tempo máximo (s) de uma execução do ffmpeg
+STREAM_TIMEOUT = 1800
+
+SUPPORTED_FORMATS = ('hls', 'dash')
+# Manifesto de cada formato, relativo à pasta do vídeo processado
+MANIFESTS = {
+    'hls': 'hls/master.m3u8',
+    'dash': 'dash/manifest.mpd',
+}
+
+
+def parse_ladder(spec):
+    """
+    Interpreta uma escada como "1080:5000,720:2800" e retorna [(altura, kbps)]
+    da maior para a menor altura. Lança ValueError se a especificação for inválida.
+    """
+    ladder = []
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        height, sep, kbps = item.partition(':')
+        try:
+            rung = (int(height), int(kbps))
+        except ValueError:
+            raise ValueError(f"Rendition inválida: '{item}' (use altura:kbps)")
+        if not sep or rung[0] < 16 or rung[1] <= 0:
+            raise ValueError(f"Rendition inválida: '{item}' (use altura:kbps)")
+        ladder.append(rung)
+    if not ladder:
+        raise ValueError("A escada de renditions está vazia")
+    return sorted(set(ladder), reverse=True)
+
+
+STREAM_LADDER = parse_ladder(STREAM_LADDER_SPEC)
+for _format in STREAM_FORMATS:
+    if _format not in SUPPORTED_FORMATS:
+        raise ValueError(f"Formato de streaming desconhecido: '{_format}'")
+
+
+def enabled():
+    """Indica se a etapa de streaming adaptativo está ativa."""
+    return bool(STREAM_FORMATS) and shutil.which('ffmpeg') is not None
+
+
+def settings():
+    """Configurações que determinam os arquivos de streaming gerados (entram na chave do cache)."""
+    return {
+        'formats': STREAM_FORMATS,
+        'ladder': STREAM_LADDER,
+        'segment_sec': STREAM_SEGMENT_SEC,
+        'preset': STREAM_PRESET,
+    }
+
+
+def select_rungs(source_height, ladder=None):
+    """
+    Mantém apenas as renditions que não ampliam o vídeo. Se a fonte for menor
+    que todas, gera uma única rendition na altura original com o menor bitrate.
+    """
+    ladder = ladder or STREAM_LADDER
+    rungs = [(height, kbps) for height, kbps in ladder if height <= source_height]
+    if not rungs:
+        rungs = [(source_height - source_height % 2, ladder[-1][1])]
+    return rungs
+
+
+def _encode_args(rungs, fps):
+    """Argumentos comuns: divide o vídeo uma vez e codifica cada rendition em H.264 com GOP fixo."""
+    gop = max(1, int(round(fps * STREAM_SEGMENT_SEC)))
+    split = ''.join(f'[s{i}]' for i in range(len(rungs)))
+    # Frames crus não informam o formato do pixel: com setsar=1, o scale ajusta o SAR de cada
+    # rendition para manter a proporção de exibição (o DASH exige a mesma em todas)
+    graph = f'[0:v]setsar=1,split={len(rungs)}{split};' + ';'.join(
+        f'[s{i}]scale=-2:{height}[v{i}]' for i, (height, _) in enumerate(rungs)
+    )
+    args = ['-filter_complex', graph]
+    for i, (_, kbps) in enumerate(rungs):
+        args += [
+            '-map', f'[v{i}]',
+            f'-c:v:{i}', 'libx264',
+            f'-b:v:{i}', f'{kbps}k',
+            f'-maxrate:v:{i}', f'{int(kbps * 1.07)}k',
+            f'-bufsize:v:{i}', f'{int(kbps * 1.5)}k',
+        ]
+    # Keyframes a cada segmento, sem keyframes extras em cortes de cena, para
+    # que todas as renditions tenham segmentos alinhados (troca sem travamentos)
+    args += ['-preset', STREAM_PRESET, '-pix_fmt', 'yuv420p',
+             '-g', str(gop), '-keyint_min', str(gop), '-sc_threshold', '0']
+    return args
+
+
+def _input_args(width, height, fps):
+    """Entrada do ffmpeg: frames BGR crus de `width` x `height`, lidos da entrada padrão."""
+    return ['-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-framerate', str(fps), '-i', '-']
+
+
+def hls_args(out_dir, rungs):
+    """Saída HLS (segmentos .ts) com uma playlist por rendition e a playlist mestre."""
+    stream_map = ' '.join(f'v:{i},name:{height}p' for i, (height, _) in enumerate(rungs))
+    return [
+        '-f', 'hls',
+        '-hls_time', str(STREAM_SEGMENT_SEC),
+        '-hls_playlist_type', 'vod',
+        '-hls_flags', 'independent_segments',
+        '-hls_segment_filename', os.path.join(out_dir, '%v', 'seg_%05d.ts'),
+        '-master_pl_name', 'master.m3u8',
+        '-var_stream_map', stream_map,
+        os.path.join(out_dir, '%v', 'index.m3u8'),
+    ]
+
+
+def dash_args(out_dir, rungs):
+    """Saída DASH (segmentos fMP4) e o manifesto .mpd."""
+    return [
+        '-f', 'dash',
+        '-seg_duration', str(STREAM_SEGMENT_SEC),
+        '-use_template', '1',
+        '-use_timeline', '1',
+        '-adaptation_sets', 'id=0,streams=v',
+        '-init_seg_name', 'init_$RepresentationID$.m4s',
+        '-media_seg_name', 'chunk_$RepresentationID$_$Number%05d$.m4s',
+        os.path.join(out_dir, 'manifest.mpd'),
+    ]
+
+
+BUILDERS = {
+    'hls': hls_args,
+    'dash': dash_args,
+}
+
+
+class LadderEncoder:
+    """
+    Processo do ffmpeg que recebe os frames filtrados (BGR crus) pela entrada
+    padrão e codifica a escada de renditions de um formato na pasta `out_dir`.
+    Uma falha do ffmpeg apenas descarta o formato: o vídeo processado não é afetado.
+    """
+
+    def __init__(self, name, out_dir, width, height, fps, rungs):
+        self.name = name
+        self.out_dir = out_dir
+        self.rungs = rungs
+        shutil.rmtree(out_dir, ignore_errors=True)
+        os.makedirs(out_dir)
+        # Erros vão para um arquivo temporário: um pipe cheio bloquearia o ffmpeg
+        self.errors = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(
+            ['ffmpeg', '-y', '-v', 'error'] + _input_args(width, height, fps)
+            + _encode_args(rungs, fps) + BUILDERS[name](out_dir, rungs),
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=self.errors
+        )
+        self.failed = False
+
+    def write(self, frame):
+        """Envia um frame (array BGR contíguo, no tamanho informado na criação)."""
+        if self.failed:
+            return
+        try:
+            self.process.stdin.write(frame.data)
+        except OSError:
+            # O ffmpeg terminou antes do fim do vídeo; o erro é informado em finish()
+            self.failed = True
+
+    def finish(self):
+        """Aguarda o fim da codificação; retorna True se o formato foi gerado."""
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            returncode = self.process.wait(timeout=STREAM_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            returncode = self.process.wait()
+        self.errors.seek(0)
+        detail = self.errors.read().decode(errors='replace').strip()
+        self.errors.close()
+        if returncode != 0 or self.failed:
+            print(f"Falha ao gerar o streaming {self.name.upper()} (código {returncode}): {detail}")
+            shutil.rmtree(self.out_dir, ignore_errors=True)
+            return False
+        print(f"Streaming {self.name.upper()} gerado com {len(self.rungs)} rendition(s): "
+              f"{', '.join(f'{h}p' for h, _ in self.rungs)}.")
+        return True
+
+
+def start_encoders(base_dir, width, height, fps):
+    """
+    Inicia um LadderEncoder por formato configurado, com saída em pastas dentro
+    de `base_dir` (processed/<filtro>/hls/, processed/<filtro>/dash/). A escada é
+    escolhida pela altura dos frames recebidos, que devem ser os frames filtrados
+    na resolução do original: assim as renditions não passam pela largura máxima
+    nem pelo codec com perdas do perfil do vídeo processado.
+    """
+    if not enabled() or not height or not fps:
+        return []
+    rungs = select_rungs(height)
+    encoders = []
+    for name in STREAM_FORMATS:
+        try:
+            encoders.append(LadderEncoder(name, os.path.join(base_dir, name), width, height, fps, rungs))
+        except OSError as e:
+            print(f"Falha ao iniciar o streaming {name.upper()}: {e}")
+            shutil.rmtree(os.path.join(base_dir, name), ignore_errors=True)
+    return encoders
+
+
+def finish_encoders(encoders):
+    """
+    Finaliza os encoders de start_encoders e retorna {formato: manifesto relativo
+    à pasta do vídeo processado} apenas com os formatos gerados com sucesso.
+    """
+    return {encoder.name: MANIFESTS[encoder.name] for encoder in encoders if encoder.finish()}
@@ -1,4 +1,9 @@
+import os
 import uuid
+import json
+import base64
+import hashlib
+from contextlib import contextmanager
 from datetime import datetime
 
 def generate_uuid():
@@ -7,4 +12,57 @@ def generate_uuid():
 
 def get_current_timestamp():
     """Retorna o timestamp atual no formato ISO 8601."""
-    return datetime.now().isoformat()
\ No newline at end of file
+    return datetime.now().isoformat()
+
+def compute_cache_key(checksum, filter_name, output_settings):
+    """
+    Gera a chave do cache de resultados a partir do conteúdo original, do filtro
+    (na forma canônica, que já inclui os parâmetros) e das configurações de saída.
+    """
+    key = json.dumps({'checksum': checksum, 'filter': filter_name, 'output': output_settings}, sort_keys=True)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+def encode_cursor(key):
+    """Codifica a chave de paginação (created_at, id) em um cursor opaco para URLs."""
+    raw = json.dumps(list(key), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Decodifica um cursor gerado por encode_cursor. Lança ValueError se for inválido."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, video_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError('Cursor inválido')
+    return str(created_at), str(video_id)
+
+@contextmanager
+def file_lock(path):
+    """
+    Trava exclusiva entre processos baseada em arquivo (fcntl no Linux/macOS,
+    msvcrt no Windows). Bloqueia até que nenhum outro processo detenha a trava.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'a+b') as f:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            # LK_LOCK tenta por ~10 s; repete até conseguir
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
@@ -1,7 +1,14 @@
 import cv2
 import os
+import time
+import threading
 from PIL import Image
-import subprocess # <--- Importe o módulo subprocess
+
+from . import filters
+from . import frame_pipeline
+from . import streaming
+from . import profiles
+from . import sampling
 
 def get_video_metadata(video_path):
     """Extrai metadados de um vídeo usando OpenCV."""
@@ -10,143 +17,500 @@ def get_video_metadata(video_path):
         if not cap.isOpened():
             return {}
             
-        metadata = {
-            'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
-            'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
-            'fps': cap.get(cv2.CAP_PROP_FPS),
-            'frame_count': int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
-        }
-        metadata['duration_sec'] = metadata['frame_count'] / metadata['fps'] if metadata['fps'] > 0 else 0
+        metadata = _capture_info(cap)
         cap.release()
         return metadata
     except Exception as e:
         print(f"Erro ao extrair metadados: {e}")
         return {}
 
-def generate_thumbnail(video_path, output_path):
-    """Gera um thumbnail (primeiro frame) de um vídeo."""
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        return False
-    
-    ret, frame = cap.read()
-    if ret:
-        cv2.imwrite(output_path, frame)
-    
-    cap.release()
-    return ret
-
-def generate_preview_gif(video_path, output_path, num_frames=30, resize_factor=0.3):
-    """Gera um GIF animado de preview."""
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
+def generate_thumbnail(video_path, output_path, seconds=None, index_path=None):
+    """
+    Gera um thumbnail de um vídeo no instante `seconds` ou, sem ele, na posição
+    padrão (sampling.THUMBNAIL_POSITION, aproximada de um keyframe).
+    """
+    frame = sampling.frame_at(video_path, seconds, index_path)
+    if frame is None:
         return False
+    return cv2.imwrite(output_path, frame)
 
+def generate_preview_gif(video_path, output_path, num_frames=30, resize_factor=0.3, index_path=None):
+    """Gera um GIF animado de preview."""
     frames = []
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    # Seleciona frames espaçados uniformemente
-    frame_indices = [int(i * total_frames / num_frames) for i in range(num_frames)]
-
-    for i in frame_indices:
-        cap.set(cv2.CAP_PROP_POS_FRAMES, i)
-        ret, frame = cap.read()
-        if ret:
-            # Converte de BGR (OpenCV) para RGB (Pillow)
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            # Redimensiona para o GIF ser menor
-            h, w, _ = frame_rgb.shape
-            new_size = (int(w * resize_factor), int(h * resize_factor))
-            img = Image.fromarray(frame_rgb).resize(new_size, Image.Resampling.LANCZOS)
-            frames.append(img)
-    
-    cap.release()
+    # Frames espaçados uniformemente, aproximados dos keyframes e lidos sem um seek por frame
+    for frame in sampling.sample_evenly(video_path, num_frames, index_path):
+        # Converte de BGR (OpenCV) para RGB (Pillow)
+        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        # Redimensiona para o GIF ser menor
+        h, w, _ = frame_rgb.shape
+        new_size = (int(w * resize_factor), int(h * resize_factor))
+        img = Image.fromarray(frame_rgb).resize(new_size, Image.Resampling.LANCZOS)
+        frames.append(img)
 
     if frames:
         frames[0].save(output_path, save_all=True, append_images=frames[1:], optimize=False, duration=100, loop=0)
         return True
     return False
 
+# --- Pipeline de passagem única ---
+# Cada frame do vídeo original é decodificado uma única vez e entregue a todos
+# os "sinks" registrados (vídeo filtrado, thumbnail, preview, estatísticas).
+
+class FrameSink:
+    """Interface base dos consumidores de frames do pipeline."""
+
+    def open(self, info):
+        """Prepara o sink com os dados do vídeo. Retorna False em caso de falha."""
+        return True
+
+    def consume(self, index, frame):
+        """Recebe o frame de número `index` (BGR, como lido pelo OpenCV)."""
+
+    def close(self):
+        """Finaliza o sink e retorna seu resultado."""
+        return None
+
+
+class FilteredWriterSink(FrameSink):
+    """
+    Aplica o filtro (ou cadeia de filtros) a cada frame e grava o resultado
+    conforme o perfil de codificação (por padrão, WebM com codec VP8).
+    """
+
+    def __init__(self, output_path, filter_name, profile=None):
+        self.output_path = output_path
+        self.filter_name = filter_name
+        self.profile = profile or profiles.get_profile()
+        self.max_width = None
+        self.out = None
+        # Backends 'batch' e 'umat': os frames são filtrados em lotes (ver filters.BatchFilterChain)
+        self.backend = filters.backend()
+        self.batch_size = filters.FILTER_BATCH_SIZE if self.backend != 'frame' else 1
+        self._pending = []
+        self._free_outputs = []
+        # Cada thread do estágio de filtro usa sua própria cadeia (e seus buffers)
+        self._local = threading.local()
+        # Tempo ocupado (s) filtrando (somado entre as threads) e codificando
+        self.filter_sec = 0.0
+        self.encode_sec = 0.0
+        self._timing_lock = threading.Lock()
+
+    def _chain(self):
+        chain = getattr(self._local, 'chain', None)
+        if chain is None:
+            # O frame é reduzido à resolução máxima do perfil ANTES de aplicar o filtro
+            chain = self._local.chain = filters.build_chain(self.filter_name, max_width=self.max_width)
+        return chain
+
+    def _batch_chain(self):
+        chain = getattr(self._local, 'batch_chain', None)
+        if chain is None:
+            chain = self._local.batch_chain = filters.build_batch_chain(
+                self.filter_name, self.max_width, self.batch_size, use_umat=self.backend == 'umat'
+            )
+        return chain
+
+    def open(self, info):
+        self.max_width = self.profile.frame_width(info['width'], info['height'])
+        # Dimensões de saída da cadeia (já considerando a resolução máxima)
+        height, width, _ = self._chain().setup((info['height'], info['width'], 3))
+
+        # Com limite de fps, apenas parte dos frames é filtrada e gravada
+        self.fps = info['fps']
+        self.out_fps = self.profile.output_fps(info['fps'])
+        self.frame_size = (width, height)
+        self.out = profiles.open_writer(self.profile, self.output_path, self.out_fps, (width, height))
+
+        # Verifica se o gravador foi inicializado com sucesso.
+        # Se o codec não estiver disponível, isOpened() retornará False.
+        if not self.out.isOpened():
+            print(f"ERRO CRÍTICO: Não foi possível inicializar o gravador do perfil '{self.profile.name}'.")
+            print("Verifique a instalação do OpenCV e do backend FFmpeg.")
+            return False
+
+        print(f"Gravador inicializado com sucesso para '{self.output_path}' usando o perfil '{self.profile.name}'.")
+        return True
+
+    def wants(self, index):
+        """Indica se o frame de número `index` entra na saída (descarte uniforme acima de max_fps)."""
+        if self.out_fps >= self.fps or self.fps <= 0:
+            return True
+        ratio = self.out_fps / self.fps
+        return int((index + 1) * ratio) > int(index * ratio)
+
+    def prepare(self, index, frame):
+        """
+        Filtra o frame em um array próprio; pode ser executado em paralelo por várias threads.
+        Retorna None para frames descartados pelo limite de fps.
+        """
+        if not self.wants(index):
+            return None
+        started = time.perf_counter()
+        processed = self._chain()(frame, detach=True)
+        with self._timing_lock:
+            self.filter_sec += time.perf_counter() - started
+        return processed
+
+    def prepare_batch(self, indices, frames):
+        """
+        Como prepare, para um lote de frames consecutivos. O resultado é passado a
+        write_batch, que devolve o buffer do lote para ser reaproveitado.
+        """
+        kept = [n for n, index in enumerate(indices) if self.wants(index)]
+        if not kept:
+            return None
+        started = time.perf_counter()
+        chain = self._batch_chain()
+        if chain.input_shape != frames[0].shape:
+            chain.setup(frames[0].shape)
+        with self._timing_lock:
+            output = self._free_outputs.pop() if self._free_outputs else None
+        if output is None or output.shape[1:] != chain.output_shape:
+            output = chain.new_output()
+        processed = chain([frames[n] for n in kept], output)
+        with self._timing_lock:
+            self.filter_sec += time.perf_counter() - started
+        return [indices[n] for n in kept], processed, output
+
+    def write(self, index, processed_frame):
+        """Grava o frame já filtrado; deve ser chamado na ordem dos frames."""
+        if processed_frame is not None:
+            started = time.perf_counter()
+            self.out.write(processed_frame)
+            self.encode_sec += time.perf_counter() - started
+
+    def write_batch(self, prepared):
+        """Grava um lote retornado por prepare_batch, na ordem dos frames."""
+        if prepared is None:
+            return
+        indices, processed, output = prepared
+        for index, frame in zip(indices, processed):
+            self.write(index, frame)
+        with self._timing_lock:
+            self._free_outputs.append(output)
+
+    def _flush(self):
+        """Filtra e grava os frames acumulados no modo serial com lotes."""
+        if self._pending:
+            indices, frames = zip(*self._pending)
+            self._pending = []
+            self.write_batch(self.prepare_batch(indices, frames))
+
+    def consume(self, index, frame):
+        if self.batch_size > 1:
+            # Cada leitura da captura gera um novo array, então os frames são acumulados sem cópia
+            self._pending.append((index, frame))
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+            return
+        # No modo serial o frame é gravado imediatamente, então os buffers da cadeia são reaproveitados
+        if self.wants(index):
+            started = time.perf_counter()
+            processed = self._chain()(frame)
+            self.filter_sec += time.perf_counter() - started
+            self.write(index, processed)
+
+    def close(self):
+        if self.out is not None:
+            self._flush()
+            self.out.release()
+        return self.output_path
+
+
+def output_settings(profile=None):
+    """Configurações que determinam os arquivos gerados (fazem parte da chave do cache de resultados)."""
+    profile = profile or profiles.get_profile()
+    settings = {
+        'profile': profile.settings(),
+    }
+    # Incluído só quando ativo, para não invalidar os resultados já armazenados
+    if streaming.enabled():
+        settings['streaming'] = streaming.settings()
+    return settings
+
+
+class StreamSink(FrameSink):
+    """
+    Gera as renditions HLS/DASH (ver streaming.start_encoders) na mesma
+    decodificação do vídeo processado: cada frame é filtrado na resolução do
+    original e enviado cru ao ffmpeg, sem passar pelo perfil de codificação.
+    """
+
+    def __init__(self, out_dir, filter_name):
+        self.out_dir = out_dir
+        self.filter_name = filter_name
+        self.encoders = []
+        # Como no FilteredWriterSink, cada thread do estágio de filtro usa sua própria cadeia
+        self._local = threading.local()
+
+    def _chain(self):
+        chain = getattr(self._local, 'chain', None)
+        if chain is None:
+            chain = self._local.chain = filters.build_chain(self.filter_name)
+        return chain
+
+    def open(self, info):
+        height, width, _ = self._chain().setup((info['height'], info['width'], 3))
+        self.encoders = streaming.start_encoders(self.out_dir, width, height, info['fps'])
+        # Uma falha no streaming não impede a geração do vídeo processado
+        return True
+
+    def prepare(self, index, frame):
+        return self._chain()(frame, detach=True) if self.encoders else None
+
+    def write(self, index, processed_frame):
+        if processed_frame is not None:
+            for encoder in self.encoders:
+                encoder.write(processed_frame)
+
+    def consume(self, index, frame):
+        if self.encoders:
+            self.write(index, self._chain()(frame))
 
-def apply_filter(input_path, output_path, filter_name):
-    """Aplica um filtro e salva o resultado no formato WebM com codec VP8."""
-    cap = cv2.VideoCapture(input_path)
+    def close(self):
+        return streaming.finish_encoders(self.encoders)
+
+
+class StatsSink(FrameSink):
+    """Conta os frames efetivamente decodificados e mede o tempo do pipeline."""
+
+    def open(self, info):
+        self.frames = 0
+        self.started = time.perf_counter()
+        return True
+
+    def consume(self, index, frame):
+        self.frames += 1
+
+    def close(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            'frames_decoded': self.frames,
+            'elapsed_sec': elapsed,
+            'decode_fps': self.frames / elapsed if elapsed > 0 else 0,
+        }
+
+
+def _capture_info(cap):
+    """Lê do contêiner as propriedades básicas de um vídeo já aberto."""
+    info = {
+        'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        'fps': cap.get(cv2.CAP_PROP_FPS),
+        'frame_count': int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+    }
+    info['duration_sec'] = info['frame_count'] / info['fps'] if info['fps'] > 0 else 0
+    return info
+
+
+def _seek(cap, start_frame, fps):
+    """
+    Posiciona a captura para que o próximo frame lido seja o `start_frame`.
+    Após um seek, CAP_PROP_POS_FRAMES apenas repete o valor pedido, mesmo quando a
+    captura para no keyframe anterior. Por isso, o seek vai até o frame anterior ao
+    início, e a posição real é conferida pelo instante (CAP_PROP_POS_MSEC) do frame
+    decodificado em seguida. Se a captura parou antes, avança com grab(). Se a
+    posição não puder ser confirmada, decodifica em sequência desde o início.
+    """
+    if start_frame <= 0:
+        return True
+    if fps > 0 and cap.grab():
+        # Instante do primeiro frame: em alguns contêineres ele não é zero
+        origin = cap.get(cv2.CAP_PROP_POS_MSEC)
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame - 1)
+        if cap.grab():
+            landed = round((cap.get(cv2.CAP_PROP_POS_MSEC) - origin) * fps / 1000)
+            while 0 <= landed < start_frame - 1 and cap.grab():
+                landed += 1
+            if landed == start_frame - 1:
+                return True
+
+    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    for _ in range(start_frame):
+        if not cap.grab():
+            return False
+    return True
+
+
+def run_pipeline(video_path, sinks, progress_callback=None, start_frame=0, end_frame=None, threads=None):
+    """
+    Decodifica o vídeo uma única vez, entregando cada frame a todos os sinks.
+    Com `start_frame`/`end_frame`, processa apenas o intervalo [start_frame, end_frame);
+    os sinks continuam recebendo os índices absolutos dos frames.
+    Com `threads` > 1 (padrão: frame_pipeline.FILTER_THREADS), decodificação, filtro e
+    codificação rodam em estágios paralelos; os contadores de cada estágio ficam em 'stages'.
+    Retorna um dicionário com as propriedades do vídeo e a lista de resultados
+    dos sinks (na mesma ordem), ou None se o vídeo ou algum sink não puder ser aberto.
+    """
+    started = time.perf_counter()
+    cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         print("Erro: Não foi possível abrir o vídeo de entrada.")
-        return False
+        return None
 
-    # width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    # height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    # fps = cap.get(cv2.CAP_PROP_FPS)
-
-    # # --- INÍCIO DA CORREÇÃO ---
-    # # Define o FourCC para o codec VP8, compatível com o contêiner WebM.
-    # fourcc = cv2.VideoWriter_fourcc(*'VP80')
-    
-    # # Inicializa o VideoWriter
-    # out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
-
-    # --- OTIMIZAÇÃO: DEFINIR UMA RESOLUÇÃO MÁXIMA ---
-    target_width = 1280  # Alvo: 720p de largura
-    original_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    original_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    
-    # Se o vídeo for maior que o alvo, calcula as novas dimensões mantendo a proporção
-    if original_width > target_width:
-        aspect_ratio = original_height / original_width
-        height = int(target_width * aspect_ratio)
-        width = target_width
-    else:
-        width = original_width
-        height = original_height
-
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    fourcc = cv2.VideoWriter_fourcc(*'VP80')
-    # fourcc = cv2.VideoWriter_fourcc(*'VP90') # Usando VP9 como sugestão
-    
-    # Usa as novas dimensões (width, height) para inicializar o VideoWriter
-    out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
-    
-    # Verifica se o VideoWriter foi inicializado com sucesso.
-    # Se o codec VP8 não estiver disponível, isOpened() retornará False.
-    if not out.isOpened():
-        print("ERRO CRÍTICO: Não foi possível inicializar o VideoWriter com o codec VP8.")
-        print("Verifique a instalação do OpenCV e do backend FFmpeg.")
+    info = _capture_info(cap)
+    # Tempo para abrir o contêiner e ler os metadados (etapa 'metadata' das métricas)
+    info['open_sec'] = time.perf_counter() - started
+    if not _seek(cap, start_frame, info['fps']):
+        print(f"Erro: Não foi possível posicionar o vídeo no frame {start_frame}.")
         cap.release()
-        return False
-    # --- FIM DA CORREÇÃO ---
-
-    print(f"VideoWriter inicializado com sucesso para '{output_path}' usando o codec VP8.")
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        # Redimensiona o frame ANTES de aplicar o filtro
-        if width != original_width:
-            frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
-
-        # ... (lógica dos filtros permanece a mesma) ...
-        processed_frame = None
-        if filter_name == 'grayscale':
-            gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            processed_frame = cv2.cvtColor(gray_frame, cv2.COLOR_GRAY2BGR)
-        elif filter_name == 'pixelize':
-            h, w, _ = frame.shape
-            pixel_size = 16
-            small = cv2.resize(frame, (w // pixel_size, h // pixel_size), interpolation=cv2.INTER_LINEAR)
-            processed_frame = cv2.resize(small, (w, h), interpolation=cv2.INTER_NEAREST)
-        elif filter_name == 'edges':
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            edges = cv2.Canny(gray, 100, 200)
-            processed_frame = cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR)
+        return None
+
+    opened = []
+    for sink in sinks:
+        if not sink.open(info):
+            for s in opened:
+                s.close()
+            cap.release()
+            return None
+        opened.append(sink)
+
+    last_frame = end_frame if end_frame is not None else info['frame_count']
+    total_frames = last_frame - start_frame
+    threads = threads or frame_pipeline.FILTER_THREADS
+
+    try:
+        if threads > 1 and any(hasattr(sink, 'prepare') for sink in sinks):
+            _, info['stages'] = frame_pipeline.run_threaded(
+                cap, sinks, start_frame, end_frame, threads, progress_callback, total_frames
+            )
         else:
-            processed_frame = frame
+            index = start_frame
+            while end_frame is None or index < end_frame:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+
+                for sink in sinks:
+                    sink.consume(index, frame)
+
+                index += 1
+                if progress_callback and total_frames > 0:
+                    progress_callback(min((index - start_frame) / total_frames, 1.0))
+    finally:
+        print("Processamento de frames concluído. Finalizando os arquivos de saída...")
+        cap.release()
+        results = [sink.close() for sink in sinks]
+
+    info['results'] = results
+    return info
 
-        out.write(processed_frame)
 
-    print("Processamento de frames concluído. Finalizando o arquivo de vídeo...")
-    cap.release()
-    out.release()
+def apply_filter(input_path, output_path, filter_name, progress_callback=None, profile=None):
+    """
+    Aplica um filtro e salva o resultado conforme o perfil de codificação (padrão: WebM com codec VP8).
+    Se `progress_callback` for informado, ele recebe a fração (0.0 a 1.0) de frames processados.
+    """
+    result = run_pipeline(input_path, [FilteredWriterSink(output_path, filter_name, profile)], progress_callback)
+    if result is None:
+        return False
     print("Arquivo de vídeo salvo com sucesso.")
-    return True
\ No newline at end of file
+    return True
+
+
+def process_video(input_path, paths, filter_name, progress_callback=None, profile=None, outputs=(),
+                  streams_dir=None):
+    """
+    Gera, em uma única decodificação do original, o vídeo filtrado (no perfil de
+    codificação informado) e os metadados do vídeo. Thumbnails e previews são
+    gerados sob demanda (ver derivatives.py).
+    `outputs` são saídas extras (caminho, filtro, perfil) gravadas na mesma
+    passagem: cada frame é decodificado uma vez e entregue a todos os gravadores.
+    Com `streams_dir`, as renditions HLS/DASH são geradas nessa pasta na mesma
+    passagem (ver StreamSink) e os manifestos gerados ficam em 'streams'.
+    Retorna os metadados (como em get_video_metadata, com a contagem real de
+    frames) acrescidos de 'stats' e de 'outputs' (caminho, largura, altura e fps
+    de cada saída gravada, a principal primeiro), ou None em caso de falha.
+    """
+    writers = [FilteredWriterSink(paths['processed'], filter_name, profile)]
+    writers += [FilteredWriterSink(path, name, output_profile) for path, name, output_profile in outputs]
+    streams = [StreamSink(streams_dir, filter_name)] if streams_dir else []
+    sinks = writers + streams + [StatsSink()]
+    result = run_pipeline(input_path, sinks, progress_callback)
+    if result is None:
+        return None
+
+    if streams:
+        result['streams'] = result['results'][-2]
+    stats = result.pop('results')[-1]
+    if 'stages' in result:
+        stats['stages'] = result.pop('stages')
+    stats['stage_sec'] = stage_seconds(result, *writers)
+    result['outputs'] = [
+        {'path': w.output_path, 'width': w.frame_size[0], 'height': w.frame_size[1], 'fps': w.out_fps}
+        for w in writers
+    ]
+    return finalize_metadata(result, stats)
+
+
+def build_streams(input_path, streams_dir, filter_name, progress_callback=None):
+    """
+    Gera apenas as renditions HLS/DASH a partir do original (com o filtro aplicado),
+    quando o vídeo processado não foi gerado por process_video (ex.: modo segmentado).
+    Retorna {formato: manifesto}, como o resultado do StreamSink.
+    """
+    result = run_pipeline(input_path, [StreamSink(streams_dir, filter_name)], progress_callback)
+    return result['results'][0] if result is not None else {}
+
+
+def render_outputs(input_path, outputs, progress_callback=None):
+    """
+    Gera várias saídas (caminho, filtro, perfil) de um vídeo já registrado em uma
+    única decodificação. Retorna os metadados com 'outputs' (como em process_video)
+    ou None em caso de falha.
+    """
+    writers = [FilteredWriterSink(path, name, profile) for path, name, profile in outputs]
+    result = run_pipeline(input_path, writers + [StatsSink()], progress_callback)
+    if result is None:
+        return None
+
+    stats = result.pop('results')[-1]
+    result.pop('stages', None)
+    stats['stage_sec'] = stage_seconds(result, *writers)
+    result['outputs'] = [
+        {'path': w.output_path, 'width': w.frame_size[0], 'height': w.frame_size[1], 'fps': w.out_fps}
+        for w in writers
+    ]
+    return finalize_metadata(result, stats)
+
+
+def process_draft(input_path, paths, filter_name, profile, progress_callback=None):
+    """
+    Codifica o rascunho rápido (paths['draft']), para que o vídeo possa ser
+    exibido antes da versão final. Retorna os metadados ou None em caso de falha.
+    """
+    sinks = [
+        FilteredWriterSink(paths['draft'], filter_name, profile),
+        StatsSink(),
+    ]
+    result = run_pipeline(input_path, sinks, progress_callback)
+    if result is None:
+        return None
+
+    _, stats = result.pop('results')
+    result.pop('stages', None)
+    stats['stage_sec'] = stage_seconds(result, sinks[0])
+    return finalize_metadata(result, stats)
+
+
+def stage_seconds(result, *writers):
+    """Tempo das etapas metadata, filter e encode (somado entre os gravadores) de uma execução do pipeline."""
+    return {
+        'metadata': result.pop('open_sec', 0.0),
+        'filter': sum(writer.filter_sec for writer in writers),
+        'encode': sum(writer.encode_sec for writer in writers),
+    }
+
+
+def finalize_metadata(result, stats):
+    """Completa os metadados do pipeline com a contagem real de frames e os resultados dos sinks."""
+    if stats['frames_decoded'] > 0:
+        # A contagem do contêiner é uma estimativa; a decodificação fornece o valor exato
+        result['frame_count'] = stats['frames_decoded']
+        result['duration_sec'] = result['frame_count'] / result['fps'] if result['fps'] > 0 else 0
+    result['stats'] = stats
+    print(f"Pipeline concluído: {stats['frames_decoded']} frames em {stats['elapsed_sec']:.2f}s "
+          f"({stats['decode_fps']:.1f} fps).")
+    for name, stage in stats.get('stages', {}).items():
+        print(f"  estágio {name}: {stage['frames']} frames, {stage['fps']} fps, espera {stage['wait_sec']}s")
+    return result
@@ -0,0 +1,49 @@
+import os
+
+import cv2
+import pytest
+
+from benchmarks import synth
+
+
+@pytest.fixture
+def small_video(tmp_path):
+    """Vídeo sintético curto (MJPG, 96x64, 40 frames a 25 fps) gravado pelo próprio OpenCV."""
+    path = os.path.join(tmp_path, 'small.avi')
+    if not synth.synthesize(path, 96, 64, 1.6, 25, 'MJPG'):
+        pytest.skip('codec MJPG indisponível no OpenCV')
+    return path
+
+
+def decode_all(video_path):
+    """Todos os frames do vídeo, decodificados em sequência."""
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Banco de dados novo, já migrado, em um diretório temporário."""
+    from servidor import database
+    monkeypatch.setattr(database, 'DATABASE_PATH', os.path.join(tmp_path, 'videos.db'))
+    database.init_db()
+    yield database
+    database.flush_writes()
+    database.close_db_connection()
+
+
+@pytest.fixture
+def media_root(tmp_path, monkeypatch):
+    """Armazenamento local (backend 'local') em um diretório temporário."""
+    from servidor import storage
+    root = os.path.join(tmp_path, 'media')
+    monkeypatch.setattr(storage, 'MEDIA_ROOT', root)
+    storage.setup_directories()
+    return root
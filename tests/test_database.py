@@ -0,0 +1,33 @@
+import sqlite3
+import threading
+
+import pytest
+
+
+def test_migrations_reach_the_current_version_once(db, capsys):
+    conn = sqlite3.connect(db.DATABASE_PATH)
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == db.SCHEMA_VERSION
+    conn.close()
+    capsys.readouterr()
+    db.init_db()
+    assert 'Aplicando migração' not in capsys.readouterr().out
+
+
+def test_newer_schema_is_refused(db):
+    conn = sqlite3.connect(db.DATABASE_PATH)
+    conn.execute(f'PRAGMA user_version = {db.SCHEMA_VERSION + 1}')
+    conn.close()
+    with pytest.raises(RuntimeError, match='mais nova'):
+        db.init_db()
+
+
+def test_connection_is_reused_per_thread_and_uses_wal(db):
+    conn = db.get_db_connection()
+    assert db.get_db_connection() is conn
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+    other = []
+    thread = threading.Thread(target=lambda: (other.append(db.get_db_connection()), db.close_db_connection()))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
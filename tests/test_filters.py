@@ -0,0 +1,95 @@
+import cv2
+import numpy as np
+import pytest
+
+from servidor import filters, profiles, video_processor
+
+
+class CollectWriter:
+    """Gravador falso que guarda os frames recebidos."""
+
+    def __init__(self):
+        self.frames = []
+
+    def isOpened(self):
+        return True
+
+    def write(self, frame):
+        self.frames.append(frame.copy())
+
+    def release(self):
+        pass
+
+
+class Invert(filters.Filter):
+    """Filtro sem apply_umat próprio."""
+    name = 'invert'
+
+    def apply(self, frame, dst=None):
+        return cv2.bitwise_not(frame, dst=dst)
+
+
+@pytest.fixture
+def writers(monkeypatch):
+    created = []
+
+    def open_writer(profile, path, fps, size):
+        created.append(CollectWriter())
+        return created[-1]
+    monkeypatch.setattr(profiles, 'open_writer', open_writer)
+    return created
+
+
+def render(video_path, spec, backend, threads, monkeypatch, writers):
+    monkeypatch.setattr(filters, 'FILTER_BACKEND', backend)
+    writers.clear()
+    sink = video_processor.FilteredWriterSink('saida.mp4', spec)
+    assert video_processor.run_pipeline(video_path, [sink], threads=threads) is not None
+    return writers[0].frames
+
+
+def test_parse_chain_fills_defaults_and_format_chain_omits_them():
+    steps = filters.parse_chain(' resize:width=320 | grayscale|pixelize:size=16')
+    assert [name for name, _ in steps] == ['resize', 'grayscale', 'pixelize']
+    assert steps[0][1]['width'] == 320
+    assert filters.format_chain(steps) == 'resize:width=320|grayscale|pixelize'
+    assert filters.canonical_name('pixelize:size=16') == 'pixelize'
+
+
+@pytest.mark.parametrize('spec', ['', 'blur', 'pixelize:size=abc'])
+def test_parse_chain_rejects_invalid_specs(spec):
+    with pytest.raises(ValueError):
+        filters.parse_chain(spec)
+
+
+@pytest.mark.parametrize('backend', ['batch', 'umat'])
+@pytest.mark.parametrize('threads', [1, 2])
+@pytest.mark.parametrize('spec', ['grayscale', 'pixelize:size=7|grayscale', 'edges', 'resize:width=48'])
+def test_batch_backends_match_frame_backend(small_video, spec, backend, threads, monkeypatch, writers):
+    # Lote que não divide a quantidade de frames, para incluir um lote incompleto
+    monkeypatch.setattr(filters, 'FILTER_BATCH_SIZE', 6)
+    expected = render(small_video, spec, 'frame', 1, monkeypatch, writers)
+    produced = render(small_video, spec, backend, threads, monkeypatch, writers)
+    assert len(produced) == len(expected) > 0
+    assert all(np.array_equal(a, b) for a, b in zip(expected, produced))
+
+
+def test_threaded_frame_backend_filters_frame_by_frame(small_video, monkeypatch, writers):
+    def no_batches(*args, **kwargs):
+        raise AssertionError("backend 'frame' não deve usar a BatchFilterChain")
+    monkeypatch.setattr(filters, 'build_batch_chain', no_batches)
+    expected = render(small_video, 'edges', 'frame', 1, monkeypatch, writers)
+    produced = render(small_video, 'edges', 'frame', 2, monkeypatch, writers)
+    assert len(produced) == len(expected) > 0
+    assert all(np.array_equal(a, b) for a, b in zip(expected, produced))
+
+
+def test_filter_without_umat_version_runs_on_umat_chain(monkeypatch):
+    monkeypatch.setitem(filters._REGISTRY, 'invert', Invert)
+    frames = [np.full((8, 10, 3), value, np.uint8) for value in (0, 100, 255)]
+    chain = filters.BatchFilterChain([('invert', {}), ('grayscale', {})], batch_size=4, use_umat=True)
+    chain.setup(frames[0].shape)
+    produced = chain(frames, chain.new_output())
+
+    reference = filters.FilterChain([('invert', {}), ('grayscale', {})])
+    assert all(np.array_equal(out, reference(frame)) for out, frame in zip(produced, frames))
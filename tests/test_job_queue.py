@@ -0,0 +1,19 @@
+def test_claim_next_job_takes_highest_priority_then_oldest(db):
+    db.add_job('old-low', 'v1', {}, '2024-01-01T00:00:00', priority=0)
+    db.add_job('new-high', 'v2', {}, '2024-01-01T00:00:02', priority=10)
+    db.add_job('old-high', 'v3', {}, '2024-01-01T00:00:01', priority=10)
+
+    claimed = [db.claim_next_job('w', '2024-01-01T00:01:00')['id'] for _ in range(3)]
+    assert claimed == ['old-high', 'new-high', 'old-low']
+    assert db.claim_next_job('w', '2024-01-01T00:01:00') is None
+
+
+def test_priority_floor_limits_running_low_priority_jobs(db):
+    db.add_job('low-1', 'v1', {}, '2024-01-01T00:00:00', priority=0)
+    db.add_job('low-2', 'v2', {}, '2024-01-01T00:00:01', priority=0)
+
+    assert db.claim_next_job('w1', 'now', priority_floor=5, max_below_floor=1)['id'] == 'low-1'
+    # Já há um job abaixo do piso em execução: o segundo espera
+    assert db.claim_next_job('w2', 'now', priority_floor=5, max_below_floor=1) is None
+    db.add_job('high', 'v3', {}, '2024-01-01T00:00:02', priority=10)
+    assert db.claim_next_job('w2', 'now', priority_floor=5, max_below_floor=1)['id'] == 'high'
@@ -0,0 +1,59 @@
+import shutil
+
+import pytest
+
+from servidor import jobs, segments, storage, utils, video_processor
+
+VIDEO_ID = '123e4567-e89b-12d3-a456-426614174000'
+
+
+@pytest.fixture
+def payload(db, media_root, small_video, monkeypatch):
+    """Payload de um upload com o perfil 'fast-preview' (rascunho e depois a versão final)."""
+    monkeypatch.setattr(segments, 'SEGMENT_COUNT', 1)
+    paths = storage.create_video_storage_path(VIDEO_ID, 'avi', 'grayscale', processed_ext='webm')
+    paths['draft'] = paths['processed'].replace('video.webm', 'draft.webm')
+    shutil.copy(small_video, storage.local_path(paths['original']))
+    return {
+        'original_name': 'small', 'original_ext': 'avi', 'size_bytes': 1, 'filter': 'grayscale',
+        'profile': 'fast-preview', 'outputs': [], 'created_at': utils.get_current_timestamp(), 'paths': paths,
+    }
+
+
+def fake_meta(path, width):
+    open(path, 'wb').close()
+    return {'width': width, 'height': 64, 'fps': 25.0, 'duration_sec': 1.6, 'stats': {},
+            'outputs': [{'path': path, 'width': width, 'height': 64, 'fps': 25.0}]}
+
+
+def test_requeued_job_registers_the_video_again(db, payload, monkeypatch):
+    monkeypatch.setattr(video_processor, 'process_draft',
+                        lambda original, paths, *args, **kwargs: fake_meta(paths['draft'], 48))
+
+    def crash(*args, **kwargs):
+        raise RuntimeError('worker interrompido')
+    monkeypatch.setattr(video_processor, 'process_video', crash)
+    job = {'id': 'job-1', 'video_id': VIDEO_ID, 'payload': payload}
+    with pytest.raises(RuntimeError):
+        jobs.run_job(job)
+    assert db.get_video(VIDEO_ID)['path_processed'] == payload['paths']['draft']
+
+    # Nova tentativa do mesmo job (requeue_stale_jobs): o rascunho já está registrado
+    monkeypatch.setattr(video_processor, 'process_video',
+                        lambda original, paths, *args, **kwargs: fake_meta(paths['processed'], 96))
+    jobs.run_job(job)
+    db.flush_writes()
+    video = db.get_video(VIDEO_ID)
+    assert video['path_processed'] == payload['paths']['processed'] and video['width'] == 96
+
+
+def test_repeated_job_keeps_one_rendition_per_output(db, payload, monkeypatch):
+    monkeypatch.setattr(video_processor, 'process_draft',
+                        lambda original, paths, *args, **kwargs: fake_meta(paths['draft'], 48))
+    monkeypatch.setattr(video_processor, 'process_video',
+                        lambda original, paths, *args, **kwargs: fake_meta(paths['processed'], 96))
+    job = {'id': 'job-1', 'video_id': VIDEO_ID, 'payload': payload}
+    jobs.run_job(job)
+    jobs.run_job(job)
+    db.flush_writes()
+    assert [(r['filter'], r['profile']) for r in db.get_renditions(VIDEO_ID)] == [('grayscale', 'fast-preview')]
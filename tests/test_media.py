@@ -0,0 +1,60 @@
+import flask
+import pytest
+
+from servidor import media
+
+app = flask.Flask(__name__)
+
+
+def ranges(header, size=1000):
+    with app.test_request_context(headers={'Range': header} if header else {}):
+        return media._parse_ranges(size)
+
+
+def test_without_range_header():
+    assert ranges(None) is None
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('bytes=0-99', [(0, 100)]),
+    ('bytes=900-', [(900, 1000)]),
+    ('bytes=-100', [(900, 1000)]),
+    ('bytes=950-2000', [(950, 1000)]),
+    # Fora de ordem e sobrepostos: ordenados e unidos
+    ('bytes=500-599,0-99,50-149', [(0, 150), (500, 600)]),
+    ('bytes=0-9,10-19', [(0, 20)]),
+])
+def test_ranges_are_clamped_sorted_and_merged(header, expected):
+    assert ranges(header) == expected
+
+
+def test_unsatisfiable_range_is_empty():
+    assert ranges('bytes=1000-1100') == []
+
+
+@pytest.mark.parametrize('header', ['items=0-9', 'bytes=abc', 'bytes=10-5', 'bytes=x-9'])
+def test_invalid_ranges_are_ignored(header):
+    assert ranges(header) is None
+
+
+BASE = 'videos/2024/01/02/123e4567-e89b-12d3-a456-426614174000'
+
+
+@pytest.mark.parametrize('rel_path', [
+    f'{BASE}/original/video.mp4',
+    f'{BASE}/processed/grayscale/video.webm',
+    f'{BASE}/processed/grayscale/hls/720p_001.ts',
+    f'{BASE}/thumbs/frame_0001.jpg',
+])
+def test_media_files_under_uuid_are_immutable(rel_path):
+    assert media.cache_control_for(rel_path) == media.IMMUTABLE_CACHE_CONTROL
+
+
+@pytest.mark.parametrize('rel_path', [
+    f'{BASE}/meta.json',
+    f'{BASE}/keyframes.json',
+    f'{BASE}/processed/grayscale/hls/master.m3u8',
+    'videos/outro/video.mp4',
+])
+def test_rewritable_files_are_revalidated(rel_path):
+    assert media.cache_control_for(rel_path) == media.DEFAULT_CACHE_CONTROL
@@ -0,0 +1,41 @@
+import os
+import sqlite3
+
+from servidor import database
+
+
+def rendition(size_bytes, **values):
+    return {'id': os.urandom(8).hex(), 'video_id': 'v1', 'filter': 'grayscale', 'profile': 'default',
+            'path': 'videos/v1/processed/grayscale/video.webm', 'size_bytes': size_bytes,
+            'created_at': '2024-01-01T00:00:00', **values}
+
+
+def test_repeated_rendition_updates_the_existing_row(db):
+    db.add_rendition(rendition(100))
+    db.add_rendition(rendition(200))
+    db.add_rendition(rendition(300, profile='h264'))
+
+    rows = db.get_renditions('v1')
+    assert [(row['profile'], row['size_bytes']) for row in rows] == [('default', 200), ('h264', 300)]
+
+
+def test_migration_removes_existing_duplicates(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'DATABASE_PATH', os.path.join(tmp_path, 'videos.db'))
+    # Banco criado antes da migração que torna as saídas únicas
+    monkeypatch.setattr(database, 'SCHEMA_VERSION', database.SCHEMA_VERSION - 1)
+    database.init_db()
+    conn = sqlite3.connect(database.DATABASE_PATH)
+    for n in range(3):
+        conn.execute(
+            "INSERT INTO renditions (id, video_id, filter, profile, path, size_bytes, created_at) "
+            "VALUES (?, 'v1', 'grayscale', 'default', 'p', ?, '2024-01-01T00:00:00')", (f'r{n}', n)
+        )
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(database, 'SCHEMA_VERSION', len(database.MIGRATIONS))
+    database.init_db()
+    try:
+        assert [row['id'] for row in database.get_renditions('v1')] == ['r2']
+    finally:
+        database.close_db_connection()
@@ -0,0 +1,93 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from servidor import sampling
+from conftest import decode_all
+
+
+@pytest.fixture(autouse=True)
+def empty_index_cache():
+    sampling._index_cache.clear()
+    yield
+    sampling._index_cache.clear()
+
+
+def test_evenly_spaced_covers_the_video():
+    assert sampling.evenly_spaced(100, 4) == [0, 25, 50, 75]
+    assert sampling.evenly_spaced(3, 10) == [0, 1, 2]
+    assert sampling.evenly_spaced(0, 2) == [0]
+
+
+def test_snap_to_keyframes_respects_tolerance():
+    keyframes = [0, 100, 200]
+    assert sampling.snap_to_keyframes([95, 150, 210], keyframes, 10) == [100, 150, 200]
+    assert sampling.snap_to_keyframes([95, 5], [], 10) == [5, 95]
+
+
+def test_sample_frames_seeks_without_keyframe_index(small_video, monkeypatch):
+    monkeypatch.setattr(sampling, 'SEEK_COST_FRAMES', 5)
+    expected = decode_all(small_video)
+    stats = {}
+    frames = sampling.sample_frames(small_video, [2, 30, 34], stats=stats)
+
+    assert [index for index, _ in frames] == [2, 30, 34]
+    assert all(np.array_equal(frame, expected[index]) for index, frame in frames)
+    # 2 é alcançado em sequência; 30 com um seek; 34 está perto o bastante de 31
+    assert stats['seeks'] == 1
+    assert stats['decoded'] == 3 + 1 + 4
+
+
+def test_sample_frames_decodes_nearby_targets_sequentially(small_video, monkeypatch):
+    monkeypatch.setattr(sampling, 'SEEK_COST_FRAMES', 48)
+    stats = {}
+    frames = sampling.sample_frames(small_video, [10, 20], stats=stats)
+    assert [index for index, _ in frames] == [10, 20]
+    assert stats == {'decoded': 21, 'seeks': 0}
+
+
+def test_sample_frames_seeks_to_keyframes(small_video, monkeypatch):
+    monkeypatch.setattr(sampling, 'SEEK_COST_FRAMES', 2)
+    expected = decode_all(small_video)
+    stats = {}
+    frames = sampling.sample_frames(small_video, [25], keyframes=[0, 10, 20, 30], stats=stats)
+    assert len(frames) == 1 and np.array_equal(frames[0][1], expected[25])
+    assert stats == {'decoded': 6, 'seeks': 1}
+
+
+def test_index_without_tools_is_saved_and_not_probed_again(small_video, tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(sampling, 'probe_keyframes', lambda path, fps: calls.append(path))
+    monkeypatch.setattr(sampling, '_probe_tools_available', lambda: False)
+    index_path = os.path.join(tmp_path, sampling.KEYFRAME_INDEX_NAME)
+
+    index = sampling.load_index(small_video, index_path)
+    assert index['keyframes'] == [] and index['probed'] is False
+    with open(index_path, encoding='utf-8') as f:
+        assert json.load(f)['probed'] is False
+
+    sampling._index_cache.clear()
+    assert sampling.load_index(small_video, index_path) == index
+    assert len(calls) == 1
+
+
+def test_index_is_probed_again_once_tools_are_installed(small_video, tmp_path, monkeypatch):
+    monkeypatch.setattr(sampling, 'probe_keyframes', lambda path, fps: None)
+    index_path = os.path.join(tmp_path, sampling.KEYFRAME_INDEX_NAME)
+    sampling.load_index(small_video, index_path)
+
+    sampling._index_cache.clear()
+    monkeypatch.setattr(sampling, 'probe_keyframes', lambda path, fps: [0, 20])
+    monkeypatch.setattr(sampling, '_probe_tools_available', lambda: True)
+    index = sampling.load_index(small_video, index_path)
+    assert index['keyframes'] == [0, 20] and index['probed'] is True
+
+
+def test_frame_at_without_keyframes_returns_the_exact_frame(small_video, tmp_path, monkeypatch):
+    monkeypatch.setattr(sampling, 'probe_keyframes', lambda path, fps: None)
+    monkeypatch.setattr(sampling, 'SEEK_COST_FRAMES', 5)
+    expected = decode_all(small_video)
+    frame = sampling.frame_at(small_video, seconds=1.2, index_path=os.path.join(tmp_path, 'keyframes.json'))
+    assert np.array_equal(frame, expected[30])
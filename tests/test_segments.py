@@ -0,0 +1,119 @@
+import cv2
+import numpy as np
+import pytest
+
+from servidor import segments, video_processor
+from conftest import decode_all
+
+
+class KeyframeCapture:
+    """
+    Captura falsa que imita o backend FFmpeg do OpenCV em contêineres com seek
+    impreciso: set() para no keyframe anterior ao frame pedido, mas
+    CAP_PROP_POS_FRAMES continua informando o valor pedido. Os "frames" são os índices.
+    """
+
+    def __init__(self, frame_count, keyframes, fps=25.0, origin_ms=0.0):
+        self.frame_count = frame_count
+        self.keyframes = keyframes
+        self.fps = fps
+        self.origin_ms = origin_ms
+        self.next = 0
+        self.current = None
+        self.requested = None
+
+    def grab(self):
+        if self.next >= self.frame_count:
+            return False
+        self.current = self.next
+        self.next += 1
+        return True
+
+    def read(self):
+        ok = self.grab()
+        return ok, self.current if ok else None
+
+    def set(self, prop, value):
+        assert prop == cv2.CAP_PROP_POS_FRAMES
+        self.requested = int(value)
+        self.next = max(k for k in self.keyframes if k <= value)
+        return True
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.requested if self.requested is not None else self.next)
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return self.origin_ms + self.current * 1000 / self.fps
+        raise AssertionError(prop)
+
+
+@pytest.mark.parametrize('start', [1, 2, 30, 31, 45, 89, 119])
+def test_seek_reaches_start_frame_despite_echoed_position(start):
+    cap = KeyframeCapture(120, [0, 30, 60, 90])
+    assert video_processor._seek(cap, start, 25.0)
+    assert cap.read() == (True, start)
+
+
+def test_seek_handles_containers_not_starting_at_zero():
+    cap = KeyframeCapture(120, [0, 30, 60, 90], origin_ms=80.0)
+    assert video_processor._seek(cap, 70, 25.0)
+    assert cap.read() == (True, 70)
+
+
+def test_seek_without_fps_decodes_sequentially():
+    cap = KeyframeCapture(120, [0, 30, 60, 90])
+    assert video_processor._seek(cap, 45, 0)
+    assert cap.read() == (True, 45)
+
+
+def test_seek_past_the_end_fails():
+    cap = KeyframeCapture(10, [0])
+    assert not video_processor._seek(cap, 20, 25.0)
+
+
+class CollectSink(video_processor.FrameSink):
+    def open(self, info):
+        self.frames = []
+        return True
+
+    def consume(self, index, frame):
+        self.frames.append((index, frame.copy()))
+
+    def close(self):
+        return self.frames
+
+
+def test_segments_cover_every_frame_exactly_once(small_video):
+    expected = decode_all(small_video)
+    collected = []
+    for start, end in [(0, 13), (13, 27), (27, None)]:
+        result = video_processor.run_pipeline(small_video, [CollectSink()], start_frame=start, end_frame=end)
+        collected.extend(result['results'][0])
+
+    assert [index for index, _ in collected] == list(range(len(expected)))
+    assert all(np.array_equal(frame, expected[index]) for index, frame in collected)
+
+
+def test_plan_segments_is_contiguous_and_respects_minimum(monkeypatch):
+    monkeypatch.setattr(segments, 'MIN_SEGMENT_FRAMES', 100)
+    plan = segments.plan_segments(1000, 4)
+    assert plan[0][0] == 0 and plan[-1][1] == 1000
+    assert all(a[1] == b[0] for a, b in zip(plan, plan[1:]))
+    assert len(plan) == 4
+    # Vídeo curto: no máximo frame_count // MIN_SEGMENT_FRAMES segmentos
+    assert segments.plan_segments(250, 8) == [(0, 125), (125, 250)]
+    assert segments.plan_segments(50, 4) == [(0, 50)]
+
+
+def test_plan_segments_snaps_bounds_to_nearby_keyframes(monkeypatch):
+    monkeypatch.setattr(segments, 'MIN_SEGMENT_FRAMES', 100)
+    keyframes = [0, 240, 510, 900]
+    # Alvos 250, 500 e 750: os dois primeiros têm keyframe próximo; 750 fica a mais de KEYFRAME_SNAP_FRAMES
+    assert segments.plan_segments(1000, 4, keyframes) == [(0, 240), (240, 510), (510, 750), (750, 1000)]
+
+
+def test_warns_when_segments_requested_without_ffmpeg(monkeypatch, capsys):
+    monkeypatch.setattr(segments, 'SEGMENT_COUNT', 4)
+    monkeypatch.setattr(segments, 'ffmpeg_available', lambda: False)
+    assert not segments.warn_if_unavailable()
+    assert 'VIDEO_SEGMENTS=4' in capsys.readouterr().out
@@ -0,0 +1,146 @@
+import os
+import sys
+
+import pytest
+
+from servidor import storage_backends
+
+VIDEO = 'videos/2024/01/02/123e4567-e89b-12d3-a456-426614174000'
+
+
+def test_files_of_a_video_share_a_shard(tmp_path):
+    backend = storage_backends.ShardedBackend([str(tmp_path / name) for name in 'abcd'])
+    shard = backend.ranking(f'{VIDEO}/original/video.mp4')[0]
+    assert backend.ranking(f'{VIDEO}/processed/video.webm')[0] == shard
+    assert backend.path(f'{VIDEO}/meta.json').startswith(shard)
+
+
+def test_adding_a_shard_moves_only_part_of_the_videos(tmp_path):
+    roots = [str(tmp_path / name) for name in 'abcd']
+    before = storage_backends.ShardedBackend(roots)
+    after = storage_backends.ShardedBackend(roots + [str(tmp_path / 'e')])
+    keys = [f'videos/2024/01/02/{n:08x}-0000-0000-0000-000000000000/meta.json' for n in range(500)]
+    moved = [key for key in keys if before.ranking(key)[0] != after.ranking(key)[0]]
+    # Só os vídeos que passam para o novo ponto mudam de lugar (~1/5)
+    assert all(after.ranking(key)[0] == str(tmp_path / 'e') for key in moved)
+    assert 50 < len(moved) < 150
+
+
+def test_existing_files_are_found_on_their_old_shard(tmp_path):
+    roots = [str(tmp_path / name) for name in 'ab']
+    backend = storage_backends.ShardedBackend(roots)
+    key = f'{VIDEO}/meta.json'
+    old = os.path.join(backend.ranking(key)[1], *key.split('/'))
+    os.makedirs(os.path.dirname(old))
+    open(old, 'w').close()
+
+    assert backend.path(key) == old
+    # Arquivo novo do mesmo vídeo vai para a pasta que já existe
+    assert os.path.dirname(backend.path(f'{VIDEO}/thumb.jpg')) == os.path.dirname(old)
+
+
+class FakeS3:
+    """Substituto em memória do cliente S3 do boto3, com as operações usadas pelo backend."""
+
+    class exceptions:
+        class ClientError(Exception):
+            def __init__(self, code):
+                super().__init__(code)
+                self.response = {'Error': {'Code': code}}
+
+    def __init__(self):
+        self.objects = {}
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise self.exceptions.ClientError('404')
+        data, content_type = self.objects[Bucket, Key]
+        return {'ContentLength': len(data), 'ContentType': content_type}
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, Config=None):
+        with open(Filename, 'rb') as f:
+            self.objects[Bucket, Key] = (f.read(), (ExtraArgs or {}).get('ContentType'))
+
+    def download_file(self, Bucket, Key, Filename, Config=None):
+        with open(Filename, 'wb') as f:
+            f.write(self.objects[Bucket, Key][0])
+
+    def copy(self, CopySource, Bucket, Key, Config=None):
+        self.objects[Bucket, Key] = self.objects[CopySource['Bucket'], CopySource['Key']]
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Bucket, Prefix):
+        yield {'Contents': [{'Key': key} for bucket, key in sorted(self.objects)
+                            if bucket == Bucket and key.startswith(Prefix)]}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def delete_objects(self, Bucket, Delete):
+        for item in Delete['Objects']:
+            self.objects.pop((Bucket, item['Key']), None)
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        return f"https://s3.test/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+
+@pytest.fixture
+def s3(tmp_path):
+    client = FakeS3()
+    return client, storage_backends.S3Backend(str(tmp_path / 'cache'), 'videos', prefix='prod', client=client)
+
+
+def test_s3_publish_uploads_with_prefix_and_content_type(s3):
+    client, backend = s3
+    key = f'{VIDEO}/original/video.mp4'
+    with open(backend.local_path(key), 'wb') as f:
+        f.write(b'conteudo')
+    backend.publish(key)
+
+    assert client.objects['videos', f'prod/{key}'] == (b'conteudo', 'video/mp4')
+    assert backend.url(key).startswith(f'https://s3.test/videos/prod/{key}')
+
+
+def test_s3_fetch_downloads_into_an_empty_cache(s3, tmp_path):
+    client, backend = s3
+    key = f'{VIDEO}/meta.json'
+    with open(backend.local_path(key), 'wb') as f:
+        f.write(b'{}')
+    backend.publish(key)
+
+    # Outro servidor, com o cache local vazio
+    other = storage_backends.S3Backend(str(tmp_path / 'outro'), 'videos', prefix='prod', client=client)
+    assert other.exists(key)
+    path = other.fetch(key)
+    with open(path, 'rb') as f:
+        assert f.read() == b'{}'
+    assert not other.exists(f'{VIDEO}/ausente.json')
+    assert other.fetch(f'{VIDEO}/ausente.json') is None
+
+
+def test_s3_copy_and_remove_tree(s3):
+    client, backend = s3
+    src = f'{VIDEO}/original/video.mp4'
+    with open(backend.local_path(src), 'wb') as f:
+        f.write(b'x')
+    backend.publish(src)
+    backend.copy_tree(f'{VIDEO}/original', f'{VIDEO}/copia')
+    assert backend.exists(f'{VIDEO}/copia/video.mp4')
+
+    backend.remove_tree(VIDEO)
+    assert client.objects == {}
+    assert not backend.exists(src)
+
+
+def test_s3_without_boto3_is_a_configuration_error(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, 'boto3', None)
+    monkeypatch.setattr(storage_backends, 'S3_BUCKET', 'videos')
+    with pytest.raises(storage_backends.StorageConfigError, match='requirements-s3.txt'):
+        storage_backends.create_backend(str(tmp_path), 's3')
+
+
+def test_s3_requires_a_bucket(tmp_path):
+    with pytest.raises(storage_backends.StorageConfigError, match='VIDEO_S3_BUCKET'):
+        storage_backends.S3Backend(str(tmp_path), '', client=FakeS3())
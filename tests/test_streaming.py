@@ -0,0 +1,52 @@
+import os
+import shutil
+
+import pytest
+
+from benchmarks import synth
+from servidor import streaming, video_processor
+
+
+def test_parse_ladder_sorts_and_deduplicates():
+    assert streaming.parse_ladder('480:1400, 1080:5000,720:2800,480:1400') == [
+        (1080, 5000), (720, 2800), (480, 1400)
+    ]
+
+
+@pytest.mark.parametrize('spec', ['', '720', '720:abc', '8:100', '720:0'])
+def test_parse_ladder_rejects_invalid_specs(spec):
+    with pytest.raises(ValueError):
+        streaming.parse_ladder(spec)
+
+
+def test_select_rungs_never_upscales():
+    ladder = [(1080, 5000), (720, 2800), (480, 1400)]
+    assert streaming.select_rungs(720, ladder) == [(720, 2800), (480, 1400)]
+    # Fonte menor que todas: uma rendition na altura original (par) com o menor bitrate
+    assert streaming.select_rungs(361, ladder) == [(360, 1400)]
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='ffmpeg não encontrado')
+def test_ladder_is_built_from_the_original_resolution(tmp_path, monkeypatch):
+    source = os.path.join(tmp_path, 'full_hd.avi')
+    if not synth.synthesize(source, 1920, 1080, 0.4, 25, 'MJPG'):
+        pytest.skip('codec MJPG indisponível no OpenCV')
+    monkeypatch.setattr(streaming, 'STREAM_FORMATS', ['hls', 'dash'])
+    monkeypatch.setattr(streaming, 'STREAM_LADDER', [(1080, 800), (360, 200)])
+    monkeypatch.setattr(streaming, 'STREAM_SEGMENT_SEC', 1)
+    monkeypatch.setattr(streaming, 'STREAM_PRESET', 'ultrafast')
+    processed_dir = os.path.join(tmp_path, 'processed', 'grayscale')
+    os.makedirs(processed_dir)
+    paths = {'processed': os.path.join(processed_dir, 'video.webm')}
+
+    meta = video_processor.process_video(source, paths, 'grayscale', streams_dir=processed_dir)
+    if meta is None:
+        pytest.skip('codec do perfil padrão indisponível no OpenCV')
+
+    # O vídeo processado é limitado pela largura máxima do perfil; a escada não
+    assert meta['outputs'][0]['width'] < 1920
+    assert meta['streams'] == streaming.MANIFESTS
+    with open(os.path.join(processed_dir, 'hls', 'master.m3u8'), encoding='utf-8') as f:
+        master = f.read()
+    assert 'RESOLUTION=1920x1080' in master and 'RESOLUTION=640x360' in master
+    assert os.path.exists(os.path.join(processed_dir, 'hls', '1080p', 'index.m3u8'))
@@ -0,0 +1,36 @@
+import io
+import os
+
+import pytest
+from werkzeug.exceptions import ClientDisconnected, RequestEntityTooLarge
+
+from servidor import storage
+from servidor.app import create_app
+
+
+@pytest.fixture
+def client(db, media_root):
+    return create_app('all').test_client()
+
+
+def stored_files(root):
+    return [name for _, _, names in os.walk(os.path.join(root, 'videos')) for name in names]
+
+
+@pytest.mark.parametrize('error, status', [
+    (RequestEntityTooLarge(), 413),
+    (ClientDisconnected(), 400),
+    (OSError('conexão perdida'), 500),
+])
+def test_failed_upload_leaves_nothing_behind(client, media_root, monkeypatch, error, status):
+    def interrupted(stream, boundary, file_field, target_for):
+        # Parte do arquivo já foi gravada no destino definitivo quando a falha acontece
+        with open(target_for('video.mp4'), 'wb') as f:
+            f.write(b'\x00\x00\x00\x18ftypmp42' + b'\x00' * 1024)
+        raise error
+    monkeypatch.setattr(storage, 'receive_multipart', interrupted)
+
+    response = client.post('/upload', data={'video': (io.BytesIO(b'x' * 64), 'video.mp4'), 'filter': 'grayscale'},
+                           content_type='multipart/form-data')
+    assert response.status_code == status
+    assert stored_files(media_root) == []